@@ -6,37 +6,120 @@ import uvicorn
 from typing import Optional, List
 import os
 from dotenv import load_dotenv
-from backend.ml.model_loader import load_model, predict_spam
+from backend.ml.runtime import ModelRuntime
 from backend.services.email_processor import process_email
+from backend.services.mime_ingest import parse_message_stream
+from backend.services.smtp_server import SMTP_ENABLED, ClassifyingSMTPServer
+from backend.services.quarantine import recipient_addresses
 from backend.services.sendmail_integration import EmailHandler
-from datetime import datetime, timedelta
+from backend.services.delivery import DELIVERY_MODE, DeliveryService
+from backend.services.user_cache import AuthUser, UserCache
+from backend.services.mailbox import MAILBOX_DEFAULT_LIMIT, mailbox_page
+from backend.services.email_writer import EmailWriter
+from backend.services.mailbox_stats import get_mailbox_stats
+from backend.services.password_hasher import PasswordHasher, PasswordHasherBusy
+from backend.services.state_backend import LimiterStorage, StateLimiter, get_state_backend
+from backend.services.profiler import RequestProfiler
+from backend.services.metrics import (
+    METRICS_PUBLIC, METRICS_TOKEN, REQUEST_SECONDS, REQUESTS, process_memory, registry as metrics_registry,
+    server_timing, start_request_timings, timed, worker_id
+)
+from datetime import date, datetime, timedelta
 import jwt
-from passlib.context import CryptContext
 import secrets
-from sqlalchemy.orm import Session
-from backend.database.database import SessionLocal, engine, get_db # Import necessary database components
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from backend.database.database import AsyncSessionLocal, async_engine, get_async_db, get_pool_stats # Import necessary database components
 from backend.models.models import User, Email # Import the User and Email models
-from slowapi import Limiter
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
-from fastapi.responses import JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, Response
 from fastapi.middleware.httpsredirect import HTTPSRedirectMiddleware
 from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.requests import Request
 import logging
 from fastapi import Request as FastAPIRequest
 import requests
-from collections import defaultdict
-from time import time
+from time import perf_counter
+from contextlib import asynccontextmanager
+import asyncio
+import contextvars
+from functools import partial
 
 # Load environment variables
 load_dotenv()
 print(f"API_KEY loaded from environment: {os.getenv('API_KEY')}")
 
+# Initialize components (the model itself is loaded by the lifespan task)
+runtime = ModelRuntime()
+# Invalidated across workers through the shared state backend
+user_cache = UserCache(state=get_state_backend())
+# Persists sent emails per EMAIL_WRITE_MODE (sync, group or write-behind)
+email_writer = EmailWriter(AsyncSessionLocal)
+sendmail_handler: Optional[EmailHandler] = None
+startup_logger = logging.getLogger("startup")
+
+async def run_blocking(func, *args):
+    # Email handler work (quarantine files, delivery queue SQLite, sendmail)
+    # runs in the default executor instead of on the event loop; the copied
+    # context keeps its stages in the request's Server-Timing
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(None, context.run, func, *args)
+
+async def quarantine_maintenance(quarantine):
+    # Retention and compaction of the quarantine segments, off the event loop
+    while True:
+        await asyncio.sleep(QUARANTINE_MAINTENANCE_SECONDS)
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, quarantine.maintain)
+        except Exception as e:
+            startup_logger.error(f"Quarantine maintenance failed: {str(e)}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global sendmail_handler
+    started = perf_counter()
+    # Legitimate mail goes through the durable queue and SMTP worker pool
+    # unless DELIVERY_MODE=sendmail
+    delivery = None
+    if DELIVERY_MODE == "queue":
+        delivery = DeliveryService()
+        await delivery.start()
+    sendmail_handler = EmailHandler(delivery)
+    await email_writer.start()
+    runtime.timings["email_handler"] = round(perf_counter() - started, 3)
+    maintenance_task = asyncio.create_task(quarantine_maintenance(sendmail_handler.quarantine))
+    # Per-worker snapshots for /metrics when METRICS_DIR is set
+    metrics_task = asyncio.create_task(metrics_registry.run_snapshots())
+    # Serve non-ML routes immediately; /api/v1/ready turns green once warm
+    startup_task = asyncio.create_task(runtime.start())
+    startup_logger.info("API accepting requests, model loading in background")
+    # Optional SMTP/LMTP listener sharing the model and EmailHandler
+    smtp_server = None
+    if SMTP_ENABLED:
+        smtp_server = ClassifyingSMTPServer(runtime, sendmail_handler)
+        await smtp_server.start()
+    yield
+    if smtp_server is not None:
+        await smtp_server.close()
+    maintenance_task.cancel()
+    metrics_task.cancel()
+    sendmail_handler.close()
+    if not startup_task.done():
+        startup_task.cancel()
+    await runtime.close()
+    if delivery is not None:
+        await delivery.close()
+    # Drain buffered emails before the pool goes away
+    await email_writer.close()
+    await async_engine.dispose()
+    password_hasher.shutdown()
+
 app = FastAPI(
     title="Smart Anti-Spam System",
     description="AI-powered spam detection system integrated with Sendmail",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Add CORS middleware
@@ -52,7 +135,8 @@ app.add_middleware(
 # Security
 API_KEY_NAME = "X-API-Key"
 api_key_header = APIKeyHeader(name=API_KEY_NAME)
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# bcrypt runs on its own bounded thread pool, off the event loop
+password_hasher = PasswordHasher()
 
 # Models
 class EmailRequest(BaseModel):
@@ -67,6 +151,28 @@ class EmailResponse(BaseModel):
     confidence: float
     message: str
 
+class RawEmailResponse(EmailResponse):
+    sender: str
+    recipient: str
+    subject: str
+    bytes_read: int
+    truncated: bool
+    skipped_parts: int
+    error: Optional[str] = None
+
+class BulkEmailRequest(BaseModel):
+    emails: List[EmailRequest]
+
+class BulkEmailResult(BaseModel):
+    index: int
+    is_spam: Optional[bool] = None
+    confidence: Optional[float] = None
+    message: str
+    error: Optional[str] = None
+
+class BulkEmailResponse(BaseModel):
+    results: List[BulkEmailResult]
+
 class UserCreate(BaseModel):
     email: str
     password: str
@@ -99,6 +205,20 @@ class EmailRead(BaseModel):
     class Config:
         orm_mode = True
 
+class DailyMailboxStats(BaseModel):
+    day: date
+    sent: int
+    received: int
+    spam_received: int
+    spam_rate: float
+
+class MailboxStats(BaseModel):
+    sent: int
+    received: int
+    spam_received: int
+    spam_rate: float
+    daily: List[DailyMailboxStats]
+
 class UserUpdateEmail(BaseModel):
     email: str
 
@@ -106,9 +226,37 @@ class UserUpdatePassword(BaseModel):
     new_password: str
     confirm_password: str
 
-# Initialize components
-model = load_model()
-sendmail_handler = EmailHandler()
+class QuarantineEntry(BaseModel):
+    id: str
+    sender: str
+    recipient: str
+    subject: str
+    created_at: datetime
+    released_at: Optional[datetime] = None
+    message: Optional[str] = None
+
+BULK_MAX_EMAILS = int(os.getenv("BULK_MAX_EMAILS", "1000"))
+
+# Users who may list, read and release any quarantined message
+QUARANTINE_ADMIN_EMAILS = {
+    e.strip().lower() for e in os.getenv("QUARANTINE_ADMIN_EMAILS", "").split(",") if e.strip()
+}
+QUARANTINE_MAINTENANCE_SECONDS = float(os.getenv("QUARANTINE_MAINTENANCE_SECONDS", "3600"))
+
+# Users who may list and download request profiles
+PROFILE_ADMIN_EMAILS = {
+    e.strip().lower() for e in os.getenv("PROFILE_ADMIN_EMAILS", "").split(",") if e.strip()
+}
+# Routes whose requests may be profiled (PROFILE_SAMPLE_RATE / PROFILE_TOKEN)
+PROFILED_PATHS = {"/api/v1/check-email", "/api/v1/send-email"}
+request_profiler = RequestProfiler()
+
+async def require_model():
+    if not runtime.ready:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Spam classifier not ready ({runtime.phase})"
+        )
 
 # Mock user database (replace with real database in production)
 # users_db = {}
@@ -123,27 +271,39 @@ def create_access_token(data: dict):
     encoded_jwt = jwt.encode(to_encode, os.getenv("JWT_SECRET", "your-secret-key"), algorithm="HS256")
     return encoded_jwt
 
-async def verify_api_key(api_key: str = Security(api_key_header), db: Session = Depends(get_db)):
-    # Check if the provided API key exists in any user's record
-    user = db.query(User).filter(User.api_key == api_key).first()
-    if user:
-        return api_key
-            
+async def authenticated_user(api_key: str = Security(api_key_header), db: AsyncSession = Depends(get_async_db)) -> AuthUser:
+    # Resolved once per request (FastAPI caches dependencies), from the
+    # user cache when no user has changed since it was filled
+    epoch = await state_backend.run(user_cache.epoch)
+    user = user_cache.get(api_key, epoch)
+    if user is not None:
+        return user
+    with timed("db"):
+        db_user = (await db.execute(select(User).where(User.api_key == api_key))).scalars().first()
+    if db_user:
+        user = AuthUser.from_model(db_user)
+        user_cache.put(user, epoch)
+        return user
+
     raise HTTPException(
         status_code=403,
         detail="Invalid API key"
     )
 
+async def verify_api_key(user: AuthUser = Depends(authenticated_user)):
+    return user.api_key
+
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Initialize rate limiter
-limiter = Limiter(key_func=get_remote_address)
+# Initialize rate limiter; counters live in the shared state backend
+# (STATE_BACKEND) so limits hold across workers
+limiter = StateLimiter(key_func=get_remote_address, storage_uri=f"{LimiterStorage.STORAGE_SCHEME[0]}://")
 app.state.limiter = limiter
 
 # --- Account Lockout State ---
-FAILED_ATTEMPTS = defaultdict(lambda: {'count': 0, 'lockout_until': 0})
+state_backend = get_state_backend()
 LOCKOUT_THRESHOLD = 5
 LOCKOUT_TIME = 15 * 60  # 15 minutes
 
@@ -154,6 +314,14 @@ async def rate_limit_handler(request: Request, exc: RateLimitExceeded):
         content={"detail": "Too many requests, please try again later."}
     )
 
+@app.exception_handler(PasswordHasherBusy)
+async def password_hasher_busy_handler(request: Request, exc: PasswordHasherBusy):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Too many authentication requests, please try again shortly."},
+        headers={"Retry-After": "1"}
+    )
+
 # Security headers middleware
 class SecurityHeadersMiddleware(BaseHTTPMiddleware):
     async def dispatch(self, request, call_next):
@@ -166,19 +334,67 @@ class SecurityHeadersMiddleware(BaseHTTPMiddleware):
         return response
 
 app.add_middleware(SecurityHeadersMiddleware)
+
+# Request latency metrics and a Server-Timing header with the stages the
+# request went through
+class ServerTimingMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request, call_next):
+        started = perf_counter()
+        timings = start_request_timings()
+        response = await call_next(request)
+        elapsed = perf_counter() - started
+        route = request.scope.get("route")
+        # Route templates, not raw paths, keep label cardinality bounded
+        path = route.path if route is not None else "unmatched"
+        REQUEST_SECONDS.observe(elapsed, request.method, path)
+        REQUESTS.inc(request.method, path, str(response.status_code))
+        response.headers["Server-Timing"] = server_timing(timings, elapsed)
+        return response
+
+app.add_middleware(ServerTimingMiddleware)
+
+class ProfilingMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request, call_next):
+        reason = request_profiler.reason(request.headers) if request.url.path in PROFILED_PATHS else None
+        profile = request_profiler.begin(request.url.path, reason) if reason else None
+        if profile is None:
+            return await call_next(request)
+        status_code = None
+        try:
+            response = await call_next(request)
+            status_code = response.status_code
+        finally:
+            await asyncio.get_running_loop().run_in_executor(None, request_profiler.finish, profile, status_code)
+        response.headers["X-Profile-Id"] = profile.id
+        return response
+
+# Only installed when profiling is configured, so it costs nothing otherwise
+if request_profiler.enabled:
+    app.add_middleware(ProfilingMiddleware)
+
+# Queue depths, cache hit rates and pool usage, read when /metrics is scraped
+metrics_registry.register_stats("process", process_memory, "Worker process memory")
+metrics_registry.register_stats("inference", lambda: runtime.engine.stats() if runtime.engine else {}, "Inference batching queue")
+metrics_registry.register_stats("prediction_cache", lambda: runtime.cache.stats() if runtime.cache else {}, "Prediction cache")
+metrics_registry.register_stats("user_cache", lambda: user_cache.stats(), "API key cache")
+metrics_registry.register_stats("db_pool", get_pool_stats, "Database connection pool")
+metrics_registry.register_stats("email_writer", lambda: email_writer.stats(), "Email persistence")
+metrics_registry.register_stats("password_hasher", lambda: password_hasher.stats(), "bcrypt thread pool")
+metrics_registry.register_stats("audit", lambda: sendmail_handler.audit.stats() if sendmail_handler else {}, "Audit log writer")
+metrics_registry.register_stats("delivery", lambda: sendmail_handler.delivery.stats() if sendmail_handler and sendmail_handler.delivery else {}, "Outgoing delivery queue")
 # Optionally enforce HTTPS in production
 # app.add_middleware(HTTPSRedirectMiddleware)
 
 @app.post("/api/v1/signup", response_model=Token)
 @limiter.limit("5/minute")
-async def signup(request: Request, user: UserCreate, db: Session = Depends(get_db)):
-    db_user = db.query(User).filter(User.email == user.email).first()
+async def signup(request: Request, user: UserCreate, db: AsyncSession = Depends(get_async_db)):
+    db_user = (await db.execute(select(User).where(User.email == user.email))).scalars().first()
     if db_user:
         raise HTTPException(
             status_code=400,
             detail="Email already registered"
         )
-    hashed_password = pwd_context.hash(user.password)
+    hashed_password = await password_hasher.hash(user.password)
     api_key = generate_api_key()
     new_user = User(
         email=user.email,
@@ -186,47 +402,45 @@ async def signup(request: Request, user: UserCreate, db: Session = Depends(get_d
         api_key=api_key
     )
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
     access_token = create_access_token(data={"sub": new_user.email})
     return {"access_token": access_token, "token_type": "bearer", "api_key": new_user.api_key}
 
 @app.post("/api/v1/login", response_model=Token)
 @limiter.limit("10/minute")
-async def login(user: UserLogin, request: FastAPIRequest, db: Session = Depends(get_db)):
+async def login(user: UserLogin, request: FastAPIRequest, db: AsyncSession = Depends(get_async_db)):
     ip = get_remote_address(request)
-    state = FAILED_ATTEMPTS[ip]
-    now = time()
     # Check lockout
-    if state['lockout_until'] > now:
+    if await state_backend.run(state_backend.get, f"login:lock:{ip}"):
         logger.warning(f"Locked out login attempt from {ip} for user: {user.email}")
         raise HTTPException(status_code=403, detail=f"Account locked. Try again later.")
-    db_user = db.query(User).filter(User.email == user.email).first()
-    if not db_user or not pwd_context.verify(user.password, db_user.hashed_password):
+    db_user = (await db.execute(select(User).where(User.email == user.email))).scalars().first()
+    if not db_user or not await password_hasher.verify(user.password, db_user.hashed_password):
         logger.warning(f"Failed login attempt for user: {user.email} from {ip}")
-        state['count'] += 1
         # If failed attempts >= LOCKOUT_THRESHOLD, lock out
-        if state['count'] >= LOCKOUT_THRESHOLD:
-            state['lockout_until'] = now + LOCKOUT_TIME
-            state['count'] = 0
+        if await state_backend.run(state_backend.incr, f"login:fail:{ip}", LOCKOUT_TIME) >= LOCKOUT_THRESHOLD:
+            await state_backend.run(state_backend.set, f"login:lock:{ip}", 1, LOCKOUT_TIME)
+            await state_backend.run(state_backend.delete, f"login:fail:{ip}")
         raise HTTPException(status_code=401, detail="Incorrect email or password")
     # Success: reset state
-    state['count'] = 0
-    state['lockout_until'] = 0
+    await state_backend.run(state_backend.delete, f"login:fail:{ip}")
+    await state_backend.run(state_backend.delete, f"login:lock:{ip}")
     access_token = create_access_token(data={"sub": db_user.email})
     return {"access_token": access_token, "token_type": "bearer", "api_key": db_user.api_key}
 
-@app.post("/api/v1/check-email", response_model=EmailResponse)
+@app.post("/api/v1/check-email", response_model=EmailResponse, dependencies=[Depends(require_model)])
 async def check_email(
     email: EmailRequest,
     api_key: str = Depends(verify_api_key)
 ):
     try:
         # Process email content
-        processed_content = process_email(email.content)
+        with timed("preprocess"):
+            processed_content = process_email(email.content)
         
-        # Predict if spam
-        is_spam, confidence = predict_spam(model, processed_content)
+        # Predict if spam (waiting for the batch, tokenize and infer)
+        with timed("classify"):
+            is_spam, confidence = await runtime.classify(processed_content)
         
         # Convert Pydantic model to dictionary
         email_dict = email.dict()
@@ -234,10 +448,10 @@ async def check_email(
         # Handle email based on prediction
         try:
             if is_spam:
-                sendmail_handler.handle_spam(email_dict)
+                await run_blocking(sendmail_handler.handle_spam, email_dict)
                 message = "Email classified as spam and rejected"
             else:
-                sendmail_handler.handle_legitimate(email_dict)
+                await run_blocking(sendmail_handler.handle_legitimate, email_dict)
                 message = "Email classified as legitimate and accepted"
         except Exception as e:
             # If Sendmail integration fails, just log it but continue
@@ -256,15 +470,128 @@ async def check_email(
             detail=f"Error processing email: {str(e)}"
         )
 
-@app.post("/api/v1/send-email", response_model=EmailRead)
+@app.post("/api/v1/check-raw-email", response_model=RawEmailResponse, dependencies=[Depends(require_model)])
+async def check_raw_email(
+    request: Request,
+    api_key: str = Depends(verify_api_key)
+):
+    # Parse the RFC 822 body as it streams in; attachments are skipped and
+    # reading stops once enough text has been collected
+    parsed = await parse_message_stream(request.stream())
+    email_dict = parsed.to_email_data()
+    
+    try:
+        with timed("preprocess"):
+            processed_content = process_email(email_dict["content"])
+        with timed("classify"):
+            is_spam, confidence = await runtime.classify(processed_content)
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error processing email: {str(e)}"
+        )
+    
+    error = None
+    try:
+        if is_spam:
+            await run_blocking(sendmail_handler.handle_spam, email_dict)
+            message = "Email classified as spam and rejected"
+        else:
+            await run_blocking(sendmail_handler.handle_legitimate, email_dict)
+            message = "Email classified as legitimate and accepted"
+    except Exception as e:
+        logger.error(f"Handling raw email failed: {str(e)}")
+        action = "quarantined" if is_spam else "delivered"
+        message = f"Email classified as {'spam' if is_spam else 'legitimate'} but could not be {action}"
+        error = str(e)
+    
+    return RawEmailResponse(
+        is_spam=is_spam,
+        confidence=float(confidence),
+        message=message,
+        error=error,
+        sender=parsed.sender,
+        recipient=parsed.recipient,
+        subject=parsed.subject,
+        bytes_read=parsed.bytes_read,
+        truncated=parsed.truncated,
+        skipped_parts=parsed.skipped_parts
+    )
+
+@app.post("/api/v1/check-emails", response_model=BulkEmailResponse, dependencies=[Depends(require_model)])
+async def check_emails(
+    request: BulkEmailRequest,
+    api_key: str = Depends(verify_api_key)
+):
+    if len(request.emails) > BULK_MAX_EMAILS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {BULK_MAX_EMAILS} emails per request"
+        )
+    
+    results: List[Optional[BulkEmailResult]] = [None] * len(request.emails)
+    
+    # Process every email, recording failures per item
+    processed = []
+    with timed("preprocess"):
+        for index, email in enumerate(request.emails):
+            try:
+                processed.append((index, process_email(email.content)))
+            except Exception as e:
+                results[index] = BulkEmailResult(
+                    index=index,
+                    message="Error processing email",
+                    error=str(e)
+                )
+    
+    # Cache misses get one forward pass per token-length bucket
+    with timed("classify"):
+        predictions = await runtime.classify_many([text for _, text in processed])
+    
+    for (index, _), prediction in zip(processed, predictions):
+        if isinstance(prediction, Exception):
+            results[index] = BulkEmailResult(
+                index=index,
+                message="Error classifying email",
+                error=str(prediction)
+            )
+            continue
+        
+        is_spam, confidence = prediction
+        email_dict = request.emails[index].dict()
+        error = None
+        try:
+            if is_spam:
+                await run_blocking(sendmail_handler.handle_spam, email_dict)
+                message = "Email classified as spam and rejected"
+            else:
+                await run_blocking(sendmail_handler.handle_legitimate, email_dict)
+                message = "Email classified as legitimate and accepted"
+        except Exception as e:
+            logger.error(f"Handling bulk email {index} failed: {str(e)}")
+            action = "quarantined" if is_spam else "delivered"
+            message = f"Email classified as {'spam' if is_spam else 'legitimate'} but could not be {action}"
+            error = str(e)
+        
+        results[index] = BulkEmailResult(
+            index=index,
+            is_spam=is_spam,
+            confidence=float(confidence),
+            message=message,
+            error=error
+        )
+    
+    return BulkEmailResponse(results=results)
+
+@app.post("/api/v1/send-email", response_model=EmailRead, dependencies=[Depends(require_model)])
 async def send_email(
     email: EmailCreate,
-    db: Session = Depends(get_db),
-    api_key: str = Depends(verify_api_key)
+    db: AsyncSession = Depends(get_async_db),
+    sender: AuthUser = Depends(authenticated_user)
 ):
-    # Get sender and recipient
-    sender = db.query(User).filter(User.api_key == api_key).first()
-    recipient = db.query(User).filter(User.email == email.recipient_email).first()
+    # Get recipient (the sender comes from the authenticated user)
+    with timed("db"):
+        recipient = (await db.execute(select(User).where(User.email == email.recipient_email))).scalars().first()
     
     if not recipient:
         raise HTTPException(
@@ -273,34 +600,33 @@ async def send_email(
         )
     
     # Process email content and check for spam
-    processed_content = process_email(email.content)
-    is_spam, confidence = predict_spam(model, processed_content)
+    with timed("preprocess"):
+        processed_content = process_email(email.content)
+    with timed("classify"):
+        is_spam, confidence = await runtime.classify(processed_content)
     
     # Create email record
-    db_email = Email(
-        subject=email.subject,
-        content=email.content,
-        sender_id=sender.id,
-        recipient_id=recipient.id,
-        is_spam=is_spam,
-        spam_confidence=float(confidence)
-    )
-    
-    db.add(db_email)
-    db.commit()
-    db.refresh(db_email)
+    with timed("db"):
+        db_email = await email_writer.add({
+            "subject": email.subject,
+            "content": email.content,
+            "sender_id": sender.id,
+            "recipient_id": recipient.id,
+            "is_spam": is_spam,
+            "spam_confidence": float(confidence)
+        }, db=db)
     
     # Handle email based on prediction
     try:
         if is_spam:
-            sendmail_handler.handle_spam({
+            await run_blocking(sendmail_handler.handle_spam, {
                 "sender": sender.email,
                 "recipient": recipient.email,
                 "subject": email.subject,
                 "content": email.content
             })
         else:
-            sendmail_handler.handle_legitimate({
+            await run_blocking(sendmail_handler.handle_legitimate, {
                 "sender": sender.email,
                 "recipient": recipient.email,
                 "subject": email.subject,
@@ -311,114 +637,263 @@ async def send_email(
     
     # Add sender and recipient emails to the response
     response_data = {
-        **db_email.__dict__,
+        **db_email,
         "sender_email": sender.email,
         "recipient_email": recipient.email
     }
     
     return response_data
 
-@app.get("/api/v1/emails/sent", response_model=List[EmailRead])
-async def get_sent_emails(
-    db: Session = Depends(get_db),
-    api_key: str = Depends(verify_api_key)
-):
-    user = db.query(User).filter(User.api_key == api_key).first()
-    emails = []
-    for email in user.sent_emails:
-        emails.append(EmailRead(
+async def _mailbox_response(db: AsyncSession, response: Response, conditions, cursor: Optional[str], limit: int):
+    try:
+        with timed("db"):
+            rows, next_cursor = await mailbox_page(db, conditions, cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    # The body stays a plain list; the next page is requested with ?cursor=
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return [
+        EmailRead(
             id=email.id,
             subject=email.subject,
             content=email.content,
-            sender_email=email.sender.email,  # assumes relationship is set up
-            recipient_email=email.recipient.email,  # assumes relationship is set up
+            sender_email=sender_email,
+            recipient_email=recipient_email,
             is_spam=email.is_spam,
             spam_confidence=email.spam_confidence,
             created_at=email.created_at
-        ))
-    return emails
+        )
+        for email, sender_email, recipient_email in rows
+    ]
+
+@app.get("/api/v1/emails/sent", response_model=List[EmailRead])
+async def get_sent_emails(
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = MAILBOX_DEFAULT_LIMIT,
+    db: AsyncSession = Depends(get_async_db),
+    user: AuthUser = Depends(authenticated_user)
+):
+    return await _mailbox_response(db, response, [Email.sender_id == user.id], cursor, limit)
 
 @app.get("/api/v1/emails/received", response_model=List[EmailRead])
 async def get_received_emails(
-    db: Session = Depends(get_db),
-    api_key: str = Depends(verify_api_key)
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = MAILBOX_DEFAULT_LIMIT,
+    db: AsyncSession = Depends(get_async_db),
+    user: AuthUser = Depends(authenticated_user)
 ):
-    user = db.query(User).filter(User.api_key == api_key).first()
-    emails = []
-    for email in user.received_emails:
-        emails.append(EmailRead(
-            id=email.id,
-            subject=email.subject,
-            content=email.content,
-            sender_email=email.sender.email,  # assumes relationship is set up
-            recipient_email=email.recipient.email,  # assumes relationship is set up
-            is_spam=email.is_spam,
-            spam_confidence=email.spam_confidence,
-            created_at=email.created_at
-        ))
-    return emails
+    return await _mailbox_response(db, response, [Email.recipient_id == user.id], cursor, limit)
 
 @app.get("/api/v1/emails/spam", response_model=List[EmailRead])
 async def get_spam_emails(
-    db: Session = Depends(get_db),
-    api_key: str = Depends(verify_api_key)
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = MAILBOX_DEFAULT_LIMIT,
+    db: AsyncSession = Depends(get_async_db),
+    user: AuthUser = Depends(authenticated_user)
 ):
-    user = db.query(User).filter(User.api_key == api_key).first()
-    emails = []
-    for email in user.received_emails:
-        if email.is_spam:
-            emails.append(EmailRead(
-                id=email.id,
-                subject=email.subject,
-                content=email.content,
-                sender_email=email.sender.email,
-                recipient_email=email.recipient.email,
-                is_spam=email.is_spam,
-                spam_confidence=email.spam_confidence,
-                created_at=email.created_at
-            ))
-    return emails
+    return await _mailbox_response(
+        db, response, [Email.recipient_id == user.id, Email.is_spam.is_(True)], cursor, limit
+    )
+
+@app.get("/api/v1/emails/stats", response_model=MailboxStats)
+async def get_email_stats(
+    days: int = 30,
+    db: AsyncSession = Depends(get_async_db),
+    user: AuthUser = Depends(authenticated_user)
+):
+    if not 1 <= days <= 366:
+        raise HTTPException(status_code=400, detail="days must be between 1 and 366")
+    return await get_mailbox_stats(db, user.id, days)
+
+@app.get("/api/v1/cache/stats")
+async def get_cache_stats(api_key: str = Depends(verify_api_key)):
+    if runtime.cache is None:
+        raise HTTPException(status_code=503, detail="Spam classifier not ready")
+    return runtime.cache.stats()
+
+@app.get("/api/v1/cascade/stats")
+async def get_cascade_stats(api_key: str = Depends(verify_api_key)):
+    if runtime.cascade is None:
+        raise HTTPException(status_code=404, detail="Cascade classifier is not enabled")
+    return runtime.cascade.stats()
+
+@app.get("/api/v1/delivery/stats")
+async def get_delivery_stats(api_key: str = Depends(verify_api_key)):
+    if sendmail_handler is None or sendmail_handler.delivery is None:
+        raise HTTPException(status_code=404, detail="Delivery queue is not enabled")
+    return await run_blocking(sendmail_handler.delivery.stats)
+
+def _quarantine_access(user: AuthUser, entry: dict) -> bool:
+    if user.email.lower() in QUARANTINE_ADMIN_EMAILS:
+        return True
+    return user.email.lower() in recipient_addresses(entry["recipient"])
+
+def _quarantine_entry(entry: dict, include_message: bool = False) -> QuarantineEntry:
+    return QuarantineEntry(
+        id=entry["id"],
+        sender=entry["sender"],
+        recipient=entry["recipient"],
+        subject=entry["subject"],
+        created_at=datetime.fromtimestamp(entry["created_at"]),
+        released_at=datetime.fromtimestamp(entry["released_at"]) if entry["released_at"] else None,
+        message=entry["message"].decode("utf-8", "replace") if include_message else None
+    )
+
+@app.get("/api/v1/quarantine", response_model=List[QuarantineEntry])
+async def list_quarantine(
+    sender: Optional[str] = None,
+    include_released: bool = False,
+    limit: int = 100,
+    user: AuthUser = Depends(authenticated_user)
+):
+    # Admins see every message, other users only mail addressed to them
+    recipient = None if user.email.lower() in QUARANTINE_ADMIN_EMAILS else user.email
+    # Index and segment reads share a lock with compaction, so they stay
+    # off the event loop
+    entries = await run_blocking(partial(
+        sendmail_handler.quarantine.search,
+        sender=sender,
+        recipient=recipient,
+        include_released=include_released,
+        limit=min(max(limit, 1), 1000)
+    ))
+    return [_quarantine_entry(entry) for entry in entries]
+
+@app.get("/api/v1/quarantine/stats")
+async def get_quarantine_stats(api_key: str = Depends(verify_api_key)):
+    return await run_blocking(sendmail_handler.quarantine.stats)
+
+@app.get("/api/v1/quarantine/{message_id}", response_model=QuarantineEntry)
+async def get_quarantined_email(
+    message_id: str,
+    user: AuthUser = Depends(authenticated_user)
+):
+    entry = await run_blocking(sendmail_handler.quarantine.get, message_id)
+    if entry is None or not _quarantine_access(user, entry):
+        raise HTTPException(status_code=404, detail="Quarantined email not found")
+    return _quarantine_entry(entry, include_message=True)
+
+@app.post("/api/v1/quarantine/{message_id}/release", response_model=QuarantineEntry)
+async def release_quarantined_email(
+    message_id: str,
+    user: AuthUser = Depends(authenticated_user)
+):
+    entry = await run_blocking(sendmail_handler.quarantine.get, message_id)
+    if entry is None or not _quarantine_access(user, entry):
+        raise HTTPException(status_code=404, detail="Quarantined email not found")
+    try:
+        await run_blocking(sendmail_handler.release, message_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error releasing email: {str(e)}")
+    return _quarantine_entry(await run_blocking(sendmail_handler.quarantine.get, message_id))
+
+@app.get("/api/v1/audit/stats")
+async def get_audit_stats(api_key: str = Depends(verify_api_key)):
+    return sendmail_handler.audit.stats()
+
+@app.get("/api/v1/user-cache/stats")
+async def get_user_cache_stats(api_key: str = Depends(verify_api_key)):
+    return user_cache.stats()
+
+@app.get("/api/v1/db/pool/stats")
+async def get_db_pool_stats(api_key: str = Depends(verify_api_key)):
+    return get_pool_stats()
+
+@app.get("/api/v1/email-writer/stats")
+async def get_email_writer_stats(api_key: str = Depends(verify_api_key)):
+    return email_writer.stats()
+
+@app.get("/api/v1/password-hasher/stats")
+async def get_password_hasher_stats(api_key: str = Depends(verify_api_key)):
+    return password_hasher.stats()
+
+@app.get("/api/v1/memory/stats")
+async def get_memory_stats(api_key: str = Depends(verify_api_key)):
+    # This worker only; /metrics has every worker's process_* gauges
+    return {"worker": worker_id(), **process_memory()}
+
+@app.get("/api/v1/state/stats")
+async def get_state_stats(api_key: str = Depends(verify_api_key)):
+    return await state_backend.run(state_backend.stats)
+
+def _require_profile_admin(user: AuthUser):
+    if user.email.lower() not in PROFILE_ADMIN_EMAILS:
+        raise HTTPException(status_code=403, detail="Not allowed to read profiles")
+
+@app.get("/api/v1/profiles")
+async def list_profiles(user: AuthUser = Depends(authenticated_user)):
+    _require_profile_admin(user)
+    return request_profiler.list()
+
+@app.get("/api/v1/profiles/{profile_id}/{kind}")
+async def get_profile(profile_id: str, kind: str, user: AuthUser = Depends(authenticated_user)):
+    # kind: python (speedscope) or torch (Chrome trace)
+    _require_profile_admin(user)
+    path = request_profiler.file_path(profile_id, kind)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type="application/json", filename=os.path.basename(path))
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics(request: Request):
+    if not METRICS_TOKEN:
+        if not METRICS_PUBLIC:
+            raise HTTPException(status_code=403, detail="Set METRICS_TOKEN (or METRICS_PUBLIC=true) to enable /metrics")
+    elif request.headers.get("Authorization") != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(status_code=403, detail="Invalid metrics token")
+    # Stats collectors may touch SQLite (delivery queue), so render off the loop
+    body = await asyncio.get_running_loop().run_in_executor(None, metrics_registry.render)
+    return Response(content=body, media_type="text/plain; version=0.0.4")
 
 @app.get("/api/v1/health")
 async def health_check():
     return {"status": "healthy", "service": "anti-spam-api"}
 
+@app.get("/api/v1/ready")
+async def readiness_check():
+    status = runtime.status()
+    if not runtime.ready:
+        return JSONResponse(status_code=503, content={"status": "not ready", **status})
+    return {"status": "ready", **status}
+
 @app.patch("/api/v1/user/email")
 async def update_email(
     data: UserUpdateEmail,
-    api_key: str = Depends(verify_api_key),
-    db: Session = Depends(get_db)
+    current: AuthUser = Depends(authenticated_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    user = db.query(User).filter(User.api_key == api_key).first()
+    user = await db.get(User, current.id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    if db.query(User).filter(User.email == data.email).first():
+    if (await db.execute(select(User).where(User.email == data.email))).scalars().first():
         raise HTTPException(status_code=400, detail="Email already in use")
     user.email = data.email
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    await state_backend.run(user_cache.invalidate, user.id)
     return {"message": "Email updated successfully", "email": user.email}
 
 @app.patch("/api/v1/user/password")
 async def update_password(
     data: UserUpdatePassword,
-    api_key: str = Depends(verify_api_key),
-    db: Session = Depends(get_db)
+    current: AuthUser = Depends(authenticated_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    user = db.query(User).filter(User.api_key == api_key).first()
+    user = await db.get(User, current.id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     if data.new_password != data.confirm_password:
         raise HTTPException(status_code=400, detail="Passwords do not match")
-    user.hashed_password = pwd_context.hash(data.new_password)
-    db.commit()
+    user.hashed_password = await password_hasher.hash(data.new_password)
+    await db.commit()
+    await state_backend.run(user_cache.invalidate, user.id)
     return {"message": "Password updated successfully"}
 
 @app.get("/api/v1/user/me")
-async def get_current_user(api_key: str = Depends(verify_api_key), db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.api_key == api_key).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
+async def get_current_user(user: AuthUser = Depends(authenticated_user)):
     return {
         "email": user.email,
         "api_key": user.api_key,
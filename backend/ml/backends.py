@@ -0,0 +1,166 @@
+import inspect
+import logging
+import os
+from types import SimpleNamespace
+
+import torch
+from transformers import AutoModelForSequenceClassification
+
+from backend.ml.shared_weights import MODEL_WEIGHTS_MODE, WEIGHTS_MODES, load_shared_model
+
+logger = logging.getLogger(__name__)
+
+TORCH = "torch"
+TORCH_INT8 = "torch-int8"
+ONNX = "onnx"
+BACKENDS = (TORCH, TORCH_INT8, ONNX)
+
+# Selected backend and exported graph location
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", TORCH)
+ONNX_FILENAME = "model.onnx"
+
+
+def onnx_model_path(model_path: str) -> str:
+    return os.getenv("ONNX_MODEL_PATH", os.path.join(model_path, ONNX_FILENAME))
+
+
+class OnnxSequenceClassifier:
+    """
+    ONNX Runtime session that behaves like a Hugging Face classifier:
+    called with tokenizer outputs, returns an object with a .logits tensor
+    """
+
+    def __init__(self, onnx_path: str):
+        try:
+            import onnxruntime
+        except ImportError as e:
+            raise ImportError(
+                "The onnx backend requires onnxruntime (pip install onnxruntime)"
+            ) from e
+
+        if not os.path.exists(onnx_path):
+            raise FileNotFoundError(
+                f"ONNX model not found at {onnx_path}; "
+                f"run `python -m backend.ml.convert export-onnx` first"
+            )
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = torch.get_num_threads()
+        self.session = onnxruntime.InferenceSession(
+            onnx_path, options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def eval(self):
+        return self
+
+    def __call__(self, **inputs):
+        feed = {
+            name: tensor.cpu().numpy()
+            for name, tensor in inputs.items()
+            if name in self.input_names
+        }
+        logits = self.session.run(["logits"], feed)[0]
+        return SimpleNamespace(logits=torch.from_numpy(logits))
+
+
+def load_backend_model(model_path: str, backend: str = INFERENCE_BACKEND):
+    """
+    Load the sequence classifier for the selected inference backend
+
+    Args:
+        model_path: Directory holding the fine-tuned model
+        backend: One of "torch", "torch-int8" or "onnx"
+
+    Returns:
+        A model callable with tokenizer outputs, in evaluation mode
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend {backend!r}, expected one of {BACKENDS}")
+    if MODEL_WEIGHTS_MODE not in WEIGHTS_MODES:
+        raise ValueError(f"Unknown MODEL_WEIGHTS_MODE {MODEL_WEIGHTS_MODE!r}, expected one of {WEIGHTS_MODES}")
+
+    if backend == ONNX:
+        model = OnnxSequenceClassifier(onnx_model_path(model_path))
+    elif backend == TORCH and MODEL_WEIGHTS_MODE != "private":
+        # Weights shared with the other workers through a memory mapping
+        model = load_shared_model(model_path, MODEL_WEIGHTS_MODE)
+    else:
+        if MODEL_WEIGHTS_MODE != "private":
+            logger.warning(f"MODEL_WEIGHTS_MODE={MODEL_WEIGHTS_MODE} only applies to the {TORCH} backend")
+        model = AutoModelForSequenceClassification.from_pretrained(model_path)
+        model.eval()
+        if backend == TORCH_INT8:
+            # Dynamic quantization: int8 weights for every Linear layer,
+            # activations quantized on the fly
+            model = torch.quantization.quantize_dynamic(
+                model, {torch.nn.Linear}, dtype=torch.qint8
+            )
+
+    logger.info(f"Loaded model from {model_path} with the {backend} backend")
+    return model
+
+
+class _KeywordInputs(torch.nn.Module):
+    """
+    Passes positional tensors to a Hugging Face model by name, so the
+    exporter's input order (the tokenizer's) cannot be mistaken for the order
+    of the model's forward() parameters
+    """
+
+    def __init__(self, model, input_names):
+        super().__init__()
+        self.model = model
+        self.input_names = input_names
+
+    def forward(self, *tensors):
+        return self.model(**dict(zip(self.input_names, tensors)))
+
+
+def export_onnx(model_path: str, output_path: str, opset: int = 14) -> str:
+    """
+    Export the fp32 PyTorch model to an ONNX graph with dynamic batch and
+    sequence axes
+
+    Returns:
+        Path of the written graph
+    """
+    from transformers import AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(model_path)
+    model = AutoModelForSequenceClassification.from_pretrained(model_path)
+    model.eval()
+    # Plain tensor outputs keep the exported graph simple
+    model.config.return_dict = False
+
+    sample = tokenizer(
+        ["export sample", "a second, slightly longer export sample"],
+        padding=True,
+        return_tensors="pt"
+    )
+    input_names = list(sample.keys())
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["logits"] = {0: "batch"}
+
+    options = {}
+    if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+        # Newer torch defaults to the dynamo exporter; keep the TorchScript
+        # one, which honours dynamic_axes the same way on every version
+        options["dynamo"] = False
+
+    with torch.no_grad():
+        torch.onnx.export(
+            _KeywordInputs(model, input_names),
+            tuple(sample[name] for name in input_names),
+            output_path,
+            input_names=input_names,
+            output_names=["logits"],
+            dynamic_axes=dynamic_axes,
+            opset_version=opset,
+            do_constant_folding=True,
+            **options
+        )
+
+    logger.info(f"Exported ONNX model to {output_path}")
+    return output_path
@@ -0,0 +1,206 @@
+"""
+Cheap lexical first tier in front of BERT.
+
+A linear model over hashed word n-grams scores every email in microseconds;
+only emails whose spam probability falls inside the uncertainty band
+[CASCADE_LOW, CASCADE_HIGH] are passed on to BERT.
+
+    python -m backend.ml.cascade train --data data/train.parquet --test data/test.parquet
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import joblib
+import numpy as np
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.linear_model import SGDClassifier
+
+CASCADE_ENABLED = os.getenv("CASCADE_ENABLED", "false").lower() == "true"
+CASCADE_MODEL_PATH = os.getenv(
+    "CASCADE_MODEL_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "content", "lexical_model.joblib")
+)
+CASCADE_LOW = float(os.getenv("CASCADE_LOW", "0.05"))
+CASCADE_HIGH = float(os.getenv("CASCADE_HIGH", "0.95"))
+# Fraction of lexically decided emails also scored by BERT to measure disagreement
+CASCADE_SHADOW_RATE = float(os.getenv("CASCADE_SHADOW_RATE", "0.01"))
+
+
+class LexicalModel:
+    """
+    Logistic regression on hashed word 1-2 grams (stateless vectorizer, so
+    the saved model is just the coefficient vector)
+    """
+
+    def __init__(self, n_features: int = 2 ** 18):
+        self.n_features = n_features
+        self.vectorizer = HashingVectorizer(
+            n_features=n_features,
+            ngram_range=(1, 2),
+            alternate_sign=False,
+            lowercase=True
+        )
+        self.classifier = SGDClassifier(loss="log_loss", alpha=1e-5, max_iter=20, tol=None)
+
+    def fit(self, texts: Sequence[str], labels: Sequence[int]) -> "LexicalModel":
+        self.classifier.fit(self.vectorizer.transform(texts), labels)
+        return self
+
+    def spam_probability(self, texts: Sequence[str]) -> np.ndarray:
+        """
+        Probability of spam for every text, in one vectorized pass
+        """
+        return self.classifier.predict_proba(self.vectorizer.transform(texts))[:, 1]
+
+    def save(self, path: str):
+        joblib.dump({"n_features": self.n_features, "classifier": self.classifier}, path)
+
+    @classmethod
+    def load(cls, path: str) -> "LexicalModel":
+        state = joblib.load(path)
+        model = cls(n_features=state["n_features"])
+        model.classifier = state["classifier"]
+        return model
+
+
+class Cascade:
+    """
+    Decides confident emails with the lexical model and keeps per-tier
+    counters plus shadow disagreement with BERT
+    """
+
+    def __init__(
+        self,
+        model: LexicalModel,
+        low: float = CASCADE_LOW,
+        high: float = CASCADE_HIGH,
+        shadow_rate: float = CASCADE_SHADOW_RATE,
+    ):
+        if not 0.0 <= low <= high <= 1.0:
+            raise ValueError("Cascade band must satisfy 0 <= low <= high <= 1")
+        self.model = model
+        self.low = low
+        self.high = high
+        self.shadow_rate = shadow_rate
+        self._lock = threading.Lock()
+        self.counts = {
+            "lexical_ham": 0,
+            "lexical_spam": 0,
+            "bert": 0,
+            "shadow_checked": 0,
+            "shadow_disagreements": 0,
+        }
+
+    def _count(self, key: str, n: int = 1):
+        with self._lock:
+            self.counts[key] += n
+
+    def decide(self, texts: Sequence[str]) -> List[Optional[Tuple[bool, float]]]:
+        """
+        Score texts lexically
+
+        Returns:
+            (is_spam, confidence) for texts outside the uncertainty band,
+            None for texts that must go to BERT
+        """
+        if not texts:
+            return []
+        decisions: List[Optional[Tuple[bool, float]]] = []
+        for p in self.model.spam_probability(texts).tolist():
+            if p >= self.high:
+                decisions.append((True, p))
+                self._count("lexical_spam")
+            elif p <= self.low:
+                decisions.append((False, 1.0 - p))
+                self._count("lexical_ham")
+            else:
+                decisions.append(None)
+                self._count("bert")
+        return decisions
+
+    def should_shadow(self) -> bool:
+        return self.shadow_rate > 0 and random.random() < self.shadow_rate
+
+    def record_shadow(self, lexical: Tuple[bool, float], bert: Tuple[bool, float]):
+        self._count("shadow_checked")
+        if lexical[0] != bert[0]:
+            self._count("shadow_disagreements")
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            counts = dict(self.counts)
+        decided = counts["lexical_ham"] + counts["lexical_spam"]
+        total = decided + counts["bert"]
+        return {
+            **counts,
+            "low": self.low,
+            "high": self.high,
+            "shadow_rate": self.shadow_rate,
+            "lexical_fraction": decided / total if total else 0.0,
+            "bert_fraction": counts["bert"] / total if total else 0.0,
+            "shadow_disagreement_rate": (
+                counts["shadow_disagreements"] / counts["shadow_checked"]
+                if counts["shadow_checked"] else 0.0
+            ),
+        }
+
+
+def load_cascade() -> Optional[Cascade]:
+    """
+    Build the cascade if enabled and a trained lexical model exists
+    """
+    if not CASCADE_ENABLED:
+        return None
+    if not os.path.exists(CASCADE_MODEL_PATH):
+        raise FileNotFoundError(
+            f"Lexical model not found at {CASCADE_MODEL_PATH}; "
+            f"run `python -m backend.ml.cascade train` first"
+        )
+    return Cascade(LexicalModel.load(CASCADE_MODEL_PATH))
+
+
+def _load_labelled(path: str, text_column: str, label_column: str):
+    import pandas as pd
+    from backend.services.email_processor import process_email
+
+    frame = pd.read_parquet(path) if path.endswith(".parquet") else pd.read_csv(path, encoding="latin-1")
+    labels = frame[label_column]
+    if labels.dtype == object:
+        labels = labels.str.lower().isin(["spam", "1", "true"])
+    texts = [process_email(str(t)) for t in frame[text_column]]
+    return texts, labels.astype(int).to_numpy()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    train = commands.add_parser("train", help="Train the lexical model")
+    train.add_argument("--data", default="data/train.parquet")
+    train.add_argument("--test", default=None, help="Optional held-out file for band statistics")
+    train.add_argument("--text-column", default="text")
+    train.add_argument("--label-column", default="label")
+    train.add_argument("--output", default=CASCADE_MODEL_PATH)
+    args = parser.parse_args(argv)
+
+    texts, labels = _load_labelled(args.data, args.text_column, args.label_column)
+    model = LexicalModel().fit(texts, labels)
+    model.save(args.output)
+    print(f"Trained on {len(texts)} emails, saved to {args.output}")
+
+    if args.test:
+        texts, labels = _load_labelled(args.test, args.text_column, args.label_column)
+        probabilities = model.spam_probability(texts)
+        decided = (probabilities <= CASCADE_LOW) | (probabilities >= CASCADE_HIGH)
+        correct = (probabilities >= 0.5).astype(int) == labels
+        print(f"Band [{CASCADE_LOW}, {CASCADE_HIGH}]: lexical tier decides {decided.mean():.1%}")
+        if decided.any():
+            print(f"Accuracy on lexically decided emails: {correct[decided].mean():.4f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
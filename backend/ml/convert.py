@@ -0,0 +1,149 @@
+"""
+Export the fine-tuned model to alternative inference backends and check
+that they agree with the fp32 PyTorch reference.
+
+    python -m backend.ml.convert export-onnx
+    python -m backend.ml.convert export-safetensors
+    python -m backend.ml.convert parity --samples data/test.parquet --limit 500
+"""
+import argparse
+import json
+import os
+import sys
+from time import perf_counter
+from typing import Dict, List
+
+from transformers import AutoTokenizer
+
+from backend.ml.backends import BACKENDS, ONNX, TORCH, TORCH_INT8, export_onnx, load_backend_model, onnx_model_path
+from backend.ml.model_loader import MODEL_PATH, predict_spam_batch
+from backend.ml.shared_weights import export_safetensors
+from backend.services.email_processor import process_email
+
+# Used when no sample file is given
+FALLBACK_SAMPLES = [
+    "Hi team, the meeting has moved to 3pm tomorrow. See you there.",
+    "Congratulations! You have WON a $1000 gift card. Click here to claim now!",
+    "Can you send me the report from last quarter when you get a chance?",
+    "URGENT: your account has been suspended, verify your password immediately",
+    "Lunch on Friday? The new place near the office opened this week.",
+    "Get cheap meds online, no prescription needed, limited time offer!!!",
+]
+
+
+def load_samples(path: str, text_column: str, limit: int) -> List[str]:
+    """
+    Read sample emails from a parquet or csv file
+    """
+    if not path:
+        return FALLBACK_SAMPLES[:limit]
+
+    import pandas as pd
+
+    if path.endswith(".parquet"):
+        frame = pd.read_parquet(path)
+    else:
+        frame = pd.read_csv(path, encoding="latin-1")
+    if text_column not in frame.columns:
+        raise SystemExit(
+            f"Column {text_column!r} not in {path}; available: {list(frame.columns)}"
+        )
+    return frame[text_column].astype(str).head(limit).tolist()
+
+
+def score(model_tuple, texts: List[str], batch_size: int):
+    """
+    Predict all texts in batches, returning predictions and elapsed seconds
+    """
+    predictions = []
+    start = perf_counter()
+    for i in range(0, len(texts), batch_size):
+        predictions.extend(predict_spam_batch(model_tuple, texts[i:i + batch_size]))
+    return predictions, perf_counter() - start
+
+
+def spam_probability(prediction) -> float:
+    is_spam, confidence = prediction
+    return confidence if is_spam else 1.0 - confidence
+
+
+def parity(args) -> int:
+    texts = [process_email(t) for t in load_samples(args.samples, args.text_column, args.limit)]
+    tokenizer = AutoTokenizer.from_pretrained(args.model_path)
+
+    reference, reference_time = score(
+        (load_backend_model(args.model_path, TORCH), tokenizer), texts, args.batch_size
+    )
+    report: Dict[str, Dict] = {
+        TORCH: {"seconds": round(reference_time, 4), "per_second": round(len(texts) / reference_time, 1)}
+    }
+
+    failed = False
+    for backend in args.backends.split(","):
+        if backend == TORCH:
+            continue
+        candidate, elapsed = score(
+            (load_backend_model(args.model_path, backend), tokenizer), texts, args.batch_size
+        )
+        agreement = sum(
+            r[0] == c[0] for r, c in zip(reference, candidate)
+        ) / len(texts)
+        diffs = [
+            abs(spam_probability(r) - spam_probability(c))
+            for r, c in zip(reference, candidate)
+        ]
+        ok = agreement >= args.min_agreement and max(diffs) <= args.max_confidence_diff
+        failed = failed or not ok
+        report[backend] = {
+            "seconds": round(elapsed, 4),
+            "per_second": round(len(texts) / elapsed, 1),
+            "speedup": round(reference_time / elapsed, 2),
+            "label_agreement": round(agreement, 4),
+            "max_confidence_diff": round(max(diffs), 5),
+            "mean_confidence_diff": round(sum(diffs) / len(diffs), 5),
+            "ok": ok,
+        }
+
+    print(json.dumps({"samples": len(texts), "backends": report}, indent=2))
+    return 1 if failed else 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model-path", default=MODEL_PATH)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export = commands.add_parser("export-onnx", help="Export the fp32 model to ONNX")
+    export.add_argument("--output", default=None, help="Defaults to ONNX_MODEL_PATH or <model-path>/model.onnx")
+    export.add_argument("--opset", type=int, default=14)
+
+    commands.add_parser(
+        "export-safetensors", help="Write model.safetensors for MODEL_WEIGHTS_MODE=mmap/shm"
+    )
+
+    check = commands.add_parser("parity", help="Compare backends against the fp32 reference")
+    check.add_argument("--samples", default=os.getenv("PARITY_SAMPLES", ""), help="parquet or csv file of emails")
+    check.add_argument("--text-column", default="text")
+    check.add_argument("--limit", type=int, default=500)
+    check.add_argument("--batch-size", type=int, default=32)
+    check.add_argument("--backends", default=f"{TORCH_INT8},{ONNX}")
+    check.add_argument("--min-agreement", type=float, default=0.99)
+    check.add_argument("--max-confidence-diff", type=float, default=0.05)
+
+    args = parser.parse_args(argv)
+
+    if args.command == "export-onnx":
+        export_onnx(args.model_path, args.output or onnx_model_path(args.model_path), args.opset)
+        return 0
+    if args.command == "export-safetensors":
+        print(export_safetensors(args.model_path))
+        return 0
+
+    unknown = set(args.backends.split(",")) - set(BACKENDS)
+    if unknown:
+        parser.error(f"unknown backends: {sorted(unknown)}")
+    return parity(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,75 @@
+import asyncio
+import contextvars
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Optional
+
+import torch
+
+logger = logging.getLogger(__name__)
+
+# Number of threads allowed to run forward passes concurrently
+INFERENCE_WORKERS = max(int(os.getenv("INFERENCE_WORKERS", "1")), 1)
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def _torch_threads() -> int:
+    """
+    Intra-op threads per forward pass, so that workers x threads does not
+    oversubscribe the available cores
+    """
+    configured = os.getenv("INFERENCE_TORCH_THREADS")
+    if configured:
+        return max(int(configured), 1)
+    return max((os.cpu_count() or 1) // INFERENCE_WORKERS, 1)
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """
+    Return the shared inference executor, creating it on first use
+    """
+    global _executor
+    if _executor is None:
+        threads = _torch_threads()
+        torch.set_num_threads(threads)
+        _executor = ThreadPoolExecutor(
+            max_workers=INFERENCE_WORKERS,
+            thread_name_prefix="inference"
+        )
+        logger.info(
+            f"Inference executor started with {INFERENCE_WORKERS} worker(s), "
+            f"{threads} torch thread(s) each"
+        )
+    return _executor
+
+
+async def run_inference(func: Callable, *args: Any, **kwargs: Any) -> Any:
+    """
+    Run a blocking inference call on the inference executor and await it
+
+    The call runs in a copy of the caller's context, so stages it times
+    still reach the request's Server-Timing header.
+
+    Args:
+        func: Blocking callable, e.g. predict_spam_batch
+        *args, **kwargs: Arguments passed to func
+
+    Returns:
+        Whatever func returns
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(get_executor(), partial(context.run, func, *args, **kwargs))
+
+
+def shutdown_executor():
+    """
+    Stop the inference executor, waiting for running forward passes
+    """
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
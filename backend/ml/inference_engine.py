@@ -0,0 +1,163 @@
+import asyncio
+import logging
+import os
+from typing import Dict, List, Optional, Set, Tuple, Union
+
+from backend.ml.executor import INFERENCE_WORKERS, run_inference
+from backend.ml.model_loader import LONG_DOC_ENABLED, predict_spam_batch, predict_spam_windowed
+from backend.services.metrics import add_timings, request_timings, start_request_timings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BATCH_SIZE = int(os.getenv("INFERENCE_MAX_BATCH_SIZE", "32"))
+DEFAULT_MAX_WAIT_MS = float(os.getenv("INFERENCE_MAX_WAIT_MS", "5"))
+
+
+class InferenceEngine:
+    """
+    Dynamic micro-batching front end for the (model, tokenizer) tuple.
+
+    Callers await predict(); concurrent requests are gathered into one padded
+    batch of at most max_batch_size texts, waiting no longer than max_wait_ms
+    after the first request of a batch arrived. Forward passes run on the
+    inference executor, with up to max_concurrent_batches in flight. In
+    long-document mode the batch's texts are split into windows and scored
+    whole instead of being truncated. The stages timed for a batch are
+    credited to every request in it.
+    """
+
+    def __init__(
+        self,
+        model_tuple: Tuple,
+        max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+        max_wait_ms: float = DEFAULT_MAX_WAIT_MS,
+        max_concurrent_batches: int = INFERENCE_WORKERS,
+        long_documents: bool = LONG_DOC_ENABLED,
+    ):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        self.model_tuple = model_tuple
+        self.max_batch_size = max_batch_size
+        self.max_wait = max(max_wait_ms, 0) / 1000.0
+        self.max_concurrent_batches = max(max_concurrent_batches, 1)
+        self.long_documents = long_documents
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._inflight: Set[asyncio.Task] = set()
+
+    def _ensure_worker(self):
+        """
+        Start the batching task on the running event loop if needed
+        """
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._slots = asyncio.Semaphore(self.max_concurrent_batches)
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def predict(self, text: str) -> Tuple[bool, float]:
+        """
+        Classify a single text as part of the next batch
+
+        Args:
+            text: Processed text to classify
+
+        Returns:
+            Tuple of (is_spam: bool, confidence: float)
+        """
+        self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((text, future, request_timings()))
+        return await future
+
+    async def _collect(self) -> List[Tuple[str, asyncio.Future, Optional[Dict[str, float]]]]:
+        """
+        Wait for one request, then gather more until the batch is full or
+        the wait budget is spent
+        """
+        batch = [await self._queue.get()]
+        deadline = asyncio.get_running_loop().time() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - asyncio.get_running_loop().time()
+            if remaining <= 0:
+                # Still take whatever is already queued without waiting
+                while len(batch) < self.max_batch_size and not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+
+        return batch
+
+    async def _run_batch(self, texts: List[str]) -> List[Union[Tuple[bool, float], Exception]]:
+        if self.long_documents:
+            return await run_inference(predict_spam_windowed, self.model_tuple, texts)
+        return await run_inference(predict_spam_batch, self.model_tuple, texts)
+
+    async def _dispatch(self, batch: List[Tuple[str, asyncio.Future, Optional[Dict[str, float]]]]):
+        # This task's own timings: tokenize and infer for the whole batch
+        batch_timings = start_request_timings()
+        try:
+            results = await self._run_batch([text for text, _, _ in batch])
+        except Exception as e:
+            logger.error(f"Batched inference failed: {str(e)}")
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            self._slots.release()
+            for _, _, timings in batch:
+                add_timings(timings, batch_timings)
+
+        for (_, future, _), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            # Only collect the next batch once a worker is free to run it
+            await self._slots.acquire()
+            batch = await self._collect()
+            # Drop requests whose callers have gone away (e.g. client disconnect)
+            batch = [item for item in batch if not item[1].done()]
+            if not batch:
+                self._slots.release()
+                continue
+            task = loop.create_task(self._dispatch(batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "inflight_batches": len(self._inflight),
+            "max_batch_size": self.max_batch_size,
+            "long_documents": self.long_documents,
+        }
+
+    async def close(self):
+        """
+        Stop the batching task; pending callers receive CancelledError
+        """
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        if self._inflight:
+            await asyncio.gather(*self._inflight, return_exceptions=True)
+        if self._queue is not None:
+            while not self._queue.empty():
+                _, future, _ = self._queue.get_nowait()
+                future.cancel()
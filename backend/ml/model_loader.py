@@ -1,24 +1,73 @@
 import torch
-from transformers import AutoTokenizer, AutoModelForSequenceClassification
+from transformers import AutoTokenizer
 import os
-from typing import Tuple
+import hashlib
+from typing import Dict, List, Sequence, Tuple, Union
+from backend.ml.backends import INFERENCE_BACKEND, load_backend_model
+from backend.services.metrics import BATCH_SIZE, timed
 
-def load_model():
+# Token-length buckets used for bulk classification
+LENGTH_BUCKETS = tuple(
+    int(b) for b in os.getenv("INFERENCE_LENGTH_BUCKETS", "64,128,256,512").split(",")
+)
+BUCKET_MAX_BATCH_SIZE = int(os.getenv("INFERENCE_BUCKET_BATCH_SIZE", "64"))
+
+# Long-document mode: score overlapping windows over the whole email instead
+# of only its first 512 tokens
+LONG_DOC_ENABLED = os.getenv("LONG_DOC_ENABLED", "false").lower() == "true"
+LONG_DOC_WINDOW_TOKENS = int(os.getenv("LONG_DOC_WINDOW_TOKENS", "256"))
+LONG_DOC_OVERLAP_TOKENS = int(os.getenv("LONG_DOC_OVERLAP_TOKENS", "64"))
+# Most tokens scored per email; caps its windows at budget // window
+LONG_DOC_TOKEN_BUDGET = int(os.getenv("LONG_DOC_TOKEN_BUDGET", "1024"))
+# Characters tokenized per email; longer emails keep their first and last
+# halves, so a huge body costs no more tokenizer time than this
+LONG_DOC_MAX_CHARS = int(os.getenv("LONG_DOC_MAX_CHARS", str(64 * 1024)))
+# max, mean or noisy_or over the windows' spam probabilities
+LONG_DOC_AGGREGATION = os.getenv("LONG_DOC_AGGREGATION", "max").lower()
+
+AGGREGATIONS = ("max", "mean", "noisy_or")
+
+# Update path to account for new directory structure
+MODEL_PATH = os.getenv(
+    "MODEL_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "content", "best_model")
+)
+
+def get_model_version(model_path: str = MODEL_PATH, backend: str = INFERENCE_BACKEND) -> str:
+    """
+    Identify the deployed model so cached predictions never outlive it
+    
+    Uses MODEL_VERSION from the environment if set, otherwise a digest of the
+    model files' names, sizes and modification times. The inference backend
+    is always part of the version, since quantized and exported models
+    produce slightly different confidences.
+    """
+    version = os.getenv("MODEL_VERSION")
+    if not version:
+        digest = hashlib.sha256()
+        if os.path.isdir(model_path):
+            for name in sorted(os.listdir(model_path)):
+                stat = os.stat(os.path.join(model_path, name))
+                digest.update(f"{name}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+        version = digest.hexdigest()[:16]
+    return f"{version}-{backend}"
+
+def load_model(backend: str = INFERENCE_BACKEND):
     """
     Load the trained BERT model and tokenizer
+    
+    Args:
+        backend: Inference backend, "torch" (fp32), "torch-int8" or "onnx";
+            defaults to the INFERENCE_BACKEND environment variable
     """
-    # Update path to account for new directory structure
-    model_path = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "content", "best_model")
+    model_path = MODEL_PATH
     
     if not os.path.exists(model_path):
         raise FileNotFoundError(f"Model not found at {model_path}")
     
-    # Load tokenizer and model
+    # Load tokenizer and model (returned in evaluation mode)
     tokenizer = AutoTokenizer.from_pretrained(model_path)
-    model = AutoModelForSequenceClassification.from_pretrained(model_path)
-    
-    # Set model to evaluation mode
-    model.eval()
+    model = load_backend_model(model_path, backend)
     
     return model, tokenizer
 
@@ -36,16 +85,17 @@ def predict_spam(model_tuple: Tuple, text: str) -> Tuple[bool, float]:
     model, tokenizer = model_tuple
     
     # Tokenize input
-    inputs = tokenizer(
-        text,
-        padding=True,
-        truncation=True,
-        max_length=512,
-        return_tensors="pt"
-    )
+    with timed("tokenize"):
+        inputs = tokenizer(
+            text,
+            padding=True,
+            truncation=True,
+            max_length=512,
+            return_tensors="pt"
+        )
     
     # Make prediction
-    with torch.no_grad():
+    with timed("infer"), torch.no_grad():
         outputs = model(**inputs)
         probabilities = torch.softmax(outputs.logits, dim=1)
         prediction = torch.argmax(probabilities, dim=1)
@@ -54,4 +104,263 @@ def predict_spam(model_tuple: Tuple, text: str) -> Tuple[bool, float]:
     # Assuming 1 is spam, 0 is not spam
     is_spam = bool(prediction.item())
     
-    return is_spam, confidence 
\ No newline at end of file
+    return is_spam, confidence
+
+def predict_spam_batch(model_tuple: Tuple, texts: List[str]) -> List[Tuple[bool, float]]:
+    """
+    Predict spam for several texts in a single padded forward pass
+    
+    Args:
+        model_tuple: Tuple containing (model, tokenizer)
+        texts: Texts to classify
+        
+    Returns:
+        List of (is_spam: bool, confidence: float), in the same order as texts
+    """
+    if not texts:
+        return []
+    
+    model, tokenizer = model_tuple
+    
+    # Pad to the longest text in the batch rather than to max_length
+    with timed("tokenize"):
+        inputs = tokenizer(
+            list(texts),
+            padding=True,
+            truncation=True,
+            max_length=512,
+            return_tensors="pt"
+        )
+    
+    return _forward(model, inputs)
+
+def _forward(model, inputs) -> List[Tuple[bool, float]]:
+    """
+    Run one forward pass over already tokenized, padded inputs
+    """
+    BATCH_SIZE.observe(len(inputs["input_ids"]))
+    with timed("infer"), torch.no_grad():
+        outputs = model(**inputs)
+        probabilities = torch.softmax(outputs.logits, dim=1)
+        confidences, predictions = torch.max(probabilities, dim=1)
+    
+    # Assuming 1 is spam, 0 is not spam
+    return [
+        (bool(prediction), float(confidence))
+        for prediction, confidence in zip(predictions.tolist(), confidences.tolist())
+    ]
+
+def predict_spam_bucketed(
+    model_tuple: Tuple,
+    texts: List[str],
+    buckets: Sequence[int] = LENGTH_BUCKETS,
+    max_batch_size: int = BUCKET_MAX_BATCH_SIZE
+) -> List[Union[Tuple[bool, float], Exception]]:
+    """
+    Predict spam for many texts, grouping them by token length so that short
+    texts are not padded out to the longest one
+    
+    Args:
+        model_tuple: Tuple containing (model, tokenizer)
+        texts: Texts to classify
+        buckets: Ascending token-length bucket upper bounds
+        max_batch_size: Maximum number of texts per forward pass
+        
+    Returns:
+        List in the same order as texts, holding (is_spam, confidence) or the
+        exception raised while scoring that text's batch
+    """
+    model, tokenizer = model_tuple
+    results: List[Union[Tuple[bool, float], Exception, None]] = [None] * len(texts)
+    if not texts:
+        return []
+    
+    # Tokenize once without padding to learn every text's length
+    with timed("tokenize"):
+        encodings = tokenizer(list(texts), truncation=True, max_length=512)
+    input_ids = encodings["input_ids"]
+    
+    grouped: Dict[int, List[int]] = {}
+    for index, ids in enumerate(input_ids):
+        bucket = next((b for b in buckets if len(ids) <= b), buckets[-1])
+        grouped.setdefault(bucket, []).append(index)
+    
+    for bucket in sorted(grouped):
+        indices = grouped[bucket]
+        for start in range(0, len(indices), max_batch_size):
+            chunk = indices[start:start + max_batch_size]
+            features = [
+                {key: encodings[key][i] for key in encodings.keys()}
+                for i in chunk
+            ]
+            try:
+                inputs = tokenizer.pad(features, padding=True, return_tensors="pt")
+                chunk_results = _forward(model, inputs)
+            except Exception as e:
+                chunk_results = [e] * len(chunk)
+            for i, result in zip(chunk, chunk_results):
+                results[i] = result
+    
+    return results
+
+def predict_function():
+    """
+    The batch scorer serving requests: predict_spam_windowed in
+    long-document mode, otherwise predict_spam_batch
+    """
+    return predict_spam_windowed if LONG_DOC_ENABLED else predict_spam_batch
+
+def split_windows(
+    ids: List[int],
+    window: int = LONG_DOC_WINDOW_TOKENS - 2,
+    overlap: int = LONG_DOC_OVERLAP_TOKENS,
+    max_windows: int = max(LONG_DOC_TOKEN_BUDGET // LONG_DOC_WINDOW_TOKENS, 1)
+) -> List[List[int]]:
+    """
+    Split a token stream into overlapping windows
+    
+    When covering the whole stream would take more than max_windows, the
+    windows are spread evenly over it instead, always keeping the first and
+    the last so both the start and the end of the email are scored.
+    
+    Args:
+        ids: Token ids without special tokens
+        window: Tokens per window
+        overlap: Tokens shared by neighbouring windows
+        max_windows: Most windows to return
+        
+    Returns:
+        Lists of token ids, in document order
+    """
+    if len(ids) <= window:
+        return [ids]
+    stride = max(window - overlap, 1)
+    starts = list(range(0, len(ids) - window, stride)) + [len(ids) - window]
+    if len(starts) > max_windows:
+        if max_windows == 1:
+            starts = starts[:1]
+        else:
+            last = len(starts) - 1
+            starts = [starts[round(i * last / (max_windows - 1))] for i in range(max_windows)]
+    return [ids[start:start + window] for start in starts]
+
+def clip_text(text: str, max_chars: int = LONG_DOC_MAX_CHARS) -> str:
+    """
+    Keep the start and the end of a text longer than max_chars, which are
+    also the parts split_windows always scores
+    """
+    if max_chars <= 0 or len(text) <= max_chars:
+        return text
+    head = max_chars // 2
+    return text[:head] + " " + text[len(text) - (max_chars - head):]
+
+def aggregate_windows(probabilities: Sequence[float], rule: str = LONG_DOC_AGGREGATION) -> float:
+    """
+    Combine the spam probabilities of one email's windows
+    
+    "max" flags the email if any window looks like spam, "mean" averages
+    them and "noisy_or" treats the windows as independent pieces of evidence.
+    """
+    if rule == "max":
+        return max(probabilities)
+    if rule == "mean":
+        return sum(probabilities) / len(probabilities)
+    if rule == "noisy_or":
+        ham = 1.0
+        for probability in probabilities:
+            ham *= 1.0 - probability
+        return 1.0 - ham
+    raise ValueError(f"Unknown aggregation {rule!r}, expected one of {', '.join(AGGREGATIONS)}")
+
+def predict_spam_windowed(
+    model_tuple: Tuple,
+    texts: List[str],
+    window_tokens: int = LONG_DOC_WINDOW_TOKENS,
+    overlap_tokens: int = LONG_DOC_OVERLAP_TOKENS,
+    token_budget: int = LONG_DOC_TOKEN_BUDGET,
+    aggregation: str = LONG_DOC_AGGREGATION,
+    max_batch_size: int = BUCKET_MAX_BATCH_SIZE,
+    max_chars: int = LONG_DOC_MAX_CHARS
+) -> List[Union[Tuple[bool, float], Exception]]:
+    """
+    Predict spam for whole emails by scoring overlapping token windows
+    
+    Texts longer than max_chars are clipped to their start and end before
+    tokenizing. Every email contributes at most token_budget // window_tokens windows;
+    the windows of all texts are scored together, up to max_batch_size per
+    forward pass, and each email's window scores are aggregated.
+    
+    Args:
+        model_tuple: Tuple containing (model, tokenizer)
+        texts: Texts to classify
+        window_tokens: Tokens per window, including [CLS] and [SEP]
+        overlap_tokens: Tokens shared by neighbouring windows
+        token_budget: Most tokens scored per email
+        aggregation: "max", "mean" or "noisy_or"
+        max_batch_size: Maximum number of windows per forward pass
+        max_chars: Most characters tokenized per email (0 for no limit)
+        
+    Returns:
+        List in the same order as texts, holding (is_spam, confidence) or the
+        exception raised while scoring one of that text's windows
+    """
+    if aggregation not in AGGREGATIONS:
+        raise ValueError(f"Unknown aggregation {aggregation!r}, expected one of {', '.join(AGGREGATIONS)}")
+    if not 2 < window_tokens <= 512:
+        raise ValueError("window_tokens must be between 3 and 512")
+    if not texts:
+        return []
+    
+    model, tokenizer = model_tuple
+    window = window_tokens - 2
+    max_windows = max(token_budget // window_tokens, 1)
+    with_token_types = "token_type_ids" in tokenizer.model_input_names
+    
+    # Tokenize each (clipped) text once; special tokens are added per window
+    with timed("tokenize"):
+        encodings = tokenizer(
+            [clip_text(text, max_chars) for text in texts],
+            add_special_tokens=False,
+            return_attention_mask=False,
+            return_token_type_ids=False,
+            verbose=False
+        )
+    
+    owners: List[int] = []
+    features: List[Dict[str, List[int]]] = []
+    for index, ids in enumerate(encodings["input_ids"]):
+        for chunk in split_windows(ids, window, overlap_tokens, max_windows):
+            feature = {"input_ids": [tokenizer.cls_token_id, *chunk, tokenizer.sep_token_id]}
+            if with_token_types:
+                feature["token_type_ids"] = [0] * len(feature["input_ids"])
+            features.append(feature)
+            owners.append(index)
+    
+    # Similar lengths share a forward pass. Every window of a long email is
+    # full length (the last one starts at len - window), so only emails
+    # shorter than one window produce shorter inputs
+    order = sorted(range(len(features)), key=lambda i: len(features[i]["input_ids"]))
+    probabilities: List[List[float]] = [[] for _ in texts]
+    errors: Dict[int, Exception] = {}
+    for start in range(0, len(order), max_batch_size):
+        chunk = order[start:start + max_batch_size]
+        try:
+            inputs = tokenizer.pad([features[i] for i in chunk], padding=True, return_tensors="pt")
+            chunk_results = _forward(model, inputs)
+        except Exception as e:
+            for i in chunk:
+                errors[owners[i]] = e
+            continue
+        for i, (is_spam, confidence) in zip(chunk, chunk_results):
+            probabilities[owners[i]].append(confidence if is_spam else 1.0 - confidence)
+    
+    results: List[Union[Tuple[bool, float], Exception]] = []
+    for index in range(len(texts)):
+        if index in errors:
+            results.append(errors[index])
+            continue
+        spam_probability = aggregate_windows(probabilities[index], aggregation)
+        is_spam = spam_probability >= 0.5
+        results.append((is_spam, spam_probability if is_spam else 1.0 - spam_probability))
+    
+    return results
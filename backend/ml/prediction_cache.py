@@ -0,0 +1,115 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from time import monotonic
+from typing import Dict, Optional, Tuple
+
+DEFAULT_MAX_ENTRIES = int(os.getenv("PREDICTION_CACHE_MAX_ENTRIES", "100000"))
+DEFAULT_TTL_SECONDS = float(os.getenv("PREDICTION_CACHE_TTL_SECONDS", "3600"))
+
+
+class PredictionCache:
+    """
+    Bounded LRU cache of (is_spam, confidence) keyed on a hash of the
+    processed email text and the model version.
+
+    Entries expire ttl_seconds after they were stored; a ttl of 0 disables
+    expiry and max_entries of 0 disables the cache entirely.
+    """
+
+    def __init__(
+        self,
+        model_version: str,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        ttl_seconds: float = DEFAULT_TTL_SECONDS,
+    ):
+        self.model_version = model_version
+        self.max_entries = max(max_entries, 0)
+        self.ttl = max(ttl_seconds, 0)
+        self._entries: "OrderedDict[bytes, Tuple[float, Tuple[bool, float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def key(self, processed_text: str) -> bytes:
+        """
+        Hash the processed text together with the model version
+        """
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(self.model_version.encode())
+        digest.update(b"\0")
+        digest.update(processed_text.encode("utf-8", "surrogatepass"))
+        return digest.digest()
+
+    def get(self, processed_text: str) -> Optional[Tuple[bool, float]]:
+        """
+        Return the cached prediction, or None on a miss
+        """
+        if not self.max_entries:
+            self.misses += 1
+            return None
+
+        key = self.key(processed_text)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            stored_at, prediction = entry
+            if self.ttl and monotonic() - stored_at > self.ttl:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return prediction
+
+    def peek(self, processed_text: str) -> Optional[Tuple[bool, float]]:
+        """
+        Return a live cached prediction without touching LRU order or counters
+        """
+        if not self.max_entries:
+            return None
+        with self._lock:
+            entry = self._entries.get(self.key(processed_text))
+        if entry is None or (self.ttl and monotonic() - entry[0] > self.ttl):
+            return None
+        return entry[1]
+
+    def put(self, processed_text: str, prediction: Tuple[bool, float]):
+        """
+        Store a prediction, evicting the least recently used entries
+        """
+        if not self.max_entries:
+            return
+
+        key = self.key(processed_text)
+        with self._lock:
+            self._entries[key] = (monotonic(), prediction)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
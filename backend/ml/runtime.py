@@ -0,0 +1,202 @@
+import asyncio
+import logging
+import os
+from time import perf_counter
+from typing import Dict, List, Optional, Set, Tuple, Union
+
+from backend.services.profiler import active_profile
+
+logger = logging.getLogger(__name__)
+
+# Approximate token lengths and batch sizes used to warm the model up
+WARMUP_LENGTHS = tuple(int(n) for n in os.getenv("WARMUP_LENGTHS", "16,128,512").split(","))
+WARMUP_BATCH_SIZES = tuple(int(n) for n in os.getenv("WARMUP_BATCH_SIZES", "1,8").split(","))
+
+
+class ModelRuntime:
+    """
+    Owns the classifier, its micro-batching engine and the prediction cache.
+
+    Nothing heavy (torch, transformers) is imported until start() runs, so
+    importing the API stays fast; ready only turns true once the model has
+    been loaded and has served warmup batches at typical lengths.
+    """
+
+    def __init__(self):
+        self.model = None
+        self.engine = None
+        self.cache = None
+        self.cascade = None
+        self.phase = "pending"
+        self.ready = False
+        self.error: Optional[str] = None
+        self.timings: Dict[str, float] = {}
+        self._background: Set[asyncio.Task] = set()
+
+    def _timed(self, phase: str, started: float):
+        self.timings[phase] = round(perf_counter() - started, 3)
+        logger.info(f"Startup phase {phase} took {self.timings[phase]:.3f}s")
+
+    def _load(self):
+        """
+        Import the ML stack and load the model (blocking)
+        """
+        self.phase = "importing"
+        started = perf_counter()
+        from backend.ml import model_loader
+        from backend.ml.cascade import load_cascade
+        from backend.ml.inference_engine import InferenceEngine
+        from backend.ml.prediction_cache import PredictionCache
+        self._timed("import", started)
+
+        self.phase = "loading"
+        started = perf_counter()
+        self.model = model_loader.load_model()
+        self.engine = InferenceEngine(self.model)
+        self.cache = PredictionCache(model_loader.get_model_version())
+        self._timed("load_model", started)
+
+        started = perf_counter()
+        self.cascade = load_cascade()
+        if self.cascade is not None:
+            self._timed("load_cascade", started)
+
+    async def _warmup(self):
+        from backend.ml.executor import run_inference
+        from backend.ml.model_loader import predict_function
+
+        self.phase = "warming"
+        started = perf_counter()
+        predict = predict_function()
+        for length in WARMUP_LENGTHS:
+            text = " ".join(["warmup"] * length)
+            for batch_size in WARMUP_BATCH_SIZES:
+                await run_inference(predict, self.model, [text] * batch_size)
+        self._timed("warmup", started)
+
+    async def start(self):
+        """
+        Load and warm the model without blocking the event loop
+        """
+        started = perf_counter()
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self._load)
+            await self._warmup()
+        except Exception as e:
+            self.phase = "failed"
+            self.error = str(e)
+            logger.error(f"Model startup failed: {str(e)}")
+            return
+        self._timed("total", started)
+        self.phase = "ready"
+        self.ready = True
+
+    async def _shadow(self, text: str, lexical: Tuple[bool, float]):
+        """
+        Score a lexically decided email with BERT to measure disagreement
+        """
+        try:
+            self.cascade.record_shadow(lexical, await self._classify_bert(text))
+        except Exception as e:
+            logger.warning(f"Cascade shadow scoring failed: {str(e)}")
+
+    def _start_shadow(self, text: str, lexical: Tuple[bool, float]):
+        task = asyncio.get_running_loop().create_task(self._shadow(text, lexical))
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def _classify_bert(self, processed_content: str) -> Tuple[bool, float]:
+        cached = self.cache.get(processed_content)
+        if cached is not None:
+            return cached
+        profile = active_profile()
+        if profile is not None and profile.torch_trace:
+            # Run alone under the torch profiler instead of in a shared batch
+            from backend.ml.executor import run_inference
+            from backend.ml.model_loader import predict_function
+            prediction = (await run_inference(
+                profile.run_with_torch_profiler, predict_function(), self.model, [processed_content]
+            ))[0]
+            if isinstance(prediction, Exception):
+                raise prediction
+        else:
+            prediction = await self.engine.predict(processed_content)
+        self.cache.put(processed_content, prediction)
+        return prediction
+
+    async def classify(self, processed_content: str) -> Tuple[bool, float]:
+        """
+        Classify processed email text: prediction cache, then the lexical
+        cascade tier (if enabled), then BERT
+        """
+        if self.cascade is not None and self.cache.peek(processed_content) is None:
+            decision = self.cascade.decide([processed_content])[0]
+            if decision is not None:
+                if self.cascade.should_shadow():
+                    self._start_shadow(processed_content, decision)
+                return decision
+        return await self._classify_bert(processed_content)
+
+    async def classify_many(
+        self, texts: List[str]
+    ) -> List[Union[Tuple[bool, float], Exception]]:
+        """
+        Classify many processed texts; cache misses the lexical tier cannot
+        decide are scored with one forward pass per token-length bucket (or
+        per batch of windows in long-document mode)
+
+        Returns:
+            List in input order of (is_spam, confidence) or the exception
+            raised while scoring that text
+        """
+        from backend.ml.executor import run_inference
+        from backend.ml.model_loader import LONG_DOC_ENABLED, predict_spam_bucketed, predict_spam_windowed
+
+        results: List[Union[Tuple[bool, float], Exception, None]] = [None] * len(texts)
+        pending = []
+        for index, text in enumerate(texts):
+            prediction = self.cache.get(text)
+            if prediction is not None:
+                results[index] = prediction
+            else:
+                pending.append(index)
+
+        if self.cascade is not None and pending:
+            decisions = self.cascade.decide([texts[i] for i in pending])
+            undecided = []
+            for index, decision in zip(pending, decisions):
+                if decision is None:
+                    undecided.append(index)
+                    continue
+                results[index] = decision
+                if self.cascade.should_shadow():
+                    self._start_shadow(texts[index], decision)
+            pending = undecided
+
+        predict = predict_spam_windowed if LONG_DOC_ENABLED else predict_spam_bucketed
+        predictions = await run_inference(predict, self.model, [texts[i] for i in pending])
+        for index, prediction in zip(pending, predictions):
+            if not isinstance(prediction, Exception):
+                self.cache.put(texts[index], prediction)
+            results[index] = prediction
+
+        return results
+
+    async def close(self):
+        if self._background:
+            await asyncio.gather(*self._background, return_exceptions=True)
+        if self.engine is not None:
+            await self.engine.close()
+        if self.model is not None:
+            from backend.ml.executor import shutdown_executor
+            shutdown_executor()
+        self.ready = False
+        self.phase = "stopped"
+
+    def status(self) -> Dict:
+        return {
+            "ready": self.ready,
+            "phase": self.phase,
+            "error": self.error,
+            "timings": self.timings,
+        }
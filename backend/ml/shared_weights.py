@@ -0,0 +1,180 @@
+import fcntl
+import json
+import logging
+import mmap
+import os
+import shutil
+import struct
+from contextlib import contextmanager
+from typing import Dict
+
+import torch
+from transformers import AutoConfig, AutoModelForSequenceClassification
+
+logger = logging.getLogger(__name__)
+
+# private: every worker loads its own copy of the weights (from_pretrained)
+# mmap:    workers map <model>/model.safetensors; the weights are shared
+#          page-cache pages, read from disk once
+# shm:     like mmap, but the file is first copied once to MODEL_SHM_DIR
+#          (tmpfs), so the shared pages are never evicted and reread
+MODEL_WEIGHTS_MODE = os.getenv("MODEL_WEIGHTS_MODE", "private").lower()
+MODEL_SHM_DIR = os.getenv("MODEL_SHM_DIR", "/dev/shm/spam-filter-model")
+SAFETENSORS_FILENAME = "model.safetensors"
+
+WEIGHTS_MODES = ("private", "mmap", "shm")
+
+_DTYPES = {
+    "F64": torch.float64,
+    "F32": torch.float32,
+    "F16": torch.float16,
+    "BF16": torch.bfloat16,
+    "I64": torch.int64,
+    "I32": torch.int32,
+    "I16": torch.int16,
+    "I8": torch.int8,
+    "U8": torch.uint8,
+    "BOOL": torch.bool,
+}
+
+
+def map_safetensors(path: str) -> Dict[str, torch.Tensor]:
+    """
+    Map a safetensors file into memory without copying it
+
+    The tensors are views of a private (copy-on-write) mapping: as long as
+    nobody writes to them, every process mapping the same file shares the
+    same physical pages.
+
+    Returns:
+        Tensor name -> tensor backed by the mapping
+    """
+    with open(path, "rb") as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+    (header_size,) = struct.unpack_from("<Q", buffer, 0)
+    header = json.loads(buffer[8:8 + header_size])
+    header.pop("__metadata__", None)
+    data_start = 8 + header_size
+
+    tensors = {}
+    for name, info in header.items():
+        dtype = _DTYPES.get(info["dtype"])
+        if dtype is None:
+            raise ValueError(f"Unsupported dtype {info['dtype']} for {name} in {path}")
+        begin, end = info["data_offsets"]
+        count = (end - begin) // torch.empty((), dtype=dtype).element_size()
+        if count == 0:
+            tensors[name] = torch.empty(info["shape"], dtype=dtype)
+            continue
+        tensors[name] = torch.frombuffer(
+            buffer, dtype=dtype, count=count, offset=data_start + begin
+        ).view(info["shape"])
+    return tensors
+
+
+def stage_in_shm(path: str, shm_dir: str = MODEL_SHM_DIR) -> str:
+    """
+    Copy the weights file to shared memory once per host
+
+    Workers starting together take a lock; the first one copies, the rest
+    find the copy (same size and mtime) already there.
+
+    Returns:
+        Path of the copy
+    """
+    os.makedirs(shm_dir, exist_ok=True)
+    target = os.path.join(shm_dir, os.path.basename(path))
+    source = os.stat(path)
+    with open(os.path.join(shm_dir, ".lock"), "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            if os.path.exists(target):
+                staged = os.stat(target)
+                if staged.st_size == source.st_size and staged.st_mtime_ns == source.st_mtime_ns:
+                    return target
+            shutil.copyfile(path, target + ".tmp")
+            os.utime(target + ".tmp", ns=(source.st_atime_ns, source.st_mtime_ns))
+            os.replace(target + ".tmp", target)
+            logger.info(f"Copied {path} to {target}")
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+    return target
+
+
+@contextmanager
+def _parameters_on_meta():
+    """
+    Create parameters on the meta device (no memory, no initialisation)
+    while buffers, e.g. position ids, are still built normally
+    """
+    register_parameter = torch.nn.Module.register_parameter
+
+    def register_on_meta(module, name, param):
+        if param is not None:
+            param = torch.nn.Parameter(param.to("meta"), requires_grad=param.requires_grad)
+        register_parameter(module, name, param)
+
+    torch.nn.Module.register_parameter = register_on_meta
+    try:
+        yield
+    finally:
+        torch.nn.Module.register_parameter = register_parameter
+
+
+def load_shared_model(model_path: str, mode: str = MODEL_WEIGHTS_MODE):
+    """
+    Build the classifier around memory-mapped weights
+
+    Args:
+        model_path: Directory holding config.json and model.safetensors
+        mode: "mmap" or "shm"
+
+    Returns:
+        The model in evaluation mode, with parameters that share the
+        mapped pages
+    """
+    if mode not in WEIGHTS_MODES or mode == "private":
+        raise ValueError(f"Unknown weights mode {mode!r}, expected mmap or shm")
+    weights = os.path.join(model_path, SAFETENSORS_FILENAME)
+    if not os.path.exists(weights):
+        raise FileNotFoundError(
+            f"{weights} not found; run `python -m backend.ml.convert export-safetensors` first"
+        )
+    if mode == "shm":
+        weights = stage_in_shm(weights)
+
+    config = AutoConfig.from_pretrained(model_path)
+    with _parameters_on_meta():
+        model = AutoModelForSequenceClassification.from_config(config)
+    state = map_safetensors(weights)
+    # assign=True keeps the mapped tensors instead of copying into new ones
+    _, unexpected = model.load_state_dict(state, strict=False, assign=True)
+    # safetensors stores tied weights once
+    model.tie_weights()
+    still_meta = [name for name, param in model.named_parameters() if param.is_meta]
+    if still_meta:
+        raise ValueError(f"{weights} has no weights for {still_meta}")
+    if unexpected:
+        logger.warning(f"Ignoring unexpected weights in {weights}: {unexpected}")
+    for param in model.parameters():
+        param.requires_grad_(False)
+    model.eval()
+    logger.info(f"Mapped model weights from {weights} ({mode})")
+    return model
+
+
+def export_safetensors(model_path: str) -> str:
+    """
+    Write <model_path>/model.safetensors from whatever checkpoint
+    from_pretrained finds there
+
+    Returns:
+        Path of the written file
+    """
+    from safetensors.torch import save_model
+
+    model = AutoModelForSequenceClassification.from_pretrained(model_path)
+    output = os.path.join(model_path, SAFETENSORS_FILENAME)
+    save_model(model, output + ".tmp", metadata={"format": "pt"})
+    os.replace(output + ".tmp", output)
+    return output
@@ -1,5 +1,6 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, Float, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, Date, Boolean, Float, ForeignKey, Index
 from sqlalchemy.sql import func
+from datetime import datetime, timezone
 from sqlalchemy.orm import relationship
 from backend.database.database import Base
 
@@ -27,8 +28,34 @@ class Email(Base):
     recipient_id = Column(Integer, ForeignKey("users.id"))
     is_spam = Column(Boolean, default=False)
     spam_confidence = Column(Float)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Stamped by the application so keyset cursors compare exactly on every backend
+    created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), server_default=func.now())
     
     # Relationships
     sender = relationship("User", back_populates="sent_emails", foreign_keys=[sender_id])
-    recipient = relationship("User", back_populates="received_emails", foreign_keys=[recipient_id]) 
\ No newline at end of file
+    recipient = relationship("User", back_populates="received_emails", foreign_keys=[recipient_id])
+
+    # Mailbox listings filter on sender/recipient and page on created_at
+    __table_args__ = (
+        Index("ix_emails_recipient_spam_created", "recipient_id", "is_spam", "created_at"),
+        Index("ix_emails_sender_created", "sender_id", "created_at"),
+    ) 
+
+class UserEmailStats(Base):
+    """Running mailbox totals per user, maintained alongside Email inserts"""
+    __tablename__ = "user_email_stats"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    sent = Column(Integer, nullable=False, default=0)
+    received = Column(Integer, nullable=False, default=0)
+    spam_received = Column(Integer, nullable=False, default=0)
+
+class UserEmailDaily(Base):
+    """Per-user mailbox counts for one UTC day"""
+    __tablename__ = "user_email_daily"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    sent = Column(Integer, nullable=False, default=0)
+    received = Column(Integer, nullable=False, default=0)
+    spam_received = Column(Integer, nullable=False, default=0)
@@ -0,0 +1,189 @@
+import glob
+import gzip
+import json
+import logging
+import os
+import shutil
+import threading
+from collections import deque
+from datetime import datetime
+from time import monotonic
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Records held in memory before the overflow policy applies
+AUDIT_BUFFER_RECORDS = int(os.getenv("AUDIT_BUFFER_RECORDS", "10000"))
+# The writer flushes once this many records are pending or AUDIT_FLUSH_SECONDS pass
+AUDIT_FLUSH_RECORDS = int(os.getenv("AUDIT_FLUSH_RECORDS", "256"))
+AUDIT_FLUSH_SECONDS = float(os.getenv("AUDIT_FLUSH_SECONDS", "1.0"))
+# "drop" discards the oldest buffered record when full (bounded loss),
+# "block" makes the caller wait for the writer
+AUDIT_OVERFLOW = os.getenv("AUDIT_OVERFLOW", "drop").lower()
+# "never" leaves durability to the OS, "batch" fsyncs after every flush
+AUDIT_FSYNC = os.getenv("AUDIT_FSYNC", "never").lower()
+AUDIT_ROTATE_BYTES = int(os.getenv("AUDIT_ROTATE_BYTES", str(100 * 1024 * 1024)))
+AUDIT_COMPRESS = os.getenv("AUDIT_COMPRESS", "true").lower() == "true"
+
+
+class AuditLogger:
+    """
+    Buffered JSON Lines audit log.
+
+    log() only appends to an in-memory ring buffer; a background thread
+    writes the records in batches, one write() per batch, to a file per day
+    and per worker process. Files are rotated by date or size and rotated
+    files are gzipped.
+    """
+
+    def __init__(
+        self,
+        folder: str,
+        buffer_records: int = AUDIT_BUFFER_RECORDS,
+        flush_records: int = AUDIT_FLUSH_RECORDS,
+        flush_seconds: float = AUDIT_FLUSH_SECONDS,
+        overflow: str = AUDIT_OVERFLOW,
+        fsync: str = AUDIT_FSYNC,
+        rotate_bytes: int = AUDIT_ROTATE_BYTES,
+        compress: bool = AUDIT_COMPRESS,
+    ):
+        if overflow not in ("drop", "block"):
+            raise ValueError("overflow must be 'drop' or 'block'")
+        if fsync not in ("never", "batch"):
+            raise ValueError("fsync must be 'never' or 'batch'")
+        os.makedirs(folder, exist_ok=True)
+        self.folder = folder
+        self.buffer_records = buffer_records
+        self.flush_records = flush_records
+        self.flush_seconds = flush_seconds
+        self.overflow = overflow
+        self.fsync = fsync
+        self.rotate_bytes = rotate_bytes
+        self.compress = compress
+
+        self._buffer: deque = deque()
+        self._condition = threading.Condition()
+        self._closed = False
+        self._file = None
+        self._path: Optional[str] = None
+        self._day: Optional[str] = None
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+
+        self._thread = threading.Thread(target=self._run, name="audit-log-writer", daemon=True)
+        self._thread.start()
+
+    def log(self, action: str, email_data: Dict[str, Any], **extra):
+        """
+        Queue one audit record; never touches the file system
+        """
+        record = {
+            "timestamp": datetime.now().isoformat(),
+            "action": action,
+            "sender": email_data.get("sender", ""),
+            "recipient": email_data.get("recipient", ""),
+            "subject": email_data.get("subject", ""),
+            **extra,
+        }
+        with self._condition:
+            if self._closed:
+                return
+            if len(self._buffer) >= self.buffer_records:
+                if self.overflow == "drop":
+                    self._buffer.popleft()
+                    self.dropped += 1
+                else:
+                    while len(self._buffer) >= self.buffer_records and not self._closed:
+                        self._condition.notify_all()
+                        self._condition.wait()
+            self._buffer.append(record)
+            if len(self._buffer) >= self.flush_records:
+                self._condition.notify_all()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                deadline = monotonic() + self.flush_seconds
+                while len(self._buffer) < self.flush_records and not self._closed:
+                    remaining = deadline - monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                batch = list(self._buffer)
+                self._buffer.clear()
+                closed = self._closed
+                # Wake producers blocked on a full buffer
+                self._condition.notify_all()
+
+            if batch:
+                try:
+                    self._write(batch)
+                except Exception as e:
+                    logger.error(f"Audit log write failed, {len(batch)} records lost: {str(e)}")
+                    with self._condition:
+                        self.dropped += len(batch)
+            if closed:
+                break
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _open(self, day: str):
+        if self._file is not None:
+            self._file.close()
+            self._rotated(self._path)
+        self._day = day
+        self._path = os.path.join(self.folder, f"audit-{day}-{os.getpid()}.jsonl")
+        self._file = open(self._path, "ab")
+
+    def _rotated(self, path: str):
+        """
+        Move a finished file aside under the next free sequence number
+        """
+        if not os.path.exists(path):
+            return
+        stem = path[:-len(".jsonl")]
+        sequence = len(glob.glob(f"{stem}.*.jsonl*")) + 1
+        target = f"{stem}.{sequence}.jsonl"
+        os.rename(path, target)
+        if self.compress:
+            with open(target, "rb") as source, gzip.open(target + ".gz", "wb") as destination:
+                shutil.copyfileobj(source, destination)
+            os.remove(target)
+
+    def _write(self, batch):
+        day = datetime.now().strftime("%Y%m%d")
+        if self._file is None or day != self._day:
+            self._open(day)
+        elif self._file.tell() >= self.rotate_bytes:
+            self._open(day)
+
+        data = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in batch)
+        self._file.write(data.encode("utf-8"))
+        self._file.flush()
+        if self.fsync == "batch":
+            os.fsync(self._file.fileno())
+        with self._condition:
+            self.written += len(batch)
+            self.batches += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._condition:
+            return {
+                "written": self.written,
+                "dropped": self.dropped,
+                "batches": self.batches,
+                "pending": len(self._buffer),
+            }
+
+    def close(self):
+        """
+        Flush everything still buffered and stop the writer
+        """
+        with self._condition:
+            if self._closed:
+                return
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join()
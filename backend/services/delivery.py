@@ -0,0 +1,517 @@
+import asyncio
+import logging
+import os
+import random
+import sqlite3
+import ssl
+import threading
+from time import time
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# "queue" delivers through the SMTP worker pool, "sendmail" forks sendmail -t
+DELIVERY_MODE = os.getenv("DELIVERY_MODE", "queue").lower()
+DELIVERY_QUEUE_PATH = os.getenv("DELIVERY_QUEUE_PATH", "/var/spool/mail/queue/delivery.db")
+DELIVERY_SMTP_HOST = os.getenv("DELIVERY_SMTP_HOST", "localhost")
+DELIVERY_SMTP_PORT = int(os.getenv("DELIVERY_SMTP_PORT", "25"))
+# "none", "starttls" or "ssl" (implicit TLS)
+DELIVERY_SMTP_TLS = os.getenv("DELIVERY_SMTP_TLS", "none").lower()
+DELIVERY_SMTP_USERNAME = os.getenv("DELIVERY_SMTP_USERNAME", "")
+DELIVERY_SMTP_PASSWORD = os.getenv("DELIVERY_SMTP_PASSWORD", "")
+DELIVERY_SMTP_TIMEOUT = float(os.getenv("DELIVERY_SMTP_TIMEOUT", "30"))
+DELIVERY_WORKERS = int(os.getenv("DELIVERY_WORKERS", "4"))
+DELIVERY_MAX_ATTEMPTS = int(os.getenv("DELIVERY_MAX_ATTEMPTS", "8"))
+DELIVERY_BACKOFF_BASE = float(os.getenv("DELIVERY_BACKOFF_BASE", "30"))
+DELIVERY_BACKOFF_MAX = float(os.getenv("DELIVERY_BACKOFF_MAX", "3600"))
+# Connections idle for longer than this are closed instead of reused
+DELIVERY_IDLE_SECONDS = float(os.getenv("DELIVERY_IDLE_SECONDS", "60"))
+# A claimed message whose worker died is retried after this many seconds
+DELIVERY_LEASE_SECONDS = float(os.getenv("DELIVERY_LEASE_SECONDS", "600"))
+
+
+def build_message(email_data: Dict[str, str]) -> bytes:
+    """
+    Render email data the same way the sendmail path does, with CRLF endings
+    """
+    message = (
+        f"From: {email_data['sender']}\n"
+        f"To: {email_data['recipient']}\n"
+        f"Subject: {email_data['subject']}\n"
+        f"\n"
+        f"{email_data['content']}\n"
+    )
+    return message.replace("\r\n", "\n").replace("\n", "\r\n").encode("utf-8")
+
+
+class DeliveryQueue:
+    """
+    Durable SQLite spool of outgoing messages, safe to share between the
+    uvicorn worker processes; messages are claimed with a lease so a crashed
+    worker's messages are picked up again
+    """
+
+    def __init__(self, path: str = DELIVERY_QUEUE_PATH):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS deliveries (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                sender TEXT NOT NULL,
+                recipients TEXT NOT NULL,
+                message BLOB NOT NULL,
+                status TEXT NOT NULL DEFAULT 'queued',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt REAL NOT NULL,
+                claimed_until REAL,
+                last_error TEXT,
+                created_at REAL NOT NULL
+            )
+            """
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS ix_deliveries_due ON deliveries (status, next_attempt)"
+        )
+
+    def enqueue(self, sender: str, recipients: List[str], message: bytes) -> int:
+        now = time()
+        with self._lock:
+            cursor = self._db.execute(
+                "INSERT INTO deliveries (sender, recipients, message, next_attempt, created_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (sender, "\n".join(recipients), message, now, now),
+            )
+            return cursor.lastrowid
+
+    def claim(self, limit: int) -> List[Tuple[int, str, List[str], bytes, int]]:
+        """
+        Atomically lease up to limit due messages
+        """
+        now = time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._db.execute(
+                    "SELECT id, sender, recipients, message, attempts FROM deliveries "
+                    "WHERE (status = 'queued' AND next_attempt <= ?) "
+                    "OR (status = 'sending' AND claimed_until <= ?) "
+                    "ORDER BY next_attempt LIMIT ?",
+                    (now, now, limit),
+                ).fetchall()
+                self._db.executemany(
+                    "UPDATE deliveries SET status = 'sending', claimed_until = ? WHERE id = ?",
+                    [(now + DELIVERY_LEASE_SECONDS, row[0]) for row in rows],
+                )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        return [(i, s, r.split("\n"), m, a) for i, s, r, m, a in rows]
+
+    def delivered(self, message_id: int):
+        with self._lock:
+            self._db.execute("DELETE FROM deliveries WHERE id = ?", (message_id,))
+
+    def retry(self, message_id: int, attempts: int, delay: float, error: str, recipients: Optional[List[str]] = None):
+        """
+        Requeue a message, optionally for only some of its recipients
+        """
+        with self._lock:
+            self._db.execute(
+                "UPDATE deliveries SET status = 'queued', attempts = ?, next_attempt = ?, "
+                "claimed_until = NULL, last_error = ?, recipients = COALESCE(?, recipients) WHERE id = ?",
+                (attempts, time() + delay, error, None if recipients is None else "\n".join(recipients), message_id),
+            )
+
+    def failed(self, message_id: int, attempts: int, error: str, recipients: Optional[List[str]] = None):
+        with self._lock:
+            self._db.execute(
+                "UPDATE deliveries SET status = 'failed', attempts = ?, claimed_until = NULL, "
+                "last_error = ?, recipients = COALESCE(?, recipients) WHERE id = ?",
+                (attempts, error, None if recipients is None else "\n".join(recipients), message_id),
+            )
+
+    def next_due(self) -> Optional[float]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT MIN(next_attempt) FROM deliveries WHERE status = 'queued'"
+            ).fetchone()
+        return row[0]
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT status, COUNT(*) FROM deliveries GROUP BY status"
+            ).fetchall()
+        return dict(rows)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class SMTPError(Exception):
+    def __init__(self, code: int, message: str):
+        super().__init__(f"{code} {message}")
+        self.code = code
+        self.permanent = 500 <= code < 600
+
+
+class SMTPConnection:
+    """
+    Minimal asyncio SMTP client supporting PIPELINING, STARTTLS and AUTH PLAIN
+    """
+
+    def __init__(self, host: str, port: int, tls: str, username: str, password: str, timeout: float):
+        self.host = host
+        self.port = port
+        self.tls = tls
+        self.username = username
+        self.password = password
+        self.timeout = timeout
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.extensions: Dict[str, str] = {}
+        self.last_used = 0.0
+
+    async def _read_reply(self) -> Tuple[int, str]:
+        lines = []
+        while True:
+            line = await asyncio.wait_for(self.reader.readline(), self.timeout)
+            if not line:
+                raise ConnectionError("SMTP server closed the connection")
+            text = line.decode("utf-8", "replace").rstrip("\r\n")
+            lines.append(text[4:])
+            if len(text) < 4 or text[3] != "-":
+                return int(text[:3]), "\n".join(lines)
+
+    async def _expect(self, *codes: int) -> str:
+        code, message = await self._read_reply()
+        if code not in codes:
+            raise SMTPError(code, message)
+        return message
+
+    async def _command(self, line: str, *codes: int) -> str:
+        self.writer.write(line.encode() + b"\r\n")
+        await self.writer.drain()
+        return await self._expect(*codes)
+
+    async def _ehlo(self):
+        message = await self._command("EHLO spam-filter", 250)
+        self.extensions = {}
+        for line in message.split("\n")[1:]:
+            keyword, _, parameters = line.partition(" ")
+            self.extensions[keyword.upper()] = parameters
+
+    async def connect(self):
+        context = ssl.create_default_context() if self.tls in ("ssl", "starttls") else None
+        self.reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(
+                self.host, self.port, ssl=context if self.tls == "ssl" else None
+            ),
+            self.timeout,
+        )
+        await self._expect(220)
+        await self._ehlo()
+
+        if self.tls == "starttls":
+            if "STARTTLS" not in self.extensions:
+                raise SMTPError(530, "Server does not offer STARTTLS")
+            await self._command("STARTTLS", 220)
+            # StreamWriter.start_tls is available from Python 3.11
+            await self.writer.start_tls(context, server_hostname=self.host)
+            await self._ehlo()
+
+        if self.username:
+            import base64
+            token = base64.b64encode(f"\0{self.username}\0{self.password}".encode()).decode()
+            await self._command(f"AUTH PLAIN {token}", 235)
+        self.last_used = time()
+
+    @property
+    def usable(self) -> bool:
+        return (
+            self.writer is not None
+            and not self.writer.is_closing()
+            and time() - self.last_used < DELIVERY_IDLE_SECONDS
+        )
+
+    async def send(self, sender: str, recipients: List[str], message: bytes) -> Dict[str, SMTPError]:
+        """
+        Send one message; MAIL and RCPT are pipelined when supported, DATA
+        is only sent once at least one recipient was accepted
+
+        Returns:
+            The recipients the server refused, with its reply; the message
+            was delivered to all the others
+
+        Raises:
+            SMTPError: MAIL, DATA or the end of data failed, so no
+                recipient got the message
+        """
+        commands = [f"MAIL FROM:<{sender}>"] + [f"RCPT TO:<{r}>" for r in recipients]
+
+        if "PIPELINING" in self.extensions:
+            self.writer.write("".join(c + "\r\n" for c in commands).encode())
+            await self.writer.drain()
+            replies = [await self._read_reply() for _ in commands]
+        else:
+            replies = []
+            for command in commands:
+                self.writer.write(command.encode() + b"\r\n")
+                await self.writer.drain()
+                replies.append(await self._read_reply())
+                if len(replies) == 1 and replies[0][0] != 250:
+                    break
+
+        code, text = replies[0]
+        if code != 250:
+            await self._command("RSET", 250)
+            raise SMTPError(code, text)
+        refused = {
+            recipient: SMTPError(code, text)
+            for recipient, (code, text) in zip(recipients, replies[1:])
+            if code not in (250, 251)
+        }
+        if len(refused) == len(recipients):
+            await self._command("RSET", 250)
+            return refused
+
+        try:
+            await self._command("DATA", 354)
+        except SMTPError:
+            await self._command("RSET", 250)
+            raise
+
+        # Dot-stuff lines starting with "." and terminate the data
+        body = message.replace(b"\r\n.", b"\r\n..")
+        if body.startswith(b"."):
+            body = b"." + body
+        if not body.endswith(b"\r\n"):
+            body += b"\r\n"
+        self.writer.write(body + b".\r\n")
+        await self.writer.drain()
+        await self._expect(250)
+        self.last_used = time()
+        return refused
+
+    async def close(self):
+        if self.writer is not None:
+            try:
+                self.writer.write(b"QUIT\r\n")
+                await self.writer.drain()
+            except Exception:
+                pass
+            self.writer.close()
+            self.writer = None
+
+
+class SMTPConnectionPool:
+    """
+    Bounded pool of persistent SMTP connections to the relay
+    """
+
+    def __init__(
+        self,
+        size: int = DELIVERY_WORKERS,
+        host: str = DELIVERY_SMTP_HOST,
+        port: int = DELIVERY_SMTP_PORT,
+        tls: str = DELIVERY_SMTP_TLS,
+        username: str = DELIVERY_SMTP_USERNAME,
+        password: str = DELIVERY_SMTP_PASSWORD,
+        timeout: float = DELIVERY_SMTP_TIMEOUT,
+    ):
+        self.settings = (host, port, tls, username, password, timeout)
+        self._idle: List[SMTPConnection] = []
+        self._slots = asyncio.Semaphore(size)
+        self.opened = 0
+
+    async def acquire(self) -> SMTPConnection:
+        await self._slots.acquire()
+        while self._idle:
+            connection = self._idle.pop()
+            if connection.usable:
+                return connection
+            await connection.close()
+        connection = SMTPConnection(*self.settings)
+        try:
+            await connection.connect()
+        except BaseException:
+            self._slots.release()
+            raise
+        self.opened += 1
+        return connection
+
+    async def release(self, connection: SMTPConnection, healthy: bool = True):
+        if healthy:
+            self._idle.append(connection)
+        else:
+            await connection.close()
+        self._slots.release()
+
+    async def close(self):
+        while self._idle:
+            await self._idle.pop().close()
+
+
+class DeliveryService:
+    """
+    Delivers queued messages with a pool of workers sharing persistent SMTP
+    connections, retrying temporary failures with exponential backoff.
+    Recipients refused with a temporary error are retried on their own,
+    so the ones that were accepted never get the message twice.
+    """
+
+    def __init__(self, queue: Optional[DeliveryQueue] = None, workers: int = DELIVERY_WORKERS, pool=None):
+        self.queue = queue or DeliveryQueue()
+        self.workers = max(workers, 1)
+        self.pool = pool
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._tasks: List[asyncio.Task] = []
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+        self.refused_recipients = 0
+
+    async def _queue_call(self, func, *args):
+        # SQLite calls may wait on the file lock (BEGIN IMMEDIATE, busy
+        # timeout), so they never run on the event loop
+        return await self._loop.run_in_executor(None, func, *args)
+
+    def enqueue(self, email_data: Dict[str, str], message: Optional[bytes] = None) -> int:
+        """
+        Durably queue a message for delivery and wake a worker (blocking;
+        callers on the event loop run it in an executor)
+
+        Args:
+            email_data: Envelope sender and comma separated recipients, plus
+                subject and content when message is not given
+            message: Original RFC 822 message to deliver as is (line endings
+                are normalised to CRLF)
+        """
+        recipients = [r.strip() for r in email_data["recipient"].split(",") if r.strip()]
+        if message is None:
+            message = build_message(email_data)
+        else:
+            message = message.replace(b"\r\n", b"\n").replace(b"\n", b"\r\n")
+        message_id = self.queue.enqueue(email_data["sender"], recipients, message)
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+        return message_id
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        if self.pool is None:
+            self.pool = SMTPConnectionPool(size=self.workers)
+        self._tasks = [self._loop.create_task(self._worker()) for _ in range(self.workers)]
+        logger.info(f"Delivery service started with {self.workers} worker(s)")
+
+    def _backoff(self, attempts: int) -> float:
+        delay = min(DELIVERY_BACKOFF_BASE * 2 ** (attempts - 1), DELIVERY_BACKOFF_MAX)
+        return delay * random.uniform(0.8, 1.2)
+
+    async def _deliver(self, message_id: int, sender: str, recipients: List[str], message: bytes, attempts: int):
+        attempts += 1
+        connection = None
+        try:
+            connection = await self.pool.acquire()
+            try:
+                refused = await connection.send(sender, recipients, message)
+            except SMTPError:
+                await self.pool.release(connection)
+                raise
+            except BaseException:
+                await self.pool.release(connection, healthy=False)
+                raise
+            await self.pool.release(connection)
+        except SMTPError as e:
+            if e.permanent or attempts >= DELIVERY_MAX_ATTEMPTS:
+                await self._queue_call(self.queue.failed, message_id, attempts, str(e))
+                self.failed += 1
+                logger.error(f"Delivery of message {message_id} failed permanently: {str(e)}")
+            else:
+                await self._queue_call(self.queue.retry, message_id, attempts, self._backoff(attempts), str(e))
+                self.retried += 1
+            return
+        except (OSError, asyncio.TimeoutError, ConnectionError) as e:
+            error = str(e) or type(e).__name__
+            if attempts >= DELIVERY_MAX_ATTEMPTS:
+                await self._queue_call(self.queue.failed, message_id, attempts, error)
+                self.failed += 1
+                logger.error(f"Delivery of message {message_id} failed permanently: {error}")
+            else:
+                await self._queue_call(self.queue.retry, message_id, attempts, self._backoff(attempts), error)
+                self.retried += 1
+                logger.warning(f"Delivery of message {message_id} deferred: {error}")
+            return
+
+        accepted = [r for r in recipients if r not in refused]
+        if accepted:
+            self.sent += 1
+            logger.info(f"Message {message_id} delivered to {', '.join(accepted)}")
+        if not refused:
+            await self._queue_call(self.queue.delivered, message_id)
+            return
+
+        # Only the refused recipients stay queued; the others already have it
+        self.refused_recipients += len(refused)
+        errors = "; ".join(f"{r}: {e}" for r, e in refused.items())
+        deferred = [r for r, e in refused.items() if not e.permanent]
+        if deferred and attempts < DELIVERY_MAX_ATTEMPTS:
+            permanent = [r for r, e in refused.items() if e.permanent]
+            if permanent:
+                logger.error(f"Delivery of message {message_id} to {', '.join(permanent)} failed permanently: {errors}")
+            await self._queue_call(
+                self.queue.retry, message_id, attempts, self._backoff(attempts), errors, deferred
+            )
+            self.retried += 1
+            return
+        await self._queue_call(self.queue.failed, message_id, attempts, errors, list(refused))
+        self.failed += 1
+        logger.error(f"Delivery of message {message_id} failed permanently for some recipients: {errors}")
+
+    async def _worker(self):
+        while True:
+            batch = await self._queue_call(self.queue.claim, 1)
+            if not batch:
+                next_due = await self._queue_call(self.queue.next_due)
+                timeout = 5.0 if next_due is None else min(max(next_due - time(), 0.05), 5.0)
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            for row in batch:
+                await self._deliver(*row)
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self.pool is not None:
+            await self.pool.close()
+        self.queue.close()
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Counters and queue sizes (blocking: reads the SQLite queue)
+        """
+        return {
+            "sent": self.sent,
+            "retried": self.retried,
+            "failed": self.failed,
+            "refused_recipients": self.refused_recipients,
+            "connections_opened": self.pool.opened if self.pool else 0,
+            **{f"queue_{status}": count for status, count in self.queue.counts().items()},
+        }
@@ -1,11 +1,170 @@
 import re
-from typing import Dict, Any
+from typing import Dict, Any, List
 from bs4 import BeautifulSoup
+from bs4.builder import HTMLTreeBuilder
+from bs4.dammit import EntitySubstitution, UnicodeDammit
+from html.parser import HTMLParser
 import html
 
-def clean_text(text: str) -> str:
+# Precompiled patterns for clean_text
+URL_PATTERN = re.compile(r'http\S+|www\S+|https\S+', flags=re.MULTILINE)
+EMAIL_PATTERN = re.compile(r'\S+@\S+')
+# Replacing [^\w\s] with a space and then collapsing \s+ to one space is the
+# same as collapsing every run of non-word characters to one space
+NON_WORD_PATTERN = re.compile(r'\W+')
+
+# Tags BeautifulSoup treats specially when extracting text with html.parser.
+# _TextExtractor mirrors the pinned beautifulsoup4 release; after upgrading it
+# run tests/test_clean_text.py
+VOID_TAGS = frozenset(HTMLTreeBuilder.DEFAULT_EMPTY_ELEMENT_TAGS)
+STRING_CONTAINER_TAGS = frozenset(HTMLTreeBuilder.DEFAULT_STRING_CONTAINERS)
+PRESERVE_WHITESPACE_TAGS = frozenset(HTMLTreeBuilder.DEFAULT_PRESERVE_WHITESPACE_TAGS)
+ASCII_SPACES = "\x20\x0a\x09\x0c\x0d"
+
+_DECIMAL_REFERENCE = re.compile("^([0-9]+)(.*)")
+_HEX_REFERENCE = re.compile("^([0-9a-f]+)(.*)")
+
+class _TextExtractor(HTMLParser):
     """
-    Clean and normalize text content
+    Collects the same text as BeautifulSoup(text, "html.parser").get_text(),
+    without building a tree: comments, doctypes, processing instructions and
+    the contents of string-container tags (script, style, template, rt, rp)
+    are dropped, CDATA sections are kept.
+    
+    Data is buffered and flushed at the same points where BeautifulSoup ends
+    a string, including its replacement of empty or whitespace-only strings
+    with a single space or newline.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        self.parts: List[str] = []
+        self.current: List[str] = []
+        # Open tags as (name, is_string_container, preserves_whitespace),
+        # mirroring BeautifulSoup's tag stack so end tags close the same elements
+        self.stack: List[tuple] = []
+        self.open_counts: Dict[str, int] = {}
+        self.containers = 0
+        self.preserving = 0
+        self.already_closed_empty = []
+
+    def _string(self, data: str) -> str:
+        if not self.preserving and not data.strip(ASCII_SPACES):
+            return "\n" if "\n" in data else " "
+        return data
+
+    def _flush(self):
+        if self.current:
+            data = self._string("".join(self.current))
+            self.current = []
+            if not self.containers:
+                self.parts.append(data)
+
+    def _push(self, tag: str):
+        entry = (tag, tag in STRING_CONTAINER_TAGS, tag in PRESERVE_WHITESPACE_TAGS)
+        self.stack.append(entry)
+        self.open_counts[tag] = self.open_counts.get(tag, 0) + 1
+        self.containers += entry[1]
+        self.preserving += entry[2]
+
+    def _pop_to(self, tag: str):
+        # Pop up to and including the most recent open tag with this name
+        while self.stack and self.open_counts.get(tag):
+            name, container, preserving = self.stack.pop()
+            self.open_counts[name] -= 1
+            self.containers -= container
+            self.preserving -= preserving
+            if name == tag:
+                break
+
+    def handle_starttag(self, tag, attrs, handle_empty_element=True):
+        self._flush()
+        self._push(tag)
+        if tag in VOID_TAGS and handle_empty_element:
+            self._pop_to(tag)
+            self.already_closed_empty.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs, handle_empty_element=False)
+        self.handle_endtag(tag, check_already_closed=False)
+
+    def handle_endtag(self, tag, check_already_closed=True):
+        if check_already_closed and tag in self.already_closed_empty:
+            self.already_closed_empty.remove(tag)
+        else:
+            self._flush()
+            self._pop_to(tag)
+
+    def handle_data(self, data):
+        self.current.append(data)
+
+    def handle_charref(self, name):
+        base, pattern = 10, _DECIMAL_REFERENCE
+        if name.startswith(("x", "X")):
+            name, base, pattern = name[1:], 16, _HEX_REFERENCE
+        
+        numeric, extra = None, ""
+        try:
+            numeric = int(name, base)
+        except ValueError:
+            match = pattern.search(name)
+            if match is not None:
+                numeric = int(match.group(1), base)
+                extra = match.group(2)
+        
+        if numeric is None:
+            self.handle_data("")
+            self.handle_data(name)
+        else:
+            self.handle_data(UnicodeDammit.numeric_character_reference(numeric)[0])
+            self.handle_data(extra)
+
+    def handle_entityref(self, name):
+        character = EntitySubstitution.HTML_ENTITY_TO_CHARACTER.get(name)
+        self.handle_data(character if character is not None else f"&{name}")
+
+    # Comments, doctypes, declarations and processing instructions end the
+    # current string but are not part of the text themselves
+    def handle_comment(self, data):
+        self._flush()
+
+    def handle_decl(self, decl):
+        self._flush()
+
+    def handle_pi(self, data):
+        self._flush()
+
+    def unknown_decl(self, data):
+        self._flush()
+        # CDATA sections are part of the text, even inside string containers
+        if data.upper().startswith("CDATA["):
+            self.parts.append(self._string(data[len("CDATA["):]))
+
+    def close(self):
+        super().close()
+        self._flush()
+
+def _strip_html(text: str) -> str:
+    """
+    Extract text from HTML, matching BeautifulSoup's html.parser get_text()
+    """
+    # Without markup or entities the parser would return the text unchanged,
+    # unless it is all whitespace (BeautifulSoup collapses that)
+    if '<' not in text and '&' not in text and (not text or text.strip(ASCII_SPACES)):
+        return text
+    
+    extractor = _TextExtractor()
+    try:
+        extractor.feed(text)
+        extractor.close()
+    except Exception:
+        # Markup html.parser rejects: defer to BeautifulSoup's behaviour
+        return BeautifulSoup(text, "html.parser").get_text()
+    return "".join(extractor.parts)
+
+def _clean_text_bs4(text: str) -> str:
+    """
+    Reference implementation of clean_text, kept to check the fast path
     """
     # Remove HTML tags
     text = BeautifulSoup(text, "html.parser").get_text()
@@ -25,6 +184,29 @@ def clean_text(text: str) -> str:
     
     return text.strip()
 
+def clean_text(text: str) -> str:
+    """
+    Clean and normalize text content
+    """
+    # Remove HTML tags
+    text = _strip_html(text)
+    
+    # Decode HTML entities
+    text = html.unescape(text)
+    
+    # Remove URLs
+    if 'http' in text or 'www' in text:
+        text = URL_PATTERN.sub('', text)
+    
+    # Remove email addresses
+    if '@' in text:
+        text = EMAIL_PATTERN.sub('', text)
+    
+    # Remove special characters and extra whitespace
+    text = NON_WORD_PATTERN.sub(' ', text)
+    
+    return text.strip()
+
 def process_email(content: str) -> str:
     """
     Process email content for spam classification
@@ -43,6 +225,23 @@ def process_email(content: str) -> str:
     
     return processed_text
 
+def process_emails(contents: List[str]) -> List[str]:
+    """
+    Process many email bodies for spam classification
+    
+    Args:
+        contents: Raw email contents
+        
+    Returns:
+        Processed texts, in the same order; identical bodies are only
+        processed once
+    """
+    processed: Dict[str, str] = {}
+    for content in contents:
+        if content not in processed:
+            processed[content] = process_email(content)
+    return [processed[content] for content in contents]
+
 def extract_email_metadata(email_data: Dict[str, Any]) -> Dict[str, Any]:
     """
     Extract relevant metadata from email
@@ -0,0 +1,299 @@
+import asyncio
+import json
+import logging
+import os
+from collections import deque
+from datetime import datetime, timezone
+from time import monotonic
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import func, insert, select, text
+
+from backend.models.models import Email
+from backend.services.mailbox_stats import record_emails
+
+logger = logging.getLogger(__name__)
+
+# sync:         one INSERT + COMMIT per email before the response (durable)
+# group:        the request waits for the batched commit of its row (durable,
+#               higher throughput, adds up to EMAIL_WRITE_FLUSH_MS latency)
+# write-behind: the request returns immediately; rows still buffered are lost
+#               if the process dies
+EMAIL_WRITE_MODE = os.getenv("EMAIL_WRITE_MODE", "sync").lower()
+EMAIL_WRITE_BATCH_SIZE = int(os.getenv("EMAIL_WRITE_BATCH_SIZE", "500"))
+EMAIL_WRITE_FLUSH_MS = float(os.getenv("EMAIL_WRITE_FLUSH_MS", "50"))
+# Callers wait for a flush once this many rows are buffered
+EMAIL_WRITE_MAX_PENDING = int(os.getenv("EMAIL_WRITE_MAX_PENDING", "10000"))
+# Ids reserved from the sequence per round trip
+EMAIL_ID_BLOCK = int(os.getenv("EMAIL_ID_BLOCK", "1000"))
+# Use COPY instead of multi-row INSERT on PostgreSQL (asyncpg)
+EMAIL_WRITE_COPY = os.getenv("EMAIL_WRITE_COPY", "true").lower() == "true"
+# write-behind: after this many failed flushes of a batch its rows are written
+# one at a time, and rows that still fail go to the dead-letter file
+EMAIL_WRITE_MAX_ATTEMPTS = int(os.getenv("EMAIL_WRITE_MAX_ATTEMPTS", "3"))
+EMAIL_WRITE_DEAD_LETTER = os.getenv(
+    "EMAIL_WRITE_DEAD_LETTER",
+    os.path.join(os.getenv("LOG_FOLDER", "/var/log/spam-filter"), "email-dead-letter.jsonl"),
+)
+
+WRITE_MODES = ("sync", "group", "write-behind")
+_COLUMNS = [column.name for column in Email.__table__.columns]
+
+
+class IdAllocator:
+    """
+    Hands out email ids from blocks reserved in one round trip.
+
+    On PostgreSQL blocks come from the emails id sequence, so they never
+    collide with other workers or with rows inserted without an explicit id.
+    Other databases (the SQLite test stand-in) continue from MAX(id), which
+    is only safe with a single writer process.
+    """
+
+    def __init__(self, session_factory, block: int = EMAIL_ID_BLOCK):
+        self.session_factory = session_factory
+        self.block = max(block, 1)
+        self._ids: deque = deque()
+        self._next_local: Optional[int] = None
+        self._lock = asyncio.Lock()
+
+    async def _reserve(self):
+        async with self.session_factory() as db:
+            if db.bind.dialect.name == "postgresql":
+                result = await db.execute(
+                    text("SELECT nextval(pg_get_serial_sequence('emails', 'id')) FROM generate_series(1, :n)"),
+                    {"n": self.block},
+                )
+                self._ids = deque(row[0] for row in result)
+                return
+            if self._next_local is None:
+                self._next_local = ((await db.execute(select(func.max(Email.id)))).scalar() or 0) + 1
+        self._ids = deque(range(self._next_local, self._next_local + self.block))
+        self._next_local += self.block
+
+    async def next(self) -> int:
+        async with self._lock:
+            if not self._ids:
+                await self._reserve()
+            return self._ids.popleft()
+
+
+class EmailWriter:
+    """
+    Persists classified Email rows according to EMAIL_WRITE_MODE.
+
+    In the batched modes rows are buffered in memory and a background task
+    flushes them with one multi-row INSERT (or COPY) per batch once
+    batch_size rows are pending or flush_ms has passed. close() drains
+    whatever is still buffered. In write-behind mode a batch that keeps
+    failing is split into single rows so one bad row cannot block the rest;
+    rows that fail on their own are appended to the dead-letter file.
+    """
+
+    def __init__(
+        self,
+        session_factory,
+        mode: str = EMAIL_WRITE_MODE,
+        batch_size: int = EMAIL_WRITE_BATCH_SIZE,
+        flush_ms: float = EMAIL_WRITE_FLUSH_MS,
+        max_pending: int = EMAIL_WRITE_MAX_PENDING,
+        max_attempts: int = EMAIL_WRITE_MAX_ATTEMPTS,
+        dead_letter_path: str = EMAIL_WRITE_DEAD_LETTER,
+    ):
+        if mode not in WRITE_MODES:
+            raise ValueError(f"mode must be one of {', '.join(WRITE_MODES)}")
+        self.session_factory = session_factory
+        self.mode = mode
+        self.batch_size = max(batch_size, 1)
+        self.flush_seconds = flush_ms / 1000
+        self.max_pending = max(max_pending, self.batch_size)
+        self.max_attempts = max(max_attempts, 1)
+        self.dead_letter_path = dead_letter_path
+        self.ids = IdAllocator(session_factory)
+        self._pending: List[Tuple[Dict, Optional[asyncio.Future]]] = []
+        self._first_pending_at = 0.0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._drained: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+        # Consecutive failed flushes of the batch at the head of _pending
+        self._attempts = 0
+        self.rows_written = 0
+        self.batches = 0
+        self.failed_flushes = 0
+        self.dead_lettered = 0
+
+    async def start(self):
+        if self.mode == "sync":
+            return
+        self._wakeup = asyncio.Event()
+        self._drained = asyncio.Event()
+        self._drained.set()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def add(self, values: Dict, db=None) -> Dict:
+        """
+        Persist one email
+
+        Args:
+            values: Email column values without id and created_at
+            db: Request session to commit on in sync mode, instead of
+                checking out another connection
+
+        Returns:
+            All column values of the row, including id and created_at
+        """
+        row = {column: values.get(column) for column in _COLUMNS}
+        row["created_at"] = datetime.now(timezone.utc)
+
+        if self.mode == "sync":
+            email = Email(**{k: v for k, v in row.items() if k != "id"})
+            if db is not None:
+                db.add(email)
+                await record_emails(db, [row])
+                await db.commit()
+            else:
+                async with self.session_factory() as session:
+                    session.add(email)
+                    await record_emails(session, [row])
+                    await session.commit()
+            row["id"] = email.id
+            self.rows_written += 1
+            return row
+
+        if self._closing:
+            raise RuntimeError("Email writer is shutting down")
+        row["id"] = await self.ids.next()
+        while len(self._pending) >= self.max_pending:
+            # Backpressure: wait for the writer instead of growing without bound
+            self._wakeup.set()
+            self._drained.clear()
+            await self._drained.wait()
+
+        future = asyncio.get_running_loop().create_future() if self.mode == "group" else None
+        if not self._pending:
+            self._first_pending_at = monotonic()
+        self._pending.append((row, future))
+        # The first row starts the flush_ms timer, a full batch flushes now
+        if len(self._pending) == 1 or len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+        if future is not None:
+            await future
+        return row
+
+    async def _run(self):
+        while True:
+            if not self._pending:
+                self._drained.set()
+                if self._closing:
+                    return
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            remaining = self._first_pending_at + self.flush_seconds - monotonic()
+            if len(self._pending) < self.batch_size and remaining > 0 and not self._closing:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            batch, self._pending = self._pending[:self.batch_size], self._pending[self.batch_size:]
+            self._first_pending_at = monotonic()
+            try:
+                await self._flush([row for row, _ in batch])
+            except Exception as e:
+                self.failed_flushes += 1
+                logger.error(f"Email batch of {len(batch)} rows failed: {str(e)}")
+                if self.mode == "group":
+                    for _, future in batch:
+                        if not future.done():
+                            future.set_exception(e)
+                    continue
+                self._attempts += 1
+                if self._attempts < self.max_attempts and not self._closing:
+                    # write-behind: keep the rows and retry after a pause
+                    self._pending = batch + self._pending
+                    await asyncio.sleep(min(1.0, self.flush_seconds * 10))
+                    continue
+                self._attempts = 0
+                await self._flush_rows([row for row, _ in batch])
+                if len(self._pending) < self.max_pending:
+                    self._drained.set()
+                continue
+
+            self._attempts = 0
+
+            for _, future in batch:
+                if future is not None and not future.done():
+                    future.set_result(None)
+            if len(self._pending) < self.max_pending:
+                self._drained.set()
+
+    async def _flush(self, rows: List[Dict]):
+        async with self.session_factory() as db:
+            connection = await db.connection()
+            if EMAIL_WRITE_COPY and connection.dialect.driver == "asyncpg":
+                raw = await connection.get_raw_connection()
+                await raw.driver_connection.copy_records_to_table(
+                    Email.__tablename__,
+                    records=[tuple(row[column] for column in _COLUMNS) for row in rows],
+                    columns=_COLUMNS,
+                )
+            else:
+                # executemany; SQLAlchemy renders it as multi-row INSERT ... VALUES
+                await db.execute(insert(Email), rows)
+            # Mailbox counters commit in the same transaction as the rows
+            await record_emails(db, rows)
+            await db.commit()
+        self.rows_written += len(rows)
+        self.batches += 1
+
+    async def _flush_rows(self, rows: List[Dict]):
+        """
+        Write rows one per transaction; dead-letter the ones that fail
+        """
+        failed = []
+        for row in rows:
+            try:
+                await self._flush([row])
+            except Exception as e:
+                failed.append((row, e))
+        if not failed:
+            return
+        logger.error(f"Moving {len(failed)} unwritable emails to {self.dead_letter_path}")
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self._dead_letter, failed)
+        except Exception as e:
+            logger.error(f"Dropping {len(failed)} unwritable emails, dead-letter write failed: {str(e)}")
+            return
+        self.dead_lettered += len(failed)
+
+    def _dead_letter(self, failed: List[Tuple[Dict, Exception]]):
+        os.makedirs(os.path.dirname(self.dead_letter_path) or ".", exist_ok=True)
+        with open(self.dead_letter_path, "a") as f:
+            for row, error in failed:
+                f.write(json.dumps({"row": row, "error": str(error)}, default=str) + "\n")
+
+    async def close(self):
+        """
+        Flush every buffered row and stop the writer
+        """
+        if self._task is None:
+            return
+        self._closing = True
+        self._wakeup.set()
+        await self._task
+        self._task = None
+
+    def stats(self) -> Dict:
+        return {
+            "mode": self.mode,
+            "pending": len(self._pending),
+            "rows_written": self.rows_written,
+            "batches": self.batches,
+            "failed_flushes": self.failed_flushes,
+            "dead_lettered": self.dead_lettered,
+            "avg_batch_size": self.rows_written / self.batches if self.batches else 0.0,
+        }
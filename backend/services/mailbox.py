@@ -0,0 +1,74 @@
+import base64
+import os
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from sqlalchemy import and_, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from backend.models.models import Email, User
+
+MAILBOX_DEFAULT_LIMIT = int(os.getenv("MAILBOX_DEFAULT_LIMIT", "100"))
+MAILBOX_MAX_LIMIT = int(os.getenv("MAILBOX_MAX_LIMIT", "500"))
+
+
+def encode_cursor(created_at: datetime, email_id: int) -> str:
+    """
+    Opaque keyset cursor for the row a page ended on
+    """
+    raw = f"{created_at.isoformat()}|{email_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, email_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(email_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def mailbox_query(conditions, cursor: Optional[str], limit: int):
+    """
+    Build one query returning (Email, sender email, recipient email) rows,
+    newest first, starting after cursor; fetches limit + 1 rows so the
+    caller can tell whether another page exists
+    """
+    sender = aliased(User)
+    recipient = aliased(User)
+    query = (
+        select(Email, sender.email, recipient.email)
+        .join(sender, Email.sender_id == sender.id)
+        .join(recipient, Email.recipient_id == recipient.id)
+        .where(*conditions)
+    )
+    if cursor:
+        created_at, email_id = decode_cursor(cursor)
+        query = query.where(or_(
+            Email.created_at < created_at,
+            and_(Email.created_at == created_at, Email.id < email_id),
+        ))
+    return query.order_by(Email.created_at.desc(), Email.id.desc()).limit(limit + 1)
+
+
+async def mailbox_page(db: AsyncSession, conditions, cursor: Optional[str], limit: int):
+    """
+    Run a mailbox query
+
+    Returns:
+        (rows, next_cursor) where next_cursor is None on the last page
+    """
+    limit = min(max(limit, 1), MAILBOX_MAX_LIMIT)
+    rows: List = (await db.execute(mailbox_query(conditions, cursor, limit))).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1][0]
+        next_cursor = encode_cursor(last.created_at, last.id)
+    return rows, next_cursor
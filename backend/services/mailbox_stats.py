@@ -0,0 +1,86 @@
+from collections import defaultdict
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, Iterable, List
+
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend.models.models import UserEmailDaily, UserEmailStats
+
+_COUNTERS = ("sent", "received", "spam_received")
+
+
+def _deltas(rows: Iterable[Dict]):
+    """
+    Fold a batch of email rows into per-user and per-user-per-day increments
+    """
+    totals = defaultdict(lambda: dict.fromkeys(_COUNTERS, 0))
+    daily = defaultdict(lambda: dict.fromkeys(_COUNTERS, 0))
+    for row in rows:
+        created_at = row["created_at"]
+        if created_at.tzinfo is not None:
+            created_at = created_at.astimezone(timezone.utc)
+        day = created_at.date()
+        for key, counters in ((row["sender_id"], totals), ((row["sender_id"], day), daily)):
+            counters[key]["sent"] += 1
+        for key, counters in ((row["recipient_id"], totals), ((row["recipient_id"], day), daily)):
+            counters[key]["received"] += 1
+            counters[key]["spam_received"] += bool(row["is_spam"])
+    return totals, daily
+
+
+def _upsert(dialect: str, table, values: List[Dict], keys):
+    insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+    statement = insert(table).values(values)
+    return statement.on_conflict_do_update(
+        index_elements=keys,
+        set_={name: table.c[name] + statement.excluded[name] for name in _COUNTERS},
+    )
+
+
+async def record_emails(db: AsyncSession, rows: List[Dict]):
+    """
+    Add a batch of new emails to the counters, inside the caller's
+    transaction so the counts commit or roll back with the rows
+    """
+    totals, daily = _deltas(rows)
+    dialect = db.bind.dialect.name
+    await db.execute(_upsert(
+        dialect, UserEmailStats.__table__,
+        [{"user_id": user_id, **counts} for user_id, counts in totals.items()],
+        ["user_id"],
+    ))
+    await db.execute(_upsert(
+        dialect, UserEmailDaily.__table__,
+        [{"user_id": user_id, "day": day, **counts} for (user_id, day), counts in daily.items()],
+        ["user_id", "day"],
+    ))
+
+
+async def get_mailbox_stats(db: AsyncSession, user_id: int, days: int) -> Dict:
+    """
+    Totals plus the last days daily buckets (oldest first, gaps filled with
+    zeros); two primary key lookups regardless of mailbox size
+    """
+    totals = await db.get(UserEmailStats, user_id)
+    today = datetime.now(timezone.utc).date()
+    first_day = today - timedelta(days=days - 1)
+    buckets = {
+        bucket.day: bucket
+        for bucket in (await db.execute(
+            select(UserEmailDaily)
+            .where(UserEmailDaily.user_id == user_id, UserEmailDaily.day >= first_day)
+        )).scalars()
+    }
+
+    def counts(source) -> Dict:
+        values = {name: getattr(source, name) if source else 0 for name in _COUNTERS}
+        values["spam_rate"] = values["spam_received"] / values["received"] if values["received"] else 0.0
+        return values
+
+    daily = []
+    for offset in range(days):
+        day: date = first_day + timedelta(days=offset)
+        daily.append({"day": day, **counts(buckets.get(day))})
+    return {**counts(totals), "daily": daily}
@@ -0,0 +1,326 @@
+import asyncio
+import json
+import logging
+import os
+import sys
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import perf_counter, time
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Directory shared by the workers on one host; each worker snapshots its
+# metrics there so /metrics on any worker reports all of them
+METRICS_DIR = os.getenv("METRICS_DIR", "")
+METRICS_SNAPSHOT_SECONDS = float(os.getenv("METRICS_SNAPSHOT_SECONDS", "5"))
+# Bearer token required on /metrics; without one /metrics is refused unless
+# METRICS_PUBLIC=true opens it to anyone who can reach the port
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+METRICS_PUBLIC = os.getenv("METRICS_PUBLIC", "false").lower() == "true"
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+Sample = Tuple[str, Dict[str, str], float]
+
+
+def worker_id() -> str:
+    # Resolved per call: workers forked from a preloaded app share the
+    # parent's import-time state
+    return os.getenv("METRICS_WORKER") or str(os.getpid())
+
+
+def process_memory() -> Dict[str, int]:
+    """
+    Memory of this process in bytes. pss divides shared pages (e.g. mapped
+    model weights) between the processes sharing them, so summing it over
+    the workers gives their real footprint; rss counts shared pages in full.
+    """
+    fields = {"Rss": "rss_bytes", "Pss": "pss_bytes", "Shared_Clean": "shared_clean_bytes",
+              "Shared_Dirty": "shared_dirty_bytes", "Private_Clean": "private_clean_bytes",
+              "Private_Dirty": "private_dirty_bytes"}
+    memory = {}
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key in fields:
+                    memory[fields[key]] = int(value.split()[0]) * 1024
+    except OSError:
+        import resource
+        # Peak RSS only (kilobytes on Linux, bytes on macOS)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        memory["max_rss_bytes"] = peak if sys.platform == "darwin" else peak * 1024
+    return memory
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+class Counter:
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues, amount: float = 1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def samples(self) -> Iterator[Sample]:
+        with self._lock:
+            values = list(self._values.items())
+        for labelvalues, value in values:
+            yield f"{self.name}_total", dict(zip(self.labelnames, labelvalues)), value
+
+
+class Histogram:
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, buckets: Sequence[float], labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(sorted(buckets))
+        self.labelnames = tuple(labelnames)
+        # labels -> [count per bucket ..., count above the last bucket, sum]
+        self._series: Dict[Tuple, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labelvalues):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def samples(self) -> Iterator[Sample]:
+        with self._lock:
+            series = [(labelvalues, list(values)) for labelvalues, values in self._series.items()]
+        for labelvalues, values in series:
+            labels = dict(zip(self.labelnames, labelvalues))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), values):
+                cumulative += count
+                yield f"{self.name}_bucket", {**labels, "le": "+Inf" if bound == float("inf") else repr(bound)}, cumulative
+            yield f"{self.name}_count", labels, cumulative
+            yield f"{self.name}_sum", labels, values[-1]
+
+
+class MetricsRegistry:
+    """
+    Prometheus metrics for one worker process.
+
+    Counters and histograms are updated in place under a per-metric lock;
+    the stats() of the caches, queues and pools are only read when
+    /metrics is scraped. Every series carries a worker label.
+    """
+
+    def __init__(self, namespace: str = "spam_filter", directory: str = METRICS_DIR):
+        self.namespace = namespace
+        self.directory = directory
+        self._metrics: List = []
+        self._collectors: List[Tuple[str, str, Callable[[], Dict]]] = []
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        metric = Counter(f"{self.namespace}_{name}", documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(
+        self, name: str, documentation: str, buckets: Sequence[float] = LATENCY_BUCKETS, labelnames: Sequence[str] = ()
+    ) -> Histogram:
+        metric = Histogram(f"{self.namespace}_{name}", documentation, buckets, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def register_stats(self, component: str, stats: Callable[[], Dict], documentation: str = ""):
+        """
+        Export the numeric fields of a component's stats() as gauges named
+        <namespace>_<component>_<field>
+        """
+        self._collectors.append((component, documentation or f"{component} stats", stats))
+
+    def collect(self) -> List[Dict]:
+        """
+        This worker's metric families as JSON-serialisable dicts
+        """
+        worker = {"worker": worker_id()}
+        families = []
+        for metric in self._metrics:
+            families.append({
+                "name": metric.name,
+                "type": metric.type,
+                "help": metric.documentation,
+                "samples": [(name, {**labels, **worker}, value) for name, labels, value in metric.samples()],
+            })
+        for component, documentation, stats in self._collectors:
+            try:
+                values = stats() or {}
+            except Exception as e:
+                logger.warning(f"Collecting {component} metrics failed: {str(e)}")
+                continue
+            for field, value in values.items():
+                if isinstance(value, bool):
+                    value = int(value)
+                if not isinstance(value, (int, float)):
+                    continue
+                name = f"{self.namespace}_{component}_{field}".replace("-", "_")
+                families.append({"name": name, "type": "gauge", "help": documentation, "samples": [(name, worker, value)]})
+        return families
+
+    def _snapshot_path(self) -> str:
+        return os.path.join(self.directory, f"{worker_id()}.json")
+
+    def write_snapshot(self):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._snapshot_path()
+        with open(path + ".tmp", "w") as f:
+            json.dump(self.collect(), f)
+        os.replace(path + ".tmp", path)
+
+    def remove_snapshot(self):
+        if self.directory:
+            try:
+                os.remove(self._snapshot_path())
+            except FileNotFoundError:
+                pass
+
+    def _other_workers(self) -> List[Dict]:
+        families = []
+        if not self.directory or not os.path.isdir(self.directory):
+            return families
+        own = os.path.basename(self._snapshot_path())
+        stale_before = time() - 3 * METRICS_SNAPSHOT_SECONDS
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name == own or not name.endswith(".json"):
+                continue
+            try:
+                if os.path.getmtime(path) < stale_before:
+                    # Worker exited without cleaning up
+                    continue
+                with open(path) as f:
+                    families.extend(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return families
+
+    def render(self) -> str:
+        """
+        Prometheus text exposition of this worker (live) and of the other
+        workers' latest snapshots
+        """
+        merged: Dict[str, Dict] = {}
+        for family in self.collect() + self._other_workers():
+            entry = merged.setdefault(family["name"], {"type": family["type"], "help": family["help"], "samples": []})
+            entry["samples"].extend(family["samples"])
+        lines = []
+        for name, family in merged.items():
+            lines.append(f"# HELP {name} {family['help']}")
+            lines.append(f"# TYPE {name} {family['type']}")
+            for sample, labels, value in family["samples"]:
+                lines.append(f"{sample}{_format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    async def run_snapshots(self):
+        """
+        Snapshot this worker's metrics every METRICS_SNAPSHOT_SECONDS
+        (no-op without METRICS_DIR)
+        """
+        if not self.directory:
+            return
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                try:
+                    await loop.run_in_executor(None, self.write_snapshot)
+                except Exception as e:
+                    logger.warning(f"Writing metrics snapshot failed: {str(e)}")
+                await asyncio.sleep(METRICS_SNAPSHOT_SECONDS)
+        finally:
+            self.remove_snapshot()
+
+
+registry = MetricsRegistry()
+
+STAGE_SECONDS = registry.histogram(
+    "stage_seconds", "Time spent in each processing stage", LATENCY_BUCKETS, ("stage",)
+)
+REQUEST_SECONDS = registry.histogram(
+    "http_request_seconds", "HTTP request latency", LATENCY_BUCKETS, ("method", "route")
+)
+REQUESTS = registry.counter("http_requests", "HTTP requests", ("method", "route", "status"))
+BATCH_SIZE = registry.histogram("inference_batch_size", "Texts (or long-document windows) per forward pass", BATCH_BUCKETS)
+
+# Stage durations of the request being handled, for the Server-Timing header
+_request_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_timings", default=None)
+
+
+def observe_stage(stage: str, seconds: float):
+    STAGE_SECONDS.observe(seconds, stage)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+@contextmanager
+def timed(stage: str):
+    """
+    Time a block as one observation of stage
+    """
+    started = perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, perf_counter() - started)
+
+
+def start_request_timings() -> Dict[str, float]:
+    """
+    Collect the stages observed by the current request (and the tasks it
+    spawns) into the returned dict
+    """
+    timings: Dict[str, float] = {}
+    _request_timings.set(timings)
+    return timings
+
+
+def request_timings() -> Optional[Dict[str, float]]:
+    """
+    The dict collecting the current request's stages, or None outside a
+    request
+    """
+    return _request_timings.get()
+
+
+def add_timings(timings: Optional[Dict[str, float]], stages: Dict[str, float]):
+    """
+    Credit stages observed elsewhere (e.g. a shared inference batch) to a
+    request's timings
+    """
+    if timings is None:
+        return
+    for stage, seconds in stages.items():
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+def server_timing(timings: Dict[str, float], total: float) -> str:
+    entries = [f"{stage};dur={seconds * 1000:.2f}" for stage, seconds in timings.items()]
+    entries.append(f"total;dur={total * 1000:.2f}")
+    return ", ".join(entries)
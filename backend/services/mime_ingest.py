@@ -0,0 +1,314 @@
+import binascii
+import os
+import re
+from email.header import decode_header, make_header
+from typing import AsyncIterator, Dict, List, Optional
+
+# Decoded text bytes to collect for classification before we stop reading
+RAW_EMAIL_BYTE_BUDGET = int(os.getenv("RAW_EMAIL_BYTE_BUDGET", str(64 * 1024)))
+# Hard cap on raw bytes read from the stream, attachments included
+RAW_EMAIL_MAX_BYTES = int(os.getenv("RAW_EMAIL_MAX_BYTES", str(25 * 1024 * 1024)))
+# Lines longer than this are processed in pieces instead of being buffered
+MAX_LINE_BYTES = 64 * 1024
+# Header bytes kept per part; the rest of an oversized header block is ignored
+MAX_HEADER_BYTES = 64 * 1024
+
+_PARAM_PATTERN = re.compile(r';\s*([\w\-.]+)\s*=\s*("(?:[^"\\]|\\.)*"|[^;\s]*)')
+
+
+def _decode_header_value(value: str) -> str:
+    try:
+        return str(make_header(decode_header(value)))
+    except Exception:
+        return value
+
+
+def _parse_content_header(value: str):
+    """
+    Split 'type/subtype; key=value' into the lowercased main value and params
+    """
+    main = value.split(";", 1)[0].strip().lower()
+    params = {}
+    for key, raw in _PARAM_PATTERN.findall(value):
+        if raw.startswith('"') and raw.endswith('"'):
+            raw = raw[1:-1].replace('\\"', '"')
+        params[key.lower()] = raw
+    return main, params
+
+
+class _Decoder:
+    """
+    Incremental Content-Transfer-Encoding decoder
+    """
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        self.pending = b""
+
+    def decode(self, data: bytes, line_complete: bool = True) -> bytes:
+        if self.encoding == "base64":
+            data = self.pending + re.sub(rb"[^A-Za-z0-9+/=]", b"", data)
+            usable = len(data) - len(data) % 4
+            self.pending = data[usable:]
+            try:
+                return binascii.a2b_base64(data[:usable])
+            except binascii.Error:
+                return b""
+        if self.encoding == "quoted-printable":
+            data = self.pending + data
+            self.pending = b""
+            if not line_complete:
+                # Keep a possibly split =XX escape for the next piece
+                cut = data.rfind(b"=", max(len(data) - 2, 0))
+                if cut != -1:
+                    data, self.pending = data[:cut], data[cut:]
+            return binascii.a2b_qp(data)
+        return data
+
+    def flush(self) -> bytes:
+        pending, self.pending = self.pending, b""
+        if self.encoding == "base64" and pending:
+            try:
+                return binascii.a2b_base64(pending + b"=" * (-len(pending) % 4))
+            except binascii.Error:
+                return b""
+        if self.encoding == "quoted-printable":
+            return binascii.a2b_qp(pending)
+        return pending
+
+
+class _Part:
+    def __init__(self, default_type: str = "text/plain"):
+        self.header_lines: List[bytes] = []
+        self.header_bytes = 0
+        self.headers: Dict[str, str] = {}
+        self.content_type = default_type
+        self.params: Dict[str, str] = {}
+        self.mode = "headers"
+        self.decoder: Optional[_Decoder] = None
+        self.body: List[bytes] = []
+
+    def add_header_line(self, line: bytes):
+        if self.header_bytes + len(line) <= MAX_HEADER_BYTES:
+            self.header_lines.append(line)
+        self.header_bytes += len(line)
+
+    def parse_headers(self):
+        current = None
+        for raw in self.header_lines:
+            line = raw.decode("utf-8", "replace").rstrip("\r\n")
+            if line[:1] in (" ", "\t") and current is not None:
+                self.headers[current] += " " + line.strip()
+            elif ":" in line:
+                name, value = line.split(":", 1)
+                current = name.strip().lower()
+                # Keep the first occurrence, as for From/To/Subject
+                self.headers.setdefault(current, value.strip())
+        self.header_lines = []
+
+        if "content-type" in self.headers:
+            self.content_type, self.params = _parse_content_header(self.headers["content-type"])
+
+    @property
+    def is_attachment(self) -> bool:
+        disposition, params = _parse_content_header(self.headers.get("content-disposition", ""))
+        return disposition == "attachment" or "filename" in params
+
+
+class ParsedMessage:
+    """
+    Result of streaming a raw message: envelope headers and the text chosen
+    for classification
+    """
+
+    def __init__(self):
+        self.sender = ""
+        self.recipient = ""
+        self.subject = ""
+        self.headers: Dict[str, str] = {}
+        self.plain_parts: List[str] = []
+        self.html_parts: List[str] = []
+        self.skipped_parts = 0
+        self.bytes_read = 0
+        self.truncated = False
+
+    @property
+    def content(self) -> str:
+        # Prefer text/plain; fall back to HTML, which process_email strips
+        return "\n".join(self.plain_parts or self.html_parts)
+
+    def to_email_data(self) -> Dict[str, str]:
+        return {
+            "sender": self.sender,
+            "recipient": self.recipient,
+            "subject": self.subject,
+            "content": self.content,
+        }
+
+
+class StreamingMimeParser:
+    """
+    Incremental RFC 822 / MIME parser.
+
+    Bytes are fed as they arrive. Only text/plain and text/html parts that
+    are not attachments are decoded and kept, up to byte_budget decoded
+    bytes; everything else is skipped line by line without buffering.
+    feed() returns True once the budget or max_bytes is reached, at which
+    point the caller should stop reading.
+    """
+
+    def __init__(self, byte_budget: int = RAW_EMAIL_BYTE_BUDGET, max_bytes: int = RAW_EMAIL_MAX_BYTES):
+        self.byte_budget = byte_budget
+        self.max_bytes = max_bytes
+        self.result = ParsedMessage()
+        self.collected = 0
+        self.done = False
+        self._buffer = b""
+        self._mid_line = False
+        self._boundaries: List[bytes] = []
+        self._part = _Part()
+        self._top_level = True
+
+    def feed(self, data: bytes) -> bool:
+        if self.done:
+            return True
+        self.result.bytes_read += len(data)
+        buffer = self._buffer + data if self._buffer else data
+        position = 0
+
+        while not self.done:
+            newline = buffer.find(b"\n", position)
+            if newline == -1:
+                if len(buffer) - position > MAX_LINE_BYTES:
+                    self._line(buffer[position:], complete=False)
+                    position = len(buffer)
+                break
+            self._line(buffer[position:newline + 1], complete=True)
+            position = newline + 1
+
+        self._buffer = buffer[position:]
+
+        if not self.done and self.result.bytes_read >= self.max_bytes:
+            self.result.truncated = True
+            self.done = True
+        return self.done
+
+    def close(self) -> ParsedMessage:
+        if self._buffer and not self.done:
+            self._line(self._buffer, complete=True)
+        self._buffer = b""
+        if self._part.mode == "headers":
+            self._end_headers()
+        self._finish_part()
+        return self.result
+
+    def _line(self, line: bytes, complete: bool):
+        at_line_start = not self._mid_line
+        self._mid_line = not complete
+        part = self._part
+
+        if part.mode == "headers":
+            if not at_line_start:
+                return
+            if line.strip(b"\r\n") == b"":
+                self._end_headers()
+            else:
+                part.add_header_line(line)
+            return
+
+        if at_line_start and self._boundaries and line.startswith(b"--"):
+            marker = line.rstrip()
+            for depth in range(len(self._boundaries) - 1, -1, -1):
+                boundary = b"--" + self._boundaries[depth]
+                if marker == boundary or marker == boundary + b"--":
+                    self._finish_part()
+                    del self._boundaries[depth + 1:]
+                    if marker == boundary:
+                        self._part = _Part()
+                    else:
+                        # Closing delimiter: skip the epilogue
+                        self._boundaries.pop()
+                        self._part = _Part()
+                        self._part.mode = "skip"
+                    return
+
+        if part.mode == "collect":
+            decoded = part.decoder.decode(line, complete)
+            self._collect(decoded)
+
+    def _end_headers(self):
+        part = self._part
+        part.parse_headers()
+
+        if self._top_level:
+            self._top_level = False
+            headers = self.result.headers = part.headers
+            self.result.sender = _decode_header_value(headers.get("from", ""))
+            self.result.recipient = _decode_header_value(headers.get("to", ""))
+            self.result.subject = _decode_header_value(headers.get("subject", ""))
+
+        boundary = part.params.get("boundary")
+        if part.content_type.startswith("multipart/") and boundary:
+            self._boundaries.append(boundary.encode("utf-8", "replace"))
+            # Skip the preamble up to the first delimiter
+            part.mode = "skip"
+        elif (
+            part.content_type in ("text/plain", "text/html")
+            and not part.is_attachment
+            and self.collected < self.byte_budget
+        ):
+            part.mode = "collect"
+            encoding = part.headers.get("content-transfer-encoding", "7bit").strip().lower()
+            part.decoder = _Decoder(encoding)
+        else:
+            part.mode = "skip"
+            self.result.skipped_parts += 1
+
+    def _collect(self, decoded: bytes):
+        remaining = self.byte_budget - self.collected
+        if len(decoded) >= remaining:
+            decoded = decoded[:remaining]
+            self.result.truncated = True
+            self.done = True
+        self.collected += len(decoded)
+        self._part.body.append(decoded)
+
+    def _finish_part(self):
+        part = self._part
+        if part.mode != "collect":
+            return
+        if not self.done:
+            self._collect(part.decoder.flush())
+        charset = part.params.get("charset", "utf-8")
+        raw = b"".join(part.body)
+        try:
+            text = raw.decode(charset, "replace")
+        except LookupError:
+            text = raw.decode("utf-8", "replace")
+        target = self.result.html_parts if part.content_type == "text/html" else self.result.plain_parts
+        target.append(text)
+        part.mode = "done"
+
+
+async def parse_message_stream(
+    chunks: AsyncIterator[bytes],
+    byte_budget: int = RAW_EMAIL_BYTE_BUDGET,
+    max_bytes: int = RAW_EMAIL_MAX_BYTES
+) -> ParsedMessage:
+    """
+    Parse a raw RFC 822 message from an async byte stream
+
+    Args:
+        chunks: Async iterator of raw message bytes, e.g. request.stream()
+        byte_budget: Decoded text bytes to collect before reading stops
+        max_bytes: Raw bytes after which reading stops regardless
+
+    Returns:
+        ParsedMessage with the sender, recipient, subject and the text to
+        classify; attachments and other non-text parts are never buffered
+    """
+    parser = StreamingMimeParser(byte_budget, max_bytes)
+    async for chunk in chunks:
+        if chunk and parser.feed(chunk):
+            break
+    return parser.close()
@@ -0,0 +1,271 @@
+import json
+import logging
+import os
+import random
+import re
+import secrets
+import sys
+import threading
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from time import perf_counter
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Fraction of profiled-route requests to profile; 0 disables sampling
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+# Requests sending "X-Profile: <PROFILE_TOKEN>" are always profiled
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+PROFILE_FOLDER = os.getenv(
+    "PROFILE_FOLDER", os.path.join(os.getenv("LOG_FOLDER", "/var/log/spam-filter"), "profiles")
+)
+PROFILE_MAX_PROFILES = int(os.getenv("PROFILE_MAX_PROFILES", "50"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "1"))
+# Also record a torch operator-level trace of the forward pass
+PROFILE_TORCH = os.getenv("PROFILE_TORCH", "true").lower() == "true"
+
+PROFILE_HEADER = "X-Profile"
+_PROFILE_ID = re.compile(r"^[0-9]{8}T[0-9]{12}-[0-9a-f]{8}$")
+PROFILE_FILES = {"python": "speedscope.json", "torch": "torch.json"}
+
+_active_profile: ContextVar[Optional["RequestProfile"]] = ContextVar("active_profile", default=None)
+
+
+def active_profile() -> Optional["RequestProfile"]:
+    """
+    The profile recording the current request, if any
+    """
+    return _active_profile.get()
+
+
+class StackSampler(threading.Thread):
+    """
+    Samples the Python stacks of the given threads every interval seconds
+    and exports them in speedscope's sampled-profile format.
+    """
+
+    def __init__(self, threads: Dict[int, str], interval: float):
+        super().__init__(name="profile-sampler", daemon=True)
+        self.threads = threads
+        self.interval = interval
+        self._stop_event = threading.Event()
+        self._frames: Dict[Tuple[str, str, int], int] = {}
+        self._samples: Dict[int, List[Tuple[List[int], float]]] = {ident: [] for ident in threads}
+        self.duration = 0.0
+
+    def _frame_index(self, frame) -> int:
+        code = frame.f_code
+        key = (code.co_name, code.co_filename, code.co_firstlineno)
+        index = self._frames.get(key)
+        if index is None:
+            index = self._frames[key] = len(self._frames)
+        return index
+
+    def run(self):
+        started = last = perf_counter()
+        while not self._stop_event.wait(self.interval):
+            now = perf_counter()
+            frames = sys._current_frames()
+            for ident in self.threads:
+                frame = frames.get(ident)
+                stack = []
+                while frame is not None:
+                    stack.append(self._frame_index(frame))
+                    frame = frame.f_back
+                if stack:
+                    stack.reverse()
+                    # Weighted by the real gap, which exceeds interval when
+                    # the sampler waits for the GIL
+                    self._samples[ident].append((stack, now - last))
+            last = now
+        self.duration = perf_counter() - started
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    def speedscope(self, name: str) -> Dict:
+        frames = [None] * len(self._frames)
+        for (function, filename, line), index in self._frames.items():
+            frames[index] = {"name": function, "file": filename, "line": line}
+        profiles = []
+        for ident, thread_name in self.threads.items():
+            samples = self._samples[ident]
+            profiles.append({
+                "type": "sampled",
+                "name": thread_name,
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": sum(weight for _, weight in samples) * 1000,
+                "samples": [stack for stack, _ in samples],
+                "weights": [weight * 1000 for _, weight in samples],
+            })
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "spam-filter",
+            "activeProfileIndex": 0,
+            "shared": {"frames": frames},
+            "profiles": profiles,
+        }
+
+
+class RequestProfile:
+    """
+    Python stack samples (and optionally a torch trace) for one request
+    """
+
+    def __init__(self, folder: str, endpoint: str, reason: str, interval: float, torch_trace: bool):
+        # Sorts by creation time
+        self.id = f"{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S%f')}-{secrets.token_hex(4)}"
+        self.folder = folder
+        self.endpoint = endpoint
+        self.reason = reason
+        self.torch_trace = torch_trace
+        self.created_at = datetime.now(timezone.utc).isoformat()
+        self.files: Dict[str, str] = {}
+        # The event loop thread plus the threads running forward passes
+        threads = {threading.get_ident(): "event-loop"}
+        for thread in threading.enumerate():
+            if thread.name.startswith("inference"):
+                threads[thread.ident] = thread.name
+        self.sampler = StackSampler(threads, interval)
+
+    def path(self, kind: str) -> str:
+        return os.path.join(self.folder, f"{self.id}.{PROFILE_FILES[kind]}")
+
+    def run_with_torch_profiler(self, func, *args):
+        """
+        Call func (on the inference thread) under the torch profiler and
+        save a Chrome trace of its operators
+        """
+        from torch.profiler import ProfilerActivity, profile
+
+        with profile(activities=[ProfilerActivity.CPU], record_shapes=True) as prof:
+            result = func(*args)
+        prof.export_chrome_trace(self.path("torch"))
+        self.files["torch"] = self.path("torch")
+        return result
+
+
+class RequestProfiler:
+    """
+    Opt-in per-request profiling of the classification routes.
+
+    A request is profiled when it carries the profiling token or is picked
+    by PROFILE_SAMPLE_RATE, and only while no other profile is running.
+    Each profile is a speedscope file of Python stacks from the event loop
+    and inference threads, plus a Chrome trace of the torch operators of
+    its forward pass (which then runs outside the micro-batcher). Only the
+    newest PROFILE_MAX_PROFILES are kept.
+    """
+
+    def __init__(
+        self,
+        folder: str = PROFILE_FOLDER,
+        sample_rate: float = PROFILE_SAMPLE_RATE,
+        token: str = PROFILE_TOKEN,
+        max_profiles: int = PROFILE_MAX_PROFILES,
+        interval_ms: float = PROFILE_INTERVAL_MS,
+        torch_trace: bool = PROFILE_TORCH,
+    ):
+        self.folder = folder
+        self.sample_rate = sample_rate
+        self.token = token
+        self.max_profiles = max(max_profiles, 1)
+        self.interval = max(interval_ms, 0.1) / 1000
+        self.torch_trace = torch_trace
+        self._running = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.sample_rate > 0 or bool(self.token)
+
+    def reason(self, headers) -> Optional[str]:
+        """
+        Why a request with these headers should be profiled, or None
+        """
+        requested = headers.get(PROFILE_HEADER)
+        if requested and self.token and secrets.compare_digest(requested, self.token):
+            return "header"
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            return "sampled"
+        return None
+
+    def begin(self, endpoint: str, reason: str) -> Optional[RequestProfile]:
+        """
+        Start profiling the current request; None if a profile is already running
+        """
+        if not self._running.acquire(blocking=False):
+            return None
+        try:
+            os.makedirs(self.folder, exist_ok=True)
+            profile = RequestProfile(self.folder, endpoint, reason, self.interval, self.torch_trace)
+            profile.sampler.start()
+        except Exception:
+            self._running.release()
+            raise
+        _active_profile.set(profile)
+        return profile
+
+    def finish(self, profile: RequestProfile, status_code: Optional[int]):
+        """
+        Stop sampling and write the profile (blocking)
+        """
+        try:
+            profile.sampler.stop()
+            with open(profile.path("python"), "w") as f:
+                json.dump(profile.sampler.speedscope(f"{profile.endpoint} {profile.id}"), f)
+            profile.files["python"] = profile.path("python")
+            meta = {
+                "id": profile.id,
+                "endpoint": profile.endpoint,
+                "reason": profile.reason,
+                "status_code": status_code,
+                "created_at": profile.created_at,
+                "duration_ms": round(profile.sampler.duration * 1000, 2),
+                "files": sorted(profile.files),
+            }
+            with open(os.path.join(self.folder, f"{profile.id}.meta.json"), "w") as f:
+                json.dump(meta, f)
+            self._prune()
+        finally:
+            self._running.release()
+
+    def _prune(self):
+        ids = sorted(
+            name[:-len(".meta.json")] for name in os.listdir(self.folder) if name.endswith(".meta.json")
+        )
+        for profile_id in ids[:-self.max_profiles]:
+            for suffix in ["meta.json", *PROFILE_FILES.values()]:
+                try:
+                    os.remove(os.path.join(self.folder, f"{profile_id}.{suffix}"))
+                except FileNotFoundError:
+                    pass
+
+    def list(self) -> List[Dict]:
+        """
+        Metadata of the stored profiles, newest first
+        """
+        profiles = []
+        if not os.path.isdir(self.folder):
+            return profiles
+        for name in sorted(os.listdir(self.folder), reverse=True):
+            if not name.endswith(".meta.json"):
+                continue
+            try:
+                with open(os.path.join(self.folder, name)) as f:
+                    profiles.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return profiles
+
+    def file_path(self, profile_id: str, kind: str) -> Optional[str]:
+        """
+        Path of a stored profile file, or None if there is no such file
+        """
+        if not _PROFILE_ID.match(profile_id) or kind not in PROFILE_FILES:
+            return None
+        path = os.path.join(self.folder, f"{profile_id}.{PROFILE_FILES[kind]}")
+        return path if os.path.exists(path) else None
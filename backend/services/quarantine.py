@@ -0,0 +1,414 @@
+import fcntl
+import logging
+import mmap
+import os
+import shutil
+import sqlite3
+import struct
+import threading
+import uuid
+from contextlib import contextmanager
+from email.utils import getaddresses
+from time import time
+from typing import BinaryIO, Dict, List, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+# Segments are sealed and a new one started once they reach this size
+QUARANTINE_SEGMENT_BYTES = int(os.getenv("QUARANTINE_SEGMENT_BYTES", str(64 * 1024 * 1024)))
+# Whole segments whose newest message is older than this are dropped
+QUARANTINE_RETENTION_DAYS = float(os.getenv("QUARANTINE_RETENTION_DAYS", "30"))
+# Sealed segments with at least this share of released messages are compacted
+QUARANTINE_COMPACT_RATIO = float(os.getenv("QUARANTINE_COMPACT_RATIO", "0.5"))
+QUARANTINE_FSYNC = os.getenv("QUARANTINE_FSYNC", "false").lower() == "true"
+
+# Record layout: magic, payload length, 32-byte hex message id, payload
+_MAGIC = b"QMSG"
+_HEADER = struct.Struct(">4sI32s")
+
+
+def recipient_addresses(recipient: str) -> List[str]:
+    """
+    Lower-cased addresses in a recipient header value, e.g.
+    "Bob <Bob@example.com>, carol@example.com"
+    """
+    return sorted({address.lower() for _, address in getaddresses([recipient or ""]) if address})
+
+
+class QuarantineStore:
+    """
+    Append-only quarantine built on rolling segment files.
+
+    Each message is appended to the active segment and its (segment, offset,
+    length) is recorded in a SQLite index together with the sender,
+    recipient and date, so fetching or releasing a message is one primary
+    key lookup plus a slice of a memory-mapped segment. Every recipient
+    address also gets a row in quarantine_recipients, so a user's listing
+    finds messages sent to several people. Retention drops whole segments
+    instead of deleting messages one by one.
+    """
+
+    def __init__(self, folder: str):
+        os.makedirs(folder, exist_ok=True)
+        self.folder = folder
+        self._lock = threading.Lock()
+        self._maps: Dict[int, mmap.mmap] = {}
+        self._db = sqlite3.connect(
+            os.path.join(folder, "index.db"), check_same_thread=False, isolation_level=None, timeout=30
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS quarantine (
+                id TEXT PRIMARY KEY,
+                segment INTEGER NOT NULL,
+                offset INTEGER NOT NULL,
+                length INTEGER NOT NULL,
+                sender TEXT NOT NULL,
+                recipient TEXT NOT NULL,
+                subject TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                released_at REAL
+            )
+            """
+        )
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS quarantine_recipients (
+                address TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                id TEXT NOT NULL,
+                PRIMARY KEY (address, created_at, id)
+            )
+            """
+        )
+        for name, columns in (
+            ("ix_quarantine_sender", "sender, created_at"),
+            ("ix_quarantine_created_at", "created_at"),
+            ("ix_quarantine_segment", "segment"),
+        ):
+            self._db.execute(f"CREATE INDEX IF NOT EXISTS {name} ON quarantine ({columns})")
+        self._db.execute("CREATE INDEX IF NOT EXISTS ix_quarantine_recipients_id ON quarantine_recipients (id)")
+        self._index_recipients()
+
+    def _index_recipients(self):
+        """
+        One-time backfill of quarantine_recipients for stores created before
+        it existed (schema version 1)
+        """
+        if self._db.execute("PRAGMA user_version").fetchone()[0] >= 1:
+            return
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            # Another worker may have migrated while this one waited
+            if self._db.execute("PRAGMA user_version").fetchone()[0] < 1:
+                rows = self._db.execute("SELECT id, recipient, created_at FROM quarantine").fetchall()
+                self._db.executemany(
+                    "INSERT OR IGNORE INTO quarantine_recipients (address, created_at, id) VALUES (?, ?, ?)",
+                    [
+                        (address, created_at, message_id)
+                        for message_id, recipient, created_at in rows
+                        for address in recipient_addresses(recipient)
+                    ],
+                )
+                self._db.execute("DROP INDEX IF EXISTS ix_quarantine_recipient")
+                self._db.execute("PRAGMA user_version = 1")
+            self._db.execute("COMMIT")
+        except Exception:
+            self._db.execute("ROLLBACK")
+            raise
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self.folder, f"{segment:08d}.seg")
+
+    def _segments(self) -> List[int]:
+        return sorted(int(name[:-4]) for name in os.listdir(self.folder) if name.endswith(".seg"))
+
+    @contextmanager
+    def _exclusive(self):
+        """
+        Serialize writers across threads and uvicorn worker processes
+        """
+        with self._lock, open(os.path.join(self.folder, "store.lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _append(self, message_id: str, payload: Union[bytes, BinaryIO]):
+        """
+        Append one record to the active segment (caller holds the lock);
+        payload is bytes or a binary file read from its current position
+        """
+        if isinstance(payload, bytes):
+            length = len(payload)
+        else:
+            start = payload.tell()
+            length = payload.seek(0, os.SEEK_END) - start
+            payload.seek(start)
+        segments = self._segments()
+        segment = segments[-1] if segments else 1
+        path = self._segment_path(segment)
+        if os.path.exists(path) and os.path.getsize(path) >= QUARANTINE_SEGMENT_BYTES:
+            segment += 1
+            path = self._segment_path(segment)
+
+        with open(path, "ab") as f:
+            offset = f.tell() + _HEADER.size
+            f.write(_HEADER.pack(_MAGIC, length, message_id.encode("ascii")))
+            if isinstance(payload, bytes):
+                f.write(payload)
+            else:
+                shutil.copyfileobj(payload, f)
+            f.flush()
+            if QUARANTINE_FSYNC:
+                os.fsync(f.fileno())
+        return segment, offset, length
+
+    def put(self, email_data: Dict[str, str], payload: Union[bytes, BinaryIO]) -> str:
+        """
+        Quarantine a message
+
+        Args:
+            email_data: Sender, recipient and subject for the index
+            payload: The message, as bytes or as a binary file (copied in
+                chunks from its current position, e.g. a spooled SMTP DATA)
+
+        Returns:
+            The message id used to fetch or release it
+        """
+        message_id = uuid.uuid4().hex
+        recipient = email_data.get("recipient", "")
+        with self._exclusive():
+            segment, offset, length = self._append(message_id, payload)
+            created_at = time()
+            self._db.execute("BEGIN")
+            try:
+                self._db.execute(
+                    "INSERT INTO quarantine (id, segment, offset, length, sender, recipient, subject, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        message_id, segment, offset, length,
+                        email_data.get("sender", ""), recipient,
+                        email_data.get("subject", ""), created_at,
+                    ),
+                )
+                self._db.executemany(
+                    "INSERT INTO quarantine_recipients (address, created_at, id) VALUES (?, ?, ?)",
+                    [(address, created_at, message_id) for address in recipient_addresses(recipient)],
+                )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        return message_id
+
+    def _read(self, segment: int, offset: int, length: int) -> bytes:
+        with self._lock:
+            mapped = self._maps.get(segment)
+            if mapped is None or offset + length > len(mapped):
+                # New segment, or the active segment grew since it was mapped
+                if mapped is not None:
+                    mapped.close()
+                with open(self._segment_path(segment), "rb") as f:
+                    mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                self._maps[segment] = mapped
+            return mapped[offset:offset + length]
+
+    def _row(self, row) -> Dict:
+        return {
+            "id": row[0],
+            "sender": row[4],
+            "recipient": row[5],
+            "subject": row[6],
+            "created_at": row[7],
+            "released_at": row[8],
+        }
+
+    def get(self, message_id: str) -> Optional[Dict]:
+        """
+        Fetch a quarantined message and its index entry, or None
+        """
+        with self._lock:
+            row = self._db.execute("SELECT * FROM quarantine WHERE id = ?", (message_id,)).fetchone()
+        if row is None:
+            return None
+        entry = self._row(row)
+        entry["message"] = self._read(row[1], row[2], row[3])
+        return entry
+
+    def mark_released(self, message_id: str, released: bool = True) -> bool:
+        """
+        Flag a message as released (or undo it); returns False if it was
+        already in that state, so concurrent releases deliver only once
+        """
+        with self._lock:
+            if released:
+                cursor = self._db.execute(
+                    "UPDATE quarantine SET released_at = ? WHERE id = ? AND released_at IS NULL",
+                    (time(), message_id),
+                )
+            else:
+                cursor = self._db.execute(
+                    "UPDATE quarantine SET released_at = NULL WHERE id = ? AND released_at IS NOT NULL",
+                    (message_id,),
+                )
+        return cursor.rowcount == 1
+
+    def search(
+        self,
+        sender: Optional[str] = None,
+        recipient: Optional[str] = None,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        include_released: bool = False,
+        limit: int = 100,
+    ) -> List[Dict]:
+        """
+        List index entries, newest first, without touching the segments
+
+        Args:
+            recipient: Only messages with this address among their
+                recipients (case-insensitive)
+        """
+        clauses, params = [], []
+        for clause, value in (
+            ("q.sender = ?", sender), ("q.created_at >= ?", since), ("q.created_at < ?", until),
+        ):
+            if value is not None:
+                clauses.append(clause)
+                params.append(value)
+        if not include_released:
+            clauses.append("q.released_at IS NULL")
+        if recipient is None:
+            source, order = "quarantine q", "q.created_at"
+        else:
+            source, order = "quarantine_recipients r JOIN quarantine q ON q.id = r.id", "r.created_at"
+            clauses.insert(0, "r.address = ?")
+            params.insert(0, recipient.strip().lower())
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT q.* FROM {source} {where} ORDER BY {order} DESC LIMIT ?", (*params, limit)
+            ).fetchall()
+        return [self._row(row) for row in rows]
+
+    def _forget_segment(self, segment: int):
+        """
+        Remove a segment's index entries (caller holds the lock)
+        """
+        self._db.execute(
+            "DELETE FROM quarantine_recipients WHERE id IN (SELECT id FROM quarantine WHERE segment = ?)",
+            (segment,),
+        )
+        self._db.execute("DELETE FROM quarantine WHERE segment = ?", (segment,))
+
+    def _remove_segment_file(self, segment: int):
+        """
+        Unmap and delete a segment no index entry points to any more (caller
+        holds the lock)
+        """
+        mapped = self._maps.pop(segment, None)
+        if mapped is not None:
+            mapped.close()
+        os.remove(self._segment_path(segment))
+
+    def apply_retention(self, days: float = QUARANTINE_RETENTION_DAYS) -> int:
+        """
+        Drop sealed segments whose newest message is older than days
+
+        Returns:
+            Number of segments removed
+        """
+        cutoff = time() - days * 86400
+        removed = 0
+        with self._exclusive():
+            for segment in self._segments()[:-1]:
+                newest = self._db.execute(
+                    "SELECT MAX(created_at) FROM quarantine WHERE segment = ?", (segment,)
+                ).fetchone()[0]
+                if newest is None or newest < cutoff:
+                    self._db.execute("BEGIN IMMEDIATE")
+                    try:
+                        self._forget_segment(segment)
+                        self._db.execute("COMMIT")
+                    except Exception:
+                        self._db.execute("ROLLBACK")
+                        raise
+                    self._remove_segment_file(segment)
+                    removed += 1
+        return removed
+
+    def compact(self, ratio: float = QUARANTINE_COMPACT_RATIO) -> int:
+        """
+        Rewrite sealed segments that are mostly released messages, copying
+        the messages still held into the active segment
+
+        Returns:
+            Number of segments compacted
+        """
+        compacted = 0
+        with self._exclusive():
+            for segment in self._segments()[:-1]:
+                total, released = self._db.execute(
+                    "SELECT COUNT(*), COUNT(released_at) FROM quarantine WHERE segment = ?", (segment,)
+                ).fetchone()
+                if total and released / total < ratio:
+                    continue
+                held = self._db.execute(
+                    "SELECT id, offset, length FROM quarantine WHERE segment = ? AND released_at IS NULL",
+                    (segment,),
+                ).fetchall()
+                self._db.execute("BEGIN IMMEDIATE")
+                try:
+                    for message_id, offset, length in held:
+                        new_segment, new_offset, _ = self._append(message_id, self._read_unlocked(segment, offset, length))
+                        self._db.execute(
+                            "UPDATE quarantine SET segment = ?, offset = ? WHERE id = ?",
+                            (new_segment, new_offset, message_id),
+                        )
+                    self._forget_segment(segment)
+                    self._db.execute("COMMIT")
+                except Exception:
+                    self._db.execute("ROLLBACK")
+                    raise
+                # Only once the index no longer points into it
+                self._remove_segment_file(segment)
+                compacted += 1
+        return compacted
+
+    def _read_unlocked(self, segment: int, offset: int, length: int) -> bytes:
+        with open(self._segment_path(segment), "rb") as f:
+            f.seek(offset)
+            return f.read(length)
+
+    def maintain(self) -> Dict[str, int]:
+        """
+        Periodic housekeeping: retention, then compaction
+        """
+        result = {"expired_segments": self.apply_retention(), "compacted_segments": self.compact()}
+        if any(result.values()):
+            logger.info(f"Quarantine maintenance: {result}")
+        return result
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            total, released = self._db.execute(
+                "SELECT COUNT(*), COUNT(released_at) FROM quarantine"
+            ).fetchone()
+        segments = self._segments()
+        return {
+            "messages": total,
+            "released": released,
+            "segments": len(segments),
+            "bytes": sum(os.path.getsize(self._segment_path(s)) for s in segments),
+        }
+
+    def close(self):
+        with self._lock:
+            for mapped in self._maps.values():
+                mapped.close()
+            self._maps.clear()
+            self._db.close()
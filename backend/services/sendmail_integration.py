@@ -1,10 +1,15 @@
+import io
 import os
 import logging
 import subprocess
-from typing import Dict, Any
-from datetime import datetime
+from typing import BinaryIO, Dict, Any, Optional
 from dotenv import load_dotenv
 
+from backend.services.audit_log import AuditLogger
+from backend.services.delivery import DeliveryService
+from backend.services.metrics import timed
+from backend.services.quarantine import QuarantineStore
+
 # Load environment variables
 load_dotenv()
 
@@ -21,7 +26,10 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 class EmailHandler:
-    def __init__(self):
+    def __init__(self, delivery: Optional[DeliveryService] = None):
+        # When set, legitimate mail is queued for the SMTP worker pool
+        # instead of forking sendmail for every message
+        self.delivery = delivery
         self.spam_folder = os.getenv("SPAM_FOLDER", "/var/spool/mail/spam")
         self.log_folder = os.getenv("LOG_FOLDER", "/var/log/spam-filter")
         
@@ -29,56 +37,108 @@ class EmailHandler:
         os.makedirs(self.spam_folder, exist_ok=True)
         os.makedirs(self.log_folder, exist_ok=True)
 
-    def _log_action(self, action: str, email_data: Dict[str, Any]):
+        self.quarantine = QuarantineStore(self.spam_folder)
+        self.audit = AuditLogger(self.log_folder)
+
+    def log_action(self, action: str, email_data: Dict[str, Any], **extra):
         """
-        Log email handling action
+        Record an email handling action in the audit log
         """
-        timestamp = datetime.now().isoformat()
-        log_entry = {
-            'timestamp': timestamp,
-            'action': action,
-            'sender': email_data.get('sender', ''),
-            'recipient': email_data.get('recipient', ''),
-            'subject': email_data.get('subject', '')
-        }
-        
-        log_file = os.path.join(self.log_folder, f"spam_filter_{datetime.now().strftime('%Y%m%d')}.log")
-        
-        with open(log_file, 'a') as f:
-            f.write(f"{log_entry}\n")
-        
-        logger.info(f"Action: {action} - From: {email_data.get('sender')} - To: {email_data.get('recipient')}")
+        with timed("log"):
+            self.audit.log(action, email_data, **extra)
+        logger.debug(f"Action: {action} - From: {email_data.get('sender')} - To: {email_data.get('recipient')}")
+
+    def close(self):
+        """
+        Flush the audit log and release the quarantine store
+        """
+        self.audit.close()
+        self.quarantine.close()
 
-    def handle_spam(self, email_data: Dict[str, Any]):
+    def handle_spam(self, email_data: Dict[str, Any], raw: Optional[BinaryIO] = None) -> str:
         """
-        Handle spam email by saving it to the spam folder
+        Handle spam email by appending it to the quarantine store
+
+        Args:
+            email_data: Sender, recipient, subject and content
+            raw: The original RFC 822 message (e.g. spooled SMTP DATA), stored
+                as is instead of a message rendered from email_data
+
+        Returns:
+            Quarantine id of the message
         """
         try:
-            # Save spam to spam folder
-            spam_file = os.path.join(
-                self.spam_folder,
-                f"spam_{datetime.now().strftime('%Y%m%d_%H%M%S')}.eml"
-            )
-            
-            with open(spam_file, 'w', encoding='utf-8') as f:
-                f.write(f"From: {email_data['sender']}\n")
-                f.write(f"To: {email_data['recipient']}\n")
-                f.write(f"Subject: {email_data['subject']}\n")
-                f.write("\n")
-                f.write(email_data['content'])
-            
+            if raw is None:
+                message = (
+                    f"From: {email_data['sender']}\n"
+                    f"To: {email_data['recipient']}\n"
+                    f"Subject: {email_data['subject']}\n"
+                    f"\n"
+                    f"{email_data['content']}"
+                ).encode("utf-8")
+            else:
+                message = raw
+            with timed("quarantine"):
+                message_id = self.quarantine.put(email_data, message)
+
             # Log the action
-            self._log_action("SPAM_REJECTED", email_data)
-            logger.info(f"Spam email saved to: {spam_file}")
-            
+            self.log_action("SPAM_REJECTED", email_data, quarantine_id=message_id)
+            return message_id
+
         except Exception as e:
             logger.error(f"Error handling spam: {str(e)}")
             raise
 
-    def handle_legitimate(self, email_data: Dict[str, Any]):
+    def release(self, message_id: str) -> Optional[Dict[str, Any]]:
         """
-        Handle legitimate email by sending it via sendmail
+        Deliver a quarantined message to its recipient
+
+        Returns:
+            The quarantine entry, or None if there is no such message
         """
+        entry = self.quarantine.get(message_id)
+        if entry is None:
+            return None
+        if self.quarantine.mark_released(message_id):
+            email_data = {
+                "sender": entry["sender"],
+                "recipient": entry["recipient"],
+                "subject": entry["subject"],
+            }
+            try:
+                # The stored message goes out unchanged, headers and attachments included
+                self.handle_legitimate(email_data, raw=io.BytesIO(entry["message"]))
+            except Exception:
+                self.quarantine.mark_released(message_id, released=False)
+                raise
+            self.log_action("SPAM_RELEASED", email_data, quarantine_id=message_id)
+        return entry
+
+    def handle_legitimate(self, email_data: Dict[str, Any], raw: Optional[BinaryIO] = None):
+        """
+        Handle legitimate email by queueing it for delivery, or by sending it
+        via sendmail when no delivery service is configured
+
+        Args:
+            email_data: Sender, recipient, subject and content; the envelope
+                recipients are the comma separated recipient addresses
+            raw: The original RFC 822 message, delivered as is instead of a
+                message rendered from email_data
+        """
+        if self.delivery is not None:
+            try:
+                with timed("deliver"):
+                    message_id = self.delivery.enqueue(email_data, None if raw is None else raw.read())
+                self.log_action("EMAIL_ACCEPTED", email_data, delivery_id=message_id)
+                return
+            except Exception as e:
+                logger.error(f"Error queueing legitimate email: {str(e)}")
+                raise
+
+        if raw is not None:
+            self._sendmail_raw(email_data, raw)
+            return
+
         try:
             # Create email content
             email_content = f"""From: {email_data['sender']}
@@ -89,22 +149,43 @@ Subject: {email_data['subject']}
 """
             
             # Send email using sendmail
-            process = subprocess.Popen(
-                ['sendmail', '-t'],
-                stdin=subprocess.PIPE,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE
-            )
-            
-            stdout, stderr = process.communicate(input=email_content.encode())
+            with timed("deliver"):
+                process = subprocess.Popen(
+                    ['sendmail', '-t'],
+                    stdin=subprocess.PIPE,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE
+                )
+                
+                stdout, stderr = process.communicate(input=email_content.encode())
             
             if process.returncode != 0:
                 raise Exception(f"Sendmail error: {stderr.decode()}")
             
             # Log the action
-            self._log_action("EMAIL_ACCEPTED", email_data)
-            logger.info(f"Email sent via sendmail to: {email_data['recipient']}")
+            self.log_action("EMAIL_ACCEPTED", email_data)
             
         except Exception as e:
             logger.error(f"Error handling legitimate email: {str(e)}")
-            raise 
\ No newline at end of file
+            raise 
+
+    def _sendmail_raw(self, email_data: Dict[str, Any], raw: BinaryIO):
+        """
+        Pipe an original message to sendmail with an explicit envelope, so
+        its headers are left alone
+        """
+        recipients = [r.strip() for r in email_data["recipient"].split(",") if r.strip()]
+        try:
+            with timed("deliver"):
+                process = subprocess.run(
+                    ["sendmail", "-i", "-f", email_data["sender"] or "<>", "--", *recipients],
+                    input=raw.read(),
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                )
+            if process.returncode != 0:
+                raise Exception(f"Sendmail error: {process.stderr.decode()}")
+            self.log_action("EMAIL_ACCEPTED", email_data)
+        except Exception as e:
+            logger.error(f"Error handling legitimate email: {str(e)}")
+            raise
@@ -0,0 +1,297 @@
+import asyncio
+import logging
+import os
+import socket
+import tempfile
+from typing import BinaryIO, List, Optional
+
+from backend.services.email_processor import process_email
+from backend.services.metrics import timed
+from backend.services.mime_ingest import StreamingMimeParser
+
+logger = logging.getLogger(__name__)
+
+SMTP_ENABLED = os.getenv("SMTP_ENABLED", "false").lower() == "true"
+SMTP_HOST = os.getenv("SMTP_HOST", "127.0.0.1")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "10025"))
+# "smtp" for a content-filter hop, "lmtp" for final delivery from the MTA
+SMTP_PROTOCOL = os.getenv("SMTP_PROTOCOL", "smtp").lower()
+SMTP_HOSTNAME = os.getenv("SMTP_HOSTNAME", "spam-filter.local")
+SMTP_MAX_MESSAGE_BYTES = int(os.getenv("SMTP_MAX_MESSAGE_BYTES", str(25 * 1024 * 1024)))
+# Spam at or above this confidence is rejected outright; other spam is quarantined
+SMTP_REJECT_THRESHOLD = float(os.getenv("SMTP_REJECT_THRESHOLD", "0.99"))
+SMTP_MAX_RECIPIENTS = int(os.getenv("SMTP_MAX_RECIPIENTS", "100"))
+SMTP_MAX_LINE_BYTES = 64 * 1024
+SMTP_IDLE_TIMEOUT = float(os.getenv("SMTP_IDLE_TIMEOUT", "300"))
+# DATA is spooled here (system temp directory when unset) so the original
+# message can be quarantined or relayed without holding it in memory
+SMTP_SPOOL_DIR = os.getenv("SMTP_SPOOL_DIR") or None
+
+
+class _Session:
+    def __init__(self):
+        self.greeted = False
+        self.mail_from: Optional[str] = None
+        self.recipients: List[str] = []
+
+    def reset(self):
+        self.mail_from = None
+        self.recipients = []
+
+
+def _address(argument: str, keyword: str) -> Optional[str]:
+    """
+    Extract the address from 'FROM:<a@b> SIZE=123' style arguments
+    """
+    if not argument.upper().startswith(keyword):
+        return None
+    value = argument[len(keyword):].strip()
+    if value.startswith("<"):
+        end = value.find(">")
+        if end == -1:
+            return None
+        return value[1:end]
+    return value.split(" ", 1)[0]
+
+
+class ClassifyingSMTPServer:
+    """
+    Asyncio SMTP/LMTP listener that classifies messages inline.
+
+    DATA is streamed through the MIME parser as it arrives and spooled to
+    a temporary file, so attachments are never held in memory. The verdict
+    is returned within the transaction: legitimate mail is handed to the
+    shared EmailHandler for delivery and accepted (250), spam is quarantined
+    and accepted, and high-confidence spam is rejected (550). Either way the
+    original message is passed on byte for byte. While the model is still
+    loading, messages get a 451 so the MTA retries later.
+
+    Every uvicorn worker runs a listener; they share the port through
+    SO_REUSEPORT and the kernel spreads connections between them.
+    """
+
+    def __init__(
+        self,
+        runtime,
+        email_handler,
+        host: str = SMTP_HOST,
+        port: int = SMTP_PORT,
+        protocol: str = SMTP_PROTOCOL,
+        reject_threshold: float = SMTP_REJECT_THRESHOLD,
+    ):
+        if protocol not in ("smtp", "lmtp"):
+            raise ValueError("protocol must be 'smtp' or 'lmtp'")
+        self.runtime = runtime
+        self.email_handler = email_handler
+        self.host = host
+        self.port = port
+        self.lmtp = protocol == "lmtp"
+        self.reject_threshold = reject_threshold
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self):
+        if SMTP_SPOOL_DIR:
+            try:
+                os.makedirs(SMTP_SPOOL_DIR, exist_ok=True)
+            except OSError as e:
+                # DATA answers 451 until the directory is usable
+                logger.error(f"SMTP spool directory {SMTP_SPOOL_DIR} unavailable: {str(e)}")
+        self._server = await asyncio.start_server(
+            self._handle, self.host, self.port, limit=SMTP_MAX_LINE_BYTES,
+            reuse_port=hasattr(socket, "SO_REUSEPORT"),
+        )
+        sockets = self._server.sockets or []
+        if sockets:
+            # Port 0 picks a free port; report the real one
+            self.port = sockets[0].getsockname()[1]
+        logger.info(f"{'LMTP' if self.lmtp else 'SMTP'} listener on {self.host}:{self.port}")
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _reply(self, writer: asyncio.StreamWriter, lines):
+        if isinstance(lines, str):
+            lines = [lines]
+        for i, line in enumerate(lines):
+            code, text = line[:3], line[4:]
+            separator = "-" if i < len(lines) - 1 else " "
+            writer.write(f"{code}{separator}{text}\r\n".encode())
+        await writer.drain()
+
+    async def _read_line(self, reader: asyncio.StreamReader):
+        """
+        Read one line; overlong lines are returned in pieces with
+        complete=False
+        """
+        try:
+            line = await asyncio.wait_for(reader.readuntil(b"\n"), SMTP_IDLE_TIMEOUT)
+            return line, True
+        except asyncio.IncompleteReadError as e:
+            return e.partial, True
+        except asyncio.LimitOverrunError as e:
+            return await reader.readexactly(e.consumed), False
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        session = _Session()
+        try:
+            await self._reply(writer, f"220 {SMTP_HOSTNAME} {'LMTP' if self.lmtp else 'ESMTP'} spam filter ready")
+            while True:
+                line, _ = await self._read_line(reader)
+                if not line:
+                    break
+                command_line = line.decode("utf-8", "replace").strip()
+                command, _, argument = command_line.partition(" ")
+                command = command.upper()
+
+                if command == "QUIT":
+                    await self._reply(writer, "221 2.0.0 Bye")
+                    break
+                await self._command(reader, writer, session, command, argument.strip())
+        except (asyncio.TimeoutError, ConnectionError) as e:
+            logger.info(f"SMTP connection closed: {str(e) or type(e).__name__}")
+        except Exception as e:
+            logger.error(f"SMTP session error: {str(e)}")
+        finally:
+            writer.close()
+
+    async def _command(self, reader, writer, session: _Session, command: str, argument: str):
+        greetings = ("LHLO",) if self.lmtp else ("EHLO", "HELO")
+        if command in greetings:
+            session.greeted = True
+            session.reset()
+            if command == "HELO":
+                await self._reply(writer, f"250 {SMTP_HOSTNAME}")
+            else:
+                await self._reply(writer, [
+                    f"250 {SMTP_HOSTNAME}",
+                    "250 PIPELINING",
+                    "250 8BITMIME",
+                    f"250 SIZE {SMTP_MAX_MESSAGE_BYTES}",
+                    "250 ENHANCEDSTATUSCODES",
+                ])
+        elif not session.greeted:
+            await self._reply(writer, f"503 5.5.1 Send {greetings[0]} first")
+        elif command == "MAIL":
+            address = _address(argument, "FROM:")
+            if address is None:
+                await self._reply(writer, "501 5.5.4 Syntax: MAIL FROM:<address>")
+            elif session.mail_from is not None:
+                await self._reply(writer, "503 5.5.1 Sender already specified")
+            else:
+                session.mail_from = address
+                await self._reply(writer, "250 2.1.0 OK")
+        elif command == "RCPT":
+            address = _address(argument, "TO:")
+            if session.mail_from is None:
+                await self._reply(writer, "503 5.5.1 Need MAIL first")
+            elif not address:
+                await self._reply(writer, "501 5.5.4 Syntax: RCPT TO:<address>")
+            elif len(session.recipients) >= SMTP_MAX_RECIPIENTS:
+                await self._reply(writer, "452 4.5.3 Too many recipients")
+            else:
+                session.recipients.append(address)
+                await self._reply(writer, "250 2.1.5 OK")
+        elif command == "DATA":
+            if not session.recipients:
+                await self._reply(writer, "503 5.5.1 Need RCPT first")
+                return
+            await self._reply(writer, "354 End data with <CR><LF>.<CR><LF>")
+            try:
+                spool = tempfile.TemporaryFile(dir=SMTP_SPOOL_DIR)
+            except OSError as e:
+                # The message is still read to the end, then refused for now
+                logger.error(f"SMTP spool file could not be created: {str(e)}")
+                spool = None
+            try:
+                replies = await self._data(reader, session, spool)
+            finally:
+                if spool is not None:
+                    spool.close()
+            session.reset()
+            for reply in replies:
+                await self._reply(writer, reply)
+        elif command == "RSET":
+            session.reset()
+            await self._reply(writer, "250 2.0.0 OK")
+        elif command == "NOOP":
+            await self._reply(writer, "250 2.0.0 OK")
+        else:
+            await self._reply(writer, "502 5.5.2 Command not implemented")
+
+    async def _data(self, reader, session: _Session, spool: Optional[BinaryIO]) -> List[str]:
+        """
+        Stream DATA into the MIME parser and the spool file, then classify
+        and hand the message on. Without a usable spool (None, or a write
+        failed) the message is read to the end and answered with 451.
+
+        Returns:
+            One reply for SMTP, one per recipient for LMTP
+        """
+        parser = StreamingMimeParser()
+        size = 0
+        at_line_start = True
+        while True:
+            line, complete = await self._read_line(reader)
+            if not line:
+                raise ConnectionError("connection lost during DATA")
+            if at_line_start and line.rstrip(b"\r\n") == b".":
+                break
+            if at_line_start and line.startswith(b"."):
+                line = line[1:]
+            at_line_start = complete
+            size += len(line)
+            if size <= SMTP_MAX_MESSAGE_BYTES:
+                if spool is not None:
+                    try:
+                        spool.write(line)
+                    except OSError as e:
+                        logger.error(f"SMTP spool write failed: {str(e)}")
+                        spool = None
+                # Once the parser has enough text it ignores the rest
+                parser.feed(line)
+
+        count = len(session.recipients) if self.lmtp else 1
+        if size > SMTP_MAX_MESSAGE_BYTES:
+            return ["552 5.3.4 Message size exceeds fixed limit"] * count
+        if spool is None:
+            return ["451 4.3.0 Temporary local error"] * count
+        if not self.runtime.ready:
+            return ["451 4.3.0 Spam classifier not ready, try again later"] * count
+
+        parsed = parser.close()
+        email_data = parsed.to_email_data()
+        email_data["sender"] = email_data["sender"] or session.mail_from
+        email_data["recipient"] = ", ".join(session.recipients)
+
+        try:
+            with timed("preprocess"):
+                processed_content = process_email(email_data["content"])
+            with timed("classify"):
+                is_spam, confidence = await self.runtime.classify(processed_content)
+        except Exception as e:
+            logger.error(f"SMTP classification failed: {str(e)}")
+            return ["451 4.3.0 Temporary classification failure"] * count
+
+        spool.seek(0)
+        loop = asyncio.get_running_loop()
+        try:
+            if is_spam and confidence >= self.reject_threshold:
+                self.email_handler.log_action("SPAM_REJECTED", email_data)
+                reply = f"550 5.7.1 Message rejected as spam ({confidence:.3f})"
+            elif is_spam:
+                # Quarantine and delivery do file, SQLite or sendmail I/O
+                await loop.run_in_executor(None, self.email_handler.handle_spam, email_data, spool)
+                reply = f"250 2.6.0 Message quarantined as spam ({confidence:.3f})"
+            else:
+                # Relayed with the SMTP envelope, not the header addresses
+                envelope = {**email_data, "sender": session.mail_from}
+                await loop.run_in_executor(None, self.email_handler.handle_legitimate, envelope, spool)
+                reply = f"250 2.6.0 Message accepted ({confidence:.3f})"
+        except Exception as e:
+            logger.error(f"SMTP message handling failed: {str(e)}")
+            reply = "451 4.3.0 Temporary local error"
+
+        return [reply] * count
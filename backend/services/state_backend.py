@@ -0,0 +1,484 @@
+import asyncio
+import fcntl
+import functools
+import hashlib
+import mmap
+import os
+import socket
+import struct
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from time import time
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+from limits.storage import Storage
+from slowapi import Limiter
+
+# memory: per-process LRU/TTL, shm: shared by the workers on one host,
+# redis: shared by every host (any server speaking the Redis protocol)
+STATE_BACKEND = os.getenv("STATE_BACKEND", "memory").lower()
+STATE_MAX_ENTRIES = int(os.getenv("STATE_MAX_ENTRIES", "100000"))
+STATE_SHM_PATH = os.getenv("STATE_SHM_PATH", "/dev/shm/spam-filter-state")
+STATE_REDIS_URL = os.getenv("STATE_REDIS_URL", "redis://localhost:6379/0")
+STATE_REDIS_TIMEOUT = float(os.getenv("STATE_REDIS_TIMEOUT", "0.5"))
+STATE_KEY_PREFIX = os.getenv("STATE_KEY_PREFIX", "spam-filter:")
+
+
+class StateBackend:
+    """
+    Expiring integer counters shared by the rate limiter and login lockouts.
+
+    Every key carries a TTL set when it is created; incr() on an existing
+    key keeps its expiry (fixed window).
+    """
+
+    # Operations wait on the network and must not run on the event loop
+    blocking = False
+
+    async def run(self, func, *args):
+        """
+        Call one of the backend's methods from async code, in the default
+        executor when the backend is blocking
+        """
+        if not self.blocking:
+            return func(*args)
+        return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+    def incr(self, key: str, ttl: float, amount: int = 1) -> int:
+        raise NotImplementedError
+
+    def get(self, key: str) -> int:
+        raise NotImplementedError
+
+    def expires_at(self, key: str) -> float:
+        """
+        Unix time the key expires, or now if it does not exist
+        """
+        raise NotImplementedError
+
+    def set(self, key: str, value: int, ttl: float):
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def check(self) -> bool:
+        return True
+
+    def stats(self) -> Dict:
+        return {}
+
+
+class MemoryStateBackend(StateBackend):
+    """
+    In-process LRU/TTL store with a hard cap on the number of keys
+    """
+
+    def __init__(self, max_entries: int = STATE_MAX_ENTRIES):
+        self.max_entries = max(max_entries, 1)
+        self._entries: "OrderedDict[str, List]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def _live(self, key: str, now: float) -> Optional[List]:
+        entry = self._entries.get(key)
+        if entry is not None and entry[1] <= now:
+            del self._entries[key]
+            return None
+        return entry
+
+    def _store(self, key: str, entry: List):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def incr(self, key: str, ttl: float, amount: int = 1) -> int:
+        now = time()
+        with self._lock:
+            entry = self._live(key, now)
+            if entry is None:
+                entry = [0, now + ttl]
+            entry[0] += amount
+            self._store(key, entry)
+            return entry[0]
+
+    def get(self, key: str) -> int:
+        with self._lock:
+            entry = self._live(key, time())
+            return entry[0] if entry else 0
+
+    def expires_at(self, key: str) -> float:
+        now = time()
+        with self._lock:
+            entry = self._live(key, now)
+            return entry[1] if entry else now
+
+    def set(self, key: str, value: int, ttl: float):
+        with self._lock:
+            self._store(key, [value, time() + ttl])
+
+    def delete(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        return {"backend": "memory", "entries": len(self._entries),
+                "max_entries": self.max_entries, "evictions": self.evictions}
+
+
+class SharedMemoryStateBackend(StateBackend):
+    """
+    Fixed-size hash table in a memory-mapped file (under /dev/shm by default)
+    shared by every worker process on the host and guarded by flock.
+
+    Keys are stored as 8-byte hashes. A key lives in one of PROBE slots
+    after its home slot; when they are all taken by live keys the one
+    closest to expiry is evicted, so memory never grows past the file.
+    """
+
+    PROBE = 16
+    _SLOT = struct.Struct("<Qqd")  # key hash, value, expires at
+
+    def __init__(self, path: str = STATE_SHM_PATH, slots: int = STATE_MAX_ENTRIES):
+        self.slots = max(slots, self.PROBE)
+        size = self.slots * self._SLOT.size
+        self._lock = threading.Lock()
+        self._file = open(path, "a+b")
+        with self._exclusive():
+            if os.fstat(self._file.fileno()).st_size != size:
+                # First worker (or a new size): start from an empty table
+                self._file.truncate(0)
+                self._file.truncate(size)
+        self._map = mmap.mmap(self._file.fileno(), size)
+        self.evictions = 0
+
+    @contextmanager
+    def _exclusive(self):
+        with self._lock:
+            fcntl.flock(self._file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._file, fcntl.LOCK_UN)
+
+    def _hash(self, key: str) -> int:
+        # 0 marks an empty slot
+        return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "little") or 1
+
+    def _find(self, key: str, now: float, create: bool) -> Optional[Tuple[int, int, int, float]]:
+        """
+        Locate the slot of a live key, or claim one for it if create is set
+
+        Returns:
+            (offset, key hash, value, expires at) or None
+        """
+        key_hash = self._hash(key)
+        home = key_hash % self.slots
+        free = None
+        victim = None
+        for i in range(self.PROBE):
+            offset = ((home + i) % self.slots) * self._SLOT.size
+            slot_hash, value, expires = self._SLOT.unpack_from(self._map, offset)
+            live = slot_hash and expires > now
+            if live and slot_hash == key_hash:
+                return offset, key_hash, value, expires
+            if not live and free is None:
+                free = offset
+            if live and (victim is None or expires < victim[1]):
+                victim = (offset, expires)
+        if not create:
+            return None
+        if free is None:
+            free = victim[0]
+            self.evictions += 1
+        return free, key_hash, 0, 0.0
+
+    def incr(self, key: str, ttl: float, amount: int = 1) -> int:
+        now = time()
+        with self._exclusive():
+            offset, key_hash, value, expires = self._find(key, now, create=True)
+            if not expires:
+                expires = now + ttl
+            value += amount
+            self._SLOT.pack_into(self._map, offset, key_hash, value, expires)
+            return value
+
+    def get(self, key: str) -> int:
+        with self._exclusive():
+            found = self._find(key, time(), create=False)
+        return found[2] if found else 0
+
+    def expires_at(self, key: str) -> float:
+        now = time()
+        with self._exclusive():
+            found = self._find(key, now, create=False)
+        return found[3] if found else now
+
+    def set(self, key: str, value: int, ttl: float):
+        now = time()
+        with self._exclusive():
+            offset, key_hash, _, _ = self._find(key, now, create=True)
+            self._SLOT.pack_into(self._map, offset, key_hash, value, now + ttl)
+
+    def delete(self, key: str):
+        with self._exclusive():
+            found = self._find(key, time(), create=False)
+            if found:
+                self._SLOT.pack_into(self._map, found[0], 0, 0, 0.0)
+
+    def clear(self):
+        with self._exclusive():
+            self._map[:] = bytes(len(self._map))
+
+    def stats(self) -> Dict:
+        now = time()
+        with self._exclusive():
+            live = sum(
+                1 for offset in range(0, len(self._map), self._SLOT.size)
+                if self._SLOT.unpack_from(self._map, offset)[2] > now
+            )
+        return {"backend": "shm", "entries": live, "slots": self.slots,
+                "evictions_this_worker": self.evictions}
+
+
+class RedisStateBackend(StateBackend):
+    """
+    Minimal RESP client for Redis or any server speaking its protocol.
+
+    Each operation is one pipelined round trip; keys are namespaced with
+    STATE_KEY_PREFIX so clear() only touches ours. The socket is blocking,
+    so async callers go through run().
+    """
+
+    blocking = True
+
+    def __init__(self, url: str = STATE_REDIS_URL, prefix: str = STATE_KEY_PREFIX,
+                 timeout: float = STATE_REDIS_TIMEOUT):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.prefix = prefix
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._sock: Optional[socket.socket] = None
+        self._reader = None
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._sock = sock
+        self._reader = sock.makefile("rb")
+        setup = []
+        if self.password:
+            setup.append(("AUTH", self.password))
+        if self.db:
+            setup.append(("SELECT", str(self.db)))
+        if setup:
+            self._roundtrip(setup)
+
+    def _encode(self, command) -> bytes:
+        parts = [f"*{len(command)}\r\n".encode()]
+        for argument in command:
+            data = argument if isinstance(argument, bytes) else str(argument).encode()
+            parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        return b"".join(parts)
+
+    def _read(self):
+        line = self._reader.readline()
+        if not line:
+            raise ConnectionError("Redis connection closed")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b"+":
+            return payload.decode()
+        if kind == b"-":
+            raise RuntimeError(payload.decode())
+        if kind == b":":
+            return int(payload)
+        if kind == b"$":
+            length = int(payload)
+            if length == -1:
+                return None
+            data = self._reader.read(length + 2)
+            return data[:-2]
+        if kind == b"*":
+            length = int(payload)
+            return None if length == -1 else [self._read() for _ in range(length)]
+        raise ConnectionError(f"Unexpected Redis reply {line!r}")
+
+    def _roundtrip(self, commands):
+        self._sock.sendall(b"".join(self._encode(command) for command in commands))
+        replies = []
+        errors = []
+        for _ in commands:
+            try:
+                replies.append(self._read())
+            except RuntimeError as e:
+                replies.append(None)
+                errors.append(e)
+        if errors:
+            raise errors[0]
+        return replies
+
+    def _pipeline(self, *commands):
+        with self._lock:
+            for attempt in (0, 1):
+                try:
+                    if self._sock is None:
+                        self._connect()
+                    return self._roundtrip(commands)
+                except (OSError, ConnectionError):
+                    # Reconnect once, e.g. after the server closed an idle connection
+                    self._close()
+                    if attempt:
+                        raise
+
+    def _close(self):
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+        self._sock = None
+        self._reader = None
+
+    def incr(self, key: str, ttl: float, amount: int = 1) -> int:
+        key = self.prefix + key
+        _, value = self._pipeline(
+            ("SET", key, 0, "PX", max(int(ttl * 1000), 1), "NX"),
+            ("INCRBY", key, amount),
+        )
+        return value
+
+    def get(self, key: str) -> int:
+        value = self._pipeline(("GET", self.prefix + key))[0]
+        return int(value) if value is not None else 0
+
+    def expires_at(self, key: str) -> float:
+        remaining = self._pipeline(("PTTL", self.prefix + key))[0]
+        return time() + max(remaining, 0) / 1000
+
+    def set(self, key: str, value: int, ttl: float):
+        self._pipeline(("SET", self.prefix + key, value, "PX", max(int(ttl * 1000), 1)))
+
+    def delete(self, key: str):
+        self._pipeline(("DEL", self.prefix + key))
+
+    def clear(self):
+        cursor = b"0"
+        while True:
+            cursor, keys = self._pipeline(("SCAN", cursor, "MATCH", self.prefix + "*", "COUNT", 500))[0]
+            if keys:
+                self._pipeline(("DEL", *keys))
+            if cursor in (b"0", "0"):
+                break
+
+    def check(self) -> bool:
+        try:
+            return self._pipeline(("PING",))[0] == "PONG"
+        except Exception:
+            return False
+
+    def stats(self) -> Dict:
+        return {"backend": "redis", "host": self.host, "port": self.port, "healthy": self.check()}
+
+
+_state_backend: Optional[StateBackend] = None
+
+
+def get_state_backend() -> StateBackend:
+    """
+    Process-wide backend selected by STATE_BACKEND
+    """
+    global _state_backend
+    if _state_backend is None:
+        if STATE_BACKEND == "redis":
+            _state_backend = RedisStateBackend()
+        elif STATE_BACKEND == "shm":
+            _state_backend = SharedMemoryStateBackend()
+        elif STATE_BACKEND == "memory":
+            _state_backend = MemoryStateBackend()
+        else:
+            raise ValueError(f"Unknown STATE_BACKEND {STATE_BACKEND!r}")
+    return _state_backend
+
+
+class LimiterStorage(Storage):
+    """
+    Storage for the limits package (and so slowapi) on top of the state
+    backend: Limiter(storage_uri="spam-filter-state://")
+    """
+
+    STORAGE_SCHEME = ["spam-filter-state"]
+
+    def __init__(self, uri: Optional[str] = None, wrap_exceptions: bool = False, **options):
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+        self.backend = get_state_backend()
+
+    @property
+    def base_exceptions(self):
+        return (OSError, ConnectionError, RuntimeError)
+
+    def incr(self, key: str, expiry: int, elastic_expiry: bool = False, amount: int = 1) -> int:
+        return self.backend.incr("limit:" + key, expiry, amount)
+
+    def get(self, key: str) -> int:
+        return self.backend.get("limit:" + key)
+
+    def get_expiry(self, key: str) -> float:
+        return self.backend.expires_at("limit:" + key)
+
+    def check(self) -> bool:
+        return self.backend.check()
+
+    def reset(self) -> Optional[int]:
+        self.backend.clear()
+        return None
+
+    def clear(self, key: str) -> None:
+        self.backend.delete("limit:" + key)
+
+
+class StateLimiter(Limiter):
+    """
+    slowapi Limiter whose per-route checks run in the default executor when
+    the state backend is blocking, so a Redis round trip never stalls the
+    event loop
+    """
+
+    def limit(self, *args, **kwargs):
+        decorator = super().limit(*args, **kwargs)
+
+        def wrap(func):
+            limited = decorator(func)
+            if not asyncio.iscoroutinefunction(func) or not get_state_backend().blocking:
+                return limited
+
+            @functools.wraps(limited)
+            async def checked(*a, **k):
+                request = k.get("request")
+                if self.enabled and self._auto_check and request is not None and not getattr(
+                    request.state, "_rate_limiting_complete", False
+                ):
+                    await asyncio.get_running_loop().run_in_executor(
+                        None, self._check_request_limit, request, func, False
+                    )
+                    # slowapi skips its own (blocking) check for this request
+                    request.state._rate_limiting_complete = True
+                return await limited(*a, **k)
+
+            return checked
+
+        return wrap
@@ -0,0 +1,142 @@
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from time import monotonic
+from typing import Dict, NamedTuple, Optional, Tuple
+
+USER_CACHE_MAX_ENTRIES = int(os.getenv("USER_CACHE_MAX_ENTRIES", "10000"))
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "60"))
+
+# Shared counter bumped on every email, password or key change
+_EPOCH_KEY = "user-cache:epoch"
+
+
+class AuthUser(NamedTuple):
+    """
+    Detached, immutable view of an authenticated user
+    """
+    id: int
+    email: str
+    api_key: str
+    created_at: Optional[datetime]
+    updated_at: Optional[datetime]
+
+    @classmethod
+    def from_model(cls, user) -> "AuthUser":
+        return cls(user.id, user.email, user.api_key, user.created_at, user.updated_at)
+
+
+class UserCache:
+    """
+    Bounded LRU cache of API key -> AuthUser with a TTL.
+
+    Only successful lookups are cached, so unknown keys always reach the
+    database. When a user's email, password or key changes, invalidate()
+    bumps an epoch counter in the shared state backend; entries cached under
+    an older epoch are dropped by every worker that uses the same backend
+    (shm or redis), so none of them authenticates or authorizes with stale
+    data. Entries never outlive the epoch key, so its expiry cannot revive
+    them.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = USER_CACHE_MAX_ENTRIES,
+        ttl_seconds: float = USER_CACHE_TTL_SECONDS,
+        state=None,
+    ):
+        self.max_entries = max(max_entries, 0)
+        self.ttl = max(ttl_seconds, 0)
+        self.state = state
+        self.epoch_ttl = max(self.ttl * 2, 24 * 3600)
+        self._entries: "OrderedDict[str, Tuple[float, int, AuthUser]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def epoch(self) -> int:
+        """
+        Current shared epoch; blocking when the state backend is, so async
+        callers go through its run()
+        """
+        return self.state.get(_EPOCH_KEY) if self.state is not None else 0
+
+    def get(self, api_key: str, epoch: int = 0) -> Optional[AuthUser]:
+        if not self.max_entries:
+            self.misses += 1
+            return None
+
+        with self._lock:
+            entry = self._entries.get(api_key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            stored_at, stored_epoch, user = entry
+            age = monotonic() - stored_at
+            if stored_epoch != epoch:
+                del self._entries[api_key]
+                self.invalidations += 1
+                self.misses += 1
+                return None
+            if (self.ttl and age > self.ttl) or age > self.epoch_ttl:
+                del self._entries[api_key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(api_key)
+            self.hits += 1
+            return user
+
+    def put(self, user: AuthUser, epoch: int = 0):
+        """
+        Cache a user read from the database
+
+        Args:
+            epoch: The epoch read before the database lookup
+        """
+        if not self.max_entries:
+            return
+
+        with self._lock:
+            self._entries[user.api_key] = (monotonic(), epoch, user)
+            self._entries.move_to_end(user.api_key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, user_id: int):
+        """
+        Drop every entry for a user, whichever key it was cached under, and
+        bump the shared epoch so the other workers drop theirs
+        """
+        with self._lock:
+            stale = [key for key, (_, _, user) in self._entries.items() if user.id == user_id]
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += len(stale)
+        if self.state is not None:
+            self.state.incr(_EPOCH_KEY, self.epoch_ttl)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,28 @@
+"""Add mailbox indexes
+
+Revision ID: 7c3f1a9b2d40
+Revises: e2897675e2ac
+Create Date: 2026-10-18 10:12:44.318207
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c3f1a9b2d40'
+down_revision = 'e2897675e2ac'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Received / spam folders: recipient_id [+ is_spam] ordered by created_at
+    op.create_index('ix_emails_recipient_spam_created', 'emails', ['recipient_id', 'is_spam', 'created_at'], unique=False)
+    # Sent folder: sender_id ordered by created_at
+    op.create_index('ix_emails_sender_created', 'emails', ['sender_id', 'created_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_emails_sender_created', table_name='emails')
+    op.drop_index('ix_emails_recipient_spam_created', table_name='emails')
@@ -0,0 +1,68 @@
+"""Add mailbox stats
+
+Revision ID: b41d0e6f8a27
+Revises: 7c3f1a9b2d40
+Create Date: 2026-10-18 12:03:51.904412
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b41d0e6f8a27'
+down_revision = '7c3f1a9b2d40'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('user_email_stats',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('sent', sa.Integer(), nullable=False),
+    sa.Column('received', sa.Integer(), nullable=False),
+    sa.Column('spam_received', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+    op.create_table('user_email_daily',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('sent', sa.Integer(), nullable=False),
+    sa.Column('received', sa.Integer(), nullable=False),
+    sa.Column('spam_received', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'day')
+    )
+
+    # Backfill the counters from the existing emails, bucketed by UTC day.
+    # created_at is timestamptz on PostgreSQL; SQLite (the test stand-in)
+    # stores the UTC timestamps the application writes as text
+    if op.get_bind().dialect.name == 'postgresql':
+        day = "CAST(created_at AT TIME ZONE 'UTC' AS DATE)"
+    else:
+        day = "DATE(created_at)"
+    op.execute(f"""
+        WITH events AS (
+            SELECT sender_id AS user_id, {day} AS day,
+                   1 AS sent, 0 AS received, 0 AS spam_received
+            FROM emails WHERE sender_id IS NOT NULL
+            UNION ALL
+            SELECT recipient_id, {day},
+                   0, 1, CASE WHEN is_spam THEN 1 ELSE 0 END
+            FROM emails WHERE recipient_id IS NOT NULL
+        )
+        INSERT INTO user_email_daily (user_id, day, sent, received, spam_received)
+        SELECT user_id, day, SUM(sent), SUM(received), SUM(spam_received)
+        FROM events GROUP BY user_id, day
+    """)
+    op.execute("""
+        INSERT INTO user_email_stats (user_id, sent, received, spam_received)
+        SELECT user_id, SUM(sent), SUM(received), SUM(spam_received)
+        FROM user_email_daily GROUP BY user_id
+    """)
+
+
+def downgrade() -> None:
+    op.drop_table('user_email_daily')
+    op.drop_table('user_email_stats')
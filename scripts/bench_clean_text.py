@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Differential check and micro-benchmark for email_processor.clean_text.
+
+Every document in the corpus (hand-written edge cases plus seeded random
+HTML and plain text) must clean to exactly the same string as the
+BeautifulSoup reference implementation; the script exits non-zero on the
+first mismatch, then reports timings for both implementations.
+
+    python scripts/bench_clean_text.py --random 5000 --repeat 3
+"""
+import argparse
+import os
+import random
+import sys
+import warnings
+from time import perf_counter
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.services.email_processor import _clean_text_bs4, clean_text
+
+EDGE_CASES = [
+    "",
+    "   \t\n ",
+    "Hello world",
+    "Plain text with a url http://example.com/x?y=1 and www.example.org",
+    "Contact me at john.doe@example.com or jane@ex.org!",
+    "Win $$$ NOW!!! 100% free, no catch...",
+    "Tom & Jerry &amp; friends &copy; 2024 &notanentity; &amp &lt",
+    "&#65;&#x42;&#X43;&#0;&#128;&#150;&#xD800;&#1114112;&#12ab;&#x1g;",
+    "&amp;lt;b&amp;gt; double escaped &amp;amp;",
+    "<p>Hello <b>world</b></p>",
+    "<html><head><title>T</title><style>p {color: red}</style></head>"
+    "<body><script>var x = '<b>';</script><p>Body</p></body></html>",
+    "<!DOCTYPE html><!-- a comment --><p>after comment</p>",
+    "<![CDATA[cdata text]]> <?xml version='1.0'?> <!ELEMENT foo>",
+    "<ruby>漢<rp>(</rp><rt>kan</rt><rp>)</rp></ruby>字",
+    "<template><p>hidden</p></template>visible",
+    "<br>line<br/>break</br><img src=x>img<hr></hr>end",
+    "<script/>not script<style/>not style",
+    "<div><span>unclosed <b>bold <i>italic</div>after",
+    "</p>stray end<p>open",
+    "<a href='http://spam.example'>click here</a> to win",
+    "text < 5 and x > 3 <notatag",
+    "<p>multi\r\nline\rtext\x00nul nbsp em</p>",
+    "<pre>  keep   spaces  </pre><textarea> a  b </textarea>",
+    "<svg:rect>ns</svg:rect><x:y>colon</x:y>",
+    "<TABLE><TR><TD>Upper</TD></TR></TABLE>",
+    "unicode café naïve 日本語 emoji 🎉 under_score",
+    "<p>&nbsp;&nbsp;spaced&nbsp;out&hellip;</p>",
+    "<scr<script>ipt>alert(1)</script>",
+    "<style>a</style><template><script>b</script>c</template><rt>d</rt>e",
+]
+
+TAGS = ["p", "div", "span", "b", "a", "br", "img", "script", "style", "template",
+        "rt", "rp", "pre", "td", "hr", "input", "title", "textarea", "x:y"]
+WORDS = ["free", "money", "hello", "meeting", "café", "日本", "win", "http://x.io/a",
+         "www.spam.biz", "a@b.com", "&amp;", "&lt;", "&#169;", "&#x41;", "&bogus;",
+         "&copy", "100%", "!!!", "<", ">", "&", "]]>", "--", "\n", "\t", " ", "\r\n",
+         "_", " ", "$"]
+
+
+def random_document(rng: random.Random) -> str:
+    parts = []
+    for _ in range(rng.randint(0, 60)):
+        roll = rng.random()
+        tag = rng.choice(TAGS)
+        if roll < 0.15:
+            parts.append(f"<{tag}>")
+        elif roll < 0.25:
+            parts.append(f"</{tag}>")
+        elif roll < 0.28:
+            parts.append(f"<{tag}/>")
+        elif roll < 0.31:
+            parts.append(f"<{tag} href='{rng.choice(WORDS)}' class=x>")
+        elif roll < 0.33:
+            parts.append(f"<!-- {rng.choice(WORDS)} -->")
+        elif roll < 0.35:
+            parts.append(f"<![CDATA[{rng.choice(WORDS)}]]>")
+        elif roll < 0.36:
+            parts.append("<!DOCTYPE html>")
+        else:
+            parts.append(rng.choice(WORDS))
+        if rng.random() < 0.5:
+            parts.append(" ")
+    return "".join(parts)
+
+
+def build_corpus(count: int, seed: int):
+    rng = random.Random(seed)
+    corpus = list(EDGE_CASES)
+    for i in range(count):
+        document = random_document(rng)
+        if i % 3 == 0:
+            # Plain text variant, exercising the non-HTML fast path
+            document = document.replace("<", " ").replace("&", " and ")
+        corpus.append(document)
+    # A large newsletter-style document
+    corpus.append("<html><body>" + "".join(
+        f"<table><tr><td><a href='http://t.co/{i}'>Offer {i}</a> &amp; more"
+        f"<img src='x{i}.png'></td></tr></table>" for i in range(2000)
+    ) + "</body></html>")
+    return corpus
+
+
+def check(corpus) -> int:
+    mismatches = 0
+    for document in corpus:
+        expected = _clean_text_bs4(document)
+        actual = clean_text(document)
+        if actual != expected:
+            mismatches += 1
+            print(f"MISMATCH for {document[:200]!r}\n  expected {expected[:200]!r}\n  actual   {actual[:200]!r}")
+    return mismatches
+
+
+def bench(func, corpus, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = perf_counter()
+        for document in corpus:
+            func(document)
+        best = min(best, perf_counter() - start)
+    return best
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--random", type=int, default=2000, help="Number of random documents")
+    parser.add_argument("--seed", type=int, default=822)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    warnings.simplefilter("ignore")
+    corpus = build_corpus(args.random, args.seed)
+
+    mismatches = check(corpus)
+    print(f"{len(corpus)} documents, {mismatches} mismatches")
+    if mismatches:
+        return 1
+
+    plain = [d for d in corpus if "<" not in d]
+    markup = [d for d in corpus if "<" in d]
+    for name, subset in (("plain text", plain), ("html", markup)):
+        reference = bench(_clean_text_bs4, subset, args.repeat)
+        fast = bench(clean_text, subset, args.repeat)
+        print(f"{name:>10}: {len(subset)} docs  bs4 {reference * 1000:.1f} ms  "
+              f"fast {fast * 1000:.1f} ms  speedup {reference / fast:.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Event-loop latency during a login storm.
+
+Fires --logins concurrent bcrypt verifications, once inline on the event
+loop (how login used to call passlib) and once through PasswordHasher's
+bounded thread pool, while a probe task measures how late a 5 ms timer
+fires. Late timers are what every other request on the worker (e.g.
+classification) sees as added latency.
+
+    python scripts/bench_password_hashing.py --logins 64 --rounds 12
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+from time import perf_counter
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.services.password_hasher import PASSWORD_HASH_WORKERS, PasswordHasher
+
+PROBE_INTERVAL = 0.005
+
+
+async def probe(lags, stop: asyncio.Event):
+    while not stop.is_set():
+        started = perf_counter()
+        await asyncio.sleep(PROBE_INTERVAL)
+        lags.append(perf_counter() - started - PROBE_INTERVAL)
+
+
+async def storm(hasher: PasswordHasher, hashed: str, logins: int, offload: bool):
+    async def inline_login():
+        # Yield once so logins interleave with the probe like separate requests
+        await asyncio.sleep(0)
+        return hasher.context.verify("correct horse", hashed)
+
+    lags = []
+    stop = asyncio.Event()
+    probe_task = asyncio.create_task(probe(lags, stop))
+    await asyncio.sleep(0.05)
+
+    started = perf_counter()
+    if offload:
+        results = await asyncio.gather(*(hasher.verify("correct horse", hashed) for _ in range(logins)))
+    else:
+        results = await asyncio.gather(*(inline_login() for _ in range(logins)))
+    elapsed = perf_counter() - started
+
+    stop.set()
+    await probe_task
+    assert all(results)
+    return elapsed, lags
+
+
+def report(name: str, logins: int, elapsed: float, lags):
+    lags = sorted(lags) or [0.0]
+    p99 = lags[min(len(lags) - 1, int(len(lags) * 0.99))]
+    print(f"{name:>8}: {logins / elapsed:7.1f} logins/s  loop lag p50 {statistics.median(lags) * 1000:7.1f} ms  "
+          f"p99 {p99 * 1000:7.1f} ms  max {lags[-1] * 1000:7.1f} ms")
+
+
+async def main_async(args):
+    hasher = PasswordHasher(rounds=args.rounds, workers=args.workers, max_queue=args.logins)
+    hashed = hasher.context.hash("correct horse")
+    print(f"bcrypt rounds={args.rounds}, {args.logins} concurrent logins, {args.workers} hashing thread(s)")
+
+    elapsed, lags = await storm(hasher, hashed, args.logins, offload=False)
+    report("inline", args.logins, elapsed, lags)
+    elapsed, lags = await storm(hasher, hashed, args.logins, offload=True)
+    report("pool", args.logins, elapsed, lags)
+    print(f"pool stats: {hasher.stats()}")
+    hasher.shutdown()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=32, help="Concurrent login attempts")
+    parser.add_argument("--rounds", type=int, default=12, help="bcrypt cost factor")
+    parser.add_argument("--workers", type=int, default=PASSWORD_HASH_WORKERS, help="Hashing threads")
+    args = parser.parse_args(argv)
+    asyncio.run(main_async(args))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,440 @@
+#!/usr/bin/env python3
+"""
+CPU-only benchmark suite for the classification hot path and the API.
+
+micro  times clean_text/process_email, tokenization and the forward pass
+       over a grid of token lengths and batch sizes
+load   starts the app in-process against a temporary SQLite database and
+       fires concurrent requests at /api/v1/check-email and the mailbox
+       listings
+all    runs both
+
+Everything runs offline: when content/best_model (or MODEL_PATH) is absent,
+a tiny randomly initialised BERT and a matching vocabulary are written to a
+temporary directory, so absolute numbers are only comparable between runs
+on the same model. Results are written as JSON; compare two of them with
+
+    python scripts/benchmark.py all --output before.json
+    python scripts/benchmark.py all --output after.json
+    python scripts/benchmark.py compare before.json after.json --threshold 0.10
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+from datetime import datetime, timedelta, timezone
+from time import perf_counter
+from typing import Callable, Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+DEFAULT_MODEL_PATH = os.path.join(ROOT, "content", "best_model")
+
+WORDS = [
+    "free", "money", "win", "offer", "click", "now", "prize", "urgent", "account",
+    "meeting", "tomorrow", "project", "report", "please", "review", "attached",
+    "invoice", "team", "lunch", "schedule", "update", "password", "bank", "limited",
+    "time", "deal", "call", "thanks", "regards", "hello", "the", "and", "for", "you",
+]
+SPECIAL_TOKENS = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"]
+
+
+def log(message: str):
+    print(message, file=sys.stderr, flush=True)
+
+
+def write_tiny_model(path: str, seed: int) -> str:
+    """
+    Save a randomly initialised 2-layer BERT and a small WordPiece vocabulary
+    """
+    import torch
+    from transformers import BertConfig, BertForSequenceClassification, BertTokenizerFast
+
+    characters = [chr(c) for c in range(ord("a"), ord("z") + 1)] + [str(d) for d in range(10)]
+    vocab = SPECIAL_TOKENS + WORDS + characters + [f"##{c}" for c in characters]
+    os.makedirs(path, exist_ok=True)
+    vocab_file = os.path.join(path, "vocab.txt")
+    with open(vocab_file, "w") as f:
+        f.write("\n".join(vocab) + "\n")
+    BertTokenizerFast(vocab_file=vocab_file, do_lower_case=True).save_pretrained(path)
+
+    torch.manual_seed(seed)
+    config = BertConfig(
+        vocab_size=len(vocab),
+        hidden_size=64,
+        num_hidden_layers=2,
+        num_attention_heads=2,
+        intermediate_size=128,
+        max_position_embeddings=512,
+        num_labels=2,
+    )
+    BertForSequenceClassification(config).eval().save_pretrained(path)
+    return path
+
+
+def prepare_environment(args, workdir: str) -> str:
+    """
+    Point the app at the model and at throwaway storage; must run before any
+    backend module is imported
+
+    Returns:
+        "tiny-random" or the path of the real model
+    """
+    model_path = args.model_path or os.getenv("MODEL_PATH", DEFAULT_MODEL_PATH)
+    if os.path.exists(model_path):
+        model = model_path
+    else:
+        model_path = write_tiny_model(os.path.join(workdir, "model"), args.seed)
+        model = "tiny-random"
+    os.environ["MODEL_PATH"] = model_path
+    os.environ.setdefault("MODEL_VERSION", "benchmark")
+    os.environ.setdefault("ASYNC_DATABASE_URL", f"sqlite+aiosqlite:///{workdir}/benchmark.db")
+    os.environ.setdefault("SPAM_FOLDER", os.path.join(workdir, "spam"))
+    os.environ.setdefault("LOG_FOLDER", os.path.join(workdir, "logs"))
+    os.environ.setdefault("DELIVERY_QUEUE_PATH", os.path.join(workdir, "delivery.db"))
+    os.environ.setdefault("STATE_BACKEND", "memory")
+    os.environ.setdefault("SMTP_ENABLED", "false")
+    return model
+
+
+def environment_info(model: str) -> Dict:
+    import torch
+    import transformers
+
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "git_commit": commit,
+        "model": model,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "torch": torch.__version__,
+        "torch_threads": torch.get_num_threads(),
+        "transformers": transformers.__version__,
+    }
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    """
+    Latency summary in milliseconds
+    """
+    ordered = sorted(samples)
+
+    def percentile(q: float) -> float:
+        return ordered[min(len(ordered) - 1, int(len(ordered) * q))] * 1000
+
+    return {
+        "runs": len(ordered),
+        "min_ms": ordered[0] * 1000,
+        "median_ms": statistics.median(ordered) * 1000,
+        "p95_ms": percentile(0.95),
+        "p99_ms": percentile(0.99),
+        "max_ms": ordered[-1] * 1000,
+    }
+
+
+def measure(func: Callable, repeat: int, warmup: int = 1) -> Dict[str, float]:
+    for _ in range(warmup):
+        func()
+    samples = []
+    for _ in range(repeat):
+        started = perf_counter()
+        func()
+        samples.append(perf_counter() - started)
+    return summarize(samples)
+
+
+def random_text(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def random_html(rng: random.Random, words: int) -> str:
+    parts = ["<html><head><style>p {color: red}</style></head><body>"]
+    for i in range(0, words, 8):
+        parts.append(f"<p>{random_text(rng, 8)} <a href='http://example.com/{i}'>link</a> &amp; more</p>")
+    parts.append("</body></html>")
+    return "".join(parts)
+
+
+def run_micro(args) -> Dict:
+    from backend.ml import model_loader
+    from backend.services.email_processor import clean_text, process_email
+
+    rng = random.Random(args.seed)
+    results: Dict = {"preprocessing": {}, "tokenization": {}, "forward": {}, "predict_spam": {}}
+
+    for words in args.lengths:
+        for kind, make in (("plain", random_text), ("html", random_html)):
+            corpus = [make(rng, words) for _ in range(args.corpus)]
+            for name, func in (("clean_text", clean_text), ("process_email", process_email)):
+                stats = measure(lambda: [func(document) for document in corpus], args.repeat)
+                stats["per_doc_us"] = stats["median_ms"] * 1000 / len(corpus)
+                results["preprocessing"][f"{name}/{kind}/words={words}"] = stats
+                log(f"{name:>14} {kind:>5} {words:>4} words: {stats['per_doc_us']:9.1f} us/doc")
+
+    model, tokenizer = model_loader.load_model()
+    for words in args.lengths:
+        for batch_size in args.batch_sizes:
+            texts = [random_text(rng, words) for _ in range(batch_size)]
+            tokens = len(tokenizer(texts[0], truncation=True, max_length=512)["input_ids"])
+            key = f"words={words}/batch={batch_size}"
+
+            stats = measure(
+                lambda: tokenizer(texts, padding=True, truncation=True, max_length=512, return_tensors="pt"),
+                args.repeat,
+            )
+            stats["tokens"] = tokens
+            results["tokenization"][key] = stats
+
+            inputs = tokenizer(texts, padding=True, truncation=True, max_length=512, return_tensors="pt")
+            stats = measure(lambda: model_loader._forward(model, inputs), args.repeat)
+            stats["tokens"] = tokens
+            stats["items_per_second"] = batch_size / (stats["median_ms"] / 1000)
+            results["forward"][key] = stats
+            log(f"forward {key:>20} ({tokens:>3} tokens): {stats['median_ms']:8.2f} ms "
+                f"{stats['items_per_second']:8.1f} items/s")
+
+        text = random_text(rng, words)
+        results["predict_spam"][f"words={words}"] = measure(
+            lambda: model_loader.predict_spam((model, tokenizer), text), args.repeat
+        )
+    return results
+
+
+async def seed_mailboxes(emails: int, seed: int) -> List[str]:
+    """
+    Create two users exchanging emails, a third of them spam
+
+    Returns:
+        API keys of the two users
+    """
+    import secrets
+
+    from sqlalchemy import insert
+
+    from backend.database.database import AsyncSessionLocal, Base, async_engine
+    from backend.models.models import Email, User
+
+    async with async_engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+
+    rng = random.Random(seed)
+    async with AsyncSessionLocal() as db:
+        users = [
+            User(email=f"bench{i}@example.com", hashed_password="!", api_key=secrets.token_urlsafe(32))
+            for i in range(2)
+        ]
+        db.add_all(users)
+        await db.flush()
+        started = datetime.now(timezone.utc) - timedelta(days=30)
+        rows = []
+        for i in range(emails):
+            sender, recipient = (users[0], users[1]) if i % 2 else (users[1], users[0])
+            is_spam = i % 3 == 0
+            rows.append({
+                "subject": f"Benchmark {i}",
+                "content": random_text(rng, 60),
+                "sender_id": sender.id,
+                "recipient_id": recipient.id,
+                "is_spam": is_spam,
+                "spam_confidence": 0.9 if is_spam else 0.1,
+                "created_at": started + timedelta(seconds=i),
+            })
+        if rows:
+            await db.execute(insert(Email), rows)
+        await db.commit()
+        return [user.api_key for user in users]
+
+
+async def drive(client, requests: int, concurrency: int, make_request: Callable) -> Dict:
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    counter = iter(range(requests))
+
+    async def worker():
+        for i in counter:
+            started = perf_counter()
+            response = await make_request(client, i)
+            latencies.append(perf_counter() - started)
+            statuses[str(response.status_code)] = statuses.get(str(response.status_code), 0) + 1
+
+    started = perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = perf_counter() - started
+    result = summarize(latencies)
+    result.update({
+        "requests": requests,
+        "concurrency": concurrency,
+        "requests_per_second": requests / elapsed,
+        "status_codes": statuses,
+        "errors": sum(count for status, count in statuses.items() if not status.startswith("2")),
+    })
+    return result
+
+
+async def run_load_async(args) -> Dict:
+    import httpx
+
+    from backend import app as app_module
+
+    api_keys = await seed_mailboxes(args.emails, args.seed)
+    headers = {"X-API-Key": api_keys[0]}
+    rng = random.Random(args.seed)
+    contents = [random_text(rng, rng.choice(args.lengths)) for _ in range(args.requests)]
+
+    async def check_email(client, i):
+        return await client.post("/api/v1/check-email", headers=headers, json={
+            "sender": "bench1@example.com",
+            "recipient": "bench0@example.com",
+            "subject": f"Benchmark {i}",
+            # Distinct contents, so every request misses the prediction cache
+            "content": contents[i],
+        })
+
+    def listing(path: str):
+        async def request(client, i):
+            return await client.get(path, headers=headers, params={"limit": args.page_size})
+        return request
+
+    scenarios = {
+        "check-email": check_email,
+        "emails/received": listing("/api/v1/emails/received"),
+        "emails/sent": listing("/api/v1/emails/sent"),
+        "emails/spam": listing("/api/v1/emails/spam"),
+    }
+
+    results = {}
+    app = app_module.app
+    async with app.router.lifespan_context(app):
+        while not app_module.runtime.ready:
+            if app_module.runtime.error:
+                raise RuntimeError(f"Model failed to load: {app_module.runtime.error}")
+            await asyncio.sleep(0.05)
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+            for name, make_request in scenarios.items():
+                if args.scenarios and name not in args.scenarios:
+                    continue
+                results[name] = await drive(client, args.requests, args.concurrency, make_request)
+                result = results[name]
+                log(f"{name:>16}: {result['requests_per_second']:8.1f} req/s  p50 {result['median_ms']:7.2f} ms  "
+                    f"p99 {result['p99_ms']:7.2f} ms  errors {result['errors']}")
+        results["prediction_cache"] = app_module.runtime.cache.stats() if app_module.runtime.cache else None
+    return results
+
+
+def run_load(args) -> Dict:
+    # The app logs every request at INFO
+    logging.disable(logging.INFO)
+    try:
+        return asyncio.run(run_load_async(args))
+    finally:
+        logging.disable(logging.NOTSET)
+
+
+def flatten(results: Dict, prefix: str = "") -> Dict[str, float]:
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}/{key}" if prefix else key
+        if isinstance(value, dict):
+            flat.update(flatten(value, name))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(args) -> int:
+    """
+    Report latency metrics that got slower (and throughput that dropped) by
+    more than the threshold; exit status 1 if there are any
+    """
+    with open(args.baseline) as f:
+        baseline = flatten({k: v for k, v in json.load(f).items() if k != "environment"})
+    with open(args.candidate) as f:
+        candidate = flatten({k: v for k, v in json.load(f).items() if k != "environment"})
+
+    regressions = 0
+    for name in sorted(set(baseline) & set(candidate)):
+        metric = name.rsplit("/", 1)[-1]
+        if metric in ("median_ms", "p95_ms", "p99_ms"):
+            higher_is_better = False
+        elif metric in ("requests_per_second", "items_per_second"):
+            higher_is_better = True
+        else:
+            continue
+        before, after = baseline[name], candidate[name]
+        if not before:
+            continue
+        change = (after - before) / before
+        regressed = -change > args.threshold if higher_is_better else change > args.threshold
+        regressions += regressed
+        if regressed or args.verbose:
+            print(f"{'REGRESSION' if regressed else 'ok':>10}  {name}: {before:.3f} -> {after:.3f} ({change:+.1%})")
+    print(f"{regressions} regression(s) beyond {args.threshold:.0%}")
+    return 1 if regressions else 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    for name in ("micro", "load", "all"):
+        run = subparsers.add_parser(name)
+        run.add_argument("--output", default="-", help="JSON results file, - for stdout")
+        run.add_argument("--model-path", default=None, help="Defaults to MODEL_PATH or content/best_model")
+        run.add_argument("--seed", type=int, default=1234)
+        run.add_argument("--lengths", type=int, nargs="+", default=[16, 128, 480], help="Words per text")
+        run.add_argument("--repeat", type=int, default=10)
+        run.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 32])
+        run.add_argument("--corpus", type=int, default=200, help="Documents per preprocessing run")
+        run.add_argument("--requests", type=int, default=200, help="Requests per load scenario")
+        run.add_argument("--concurrency", type=int, default=16)
+        run.add_argument("--emails", type=int, default=5000, help="Emails seeded into the mailboxes")
+        run.add_argument("--page-size", type=int, default=50)
+        run.add_argument("--scenarios", nargs="+", default=None,
+                         help="check-email, emails/received, emails/sent, emails/spam")
+
+    comparison = subparsers.add_parser("compare")
+    comparison.add_argument("baseline")
+    comparison.add_argument("candidate")
+    comparison.add_argument("--threshold", type=float, default=0.10, help="Allowed relative slowdown")
+    comparison.add_argument("--verbose", action="store_true", help="Also list metrics within the threshold")
+
+    args = parser.parse_args(argv)
+    if args.command == "compare":
+        return compare(args)
+
+    with tempfile.TemporaryDirectory(prefix="spam-filter-bench-") as workdir:
+        model = prepare_environment(args, workdir)
+        results: Dict[str, Optional[Dict]] = {"environment": environment_info(model)}
+        if args.command in ("micro", "all"):
+            results["micro"] = run_micro(args)
+        if args.command in ("load", "all"):
+            results["load"] = run_load(args)
+
+    output = json.dumps(results, indent=2)
+    if args.output == "-":
+        print(output)
+    else:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+        log(f"Results written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,45 @@
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import StaticPool
+
+from backend.database.database import Base
+from backend.models.models import User
+
+
+async def session_factory(users: int = 2):
+    """
+    In-memory SQLite database with the full schema and users 1..users
+    (a@example.com, b@example.com, ...)
+
+    Returns:
+        (engine, async session factory)
+    """
+    engine = create_async_engine(
+        "sqlite+aiosqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False}
+    )
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def enforce_foreign_keys(connection, _):
+        connection.execute("PRAGMA foreign_keys=ON")
+
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+    factory = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+    async with factory() as db:
+        db.add_all([User(id=i, email=f"{chr(ord('a') + i - 1)}@example.com") for i in range(1, users + 1)])
+        await db.commit()
+    return engine, factory
+
+
+def email(sender_id: int = 1, recipient_id: int = 2, is_spam: bool = False):
+    """
+    Email column values as passed to EmailWriter.add
+    """
+    return {
+        "subject": "hi",
+        "content": "hello",
+        "sender_id": sender_id,
+        "recipient_id": recipient_id,
+        "is_spam": is_spam,
+        "spam_confidence": 0.9 if is_spam else 0.1,
+    }
@@ -0,0 +1,28 @@
+import warnings
+
+import pytest
+from bs4 import BeautifulSoup
+
+from backend.services.email_processor import _clean_text_bs4, _strip_html, clean_text
+from scripts.bench_clean_text import build_corpus
+
+# The edge cases plus 5000 seeded random documents, as in the benchmark
+CORPUS = build_corpus(5000, 822)
+
+
+@pytest.fixture(autouse=True)
+def _quiet_bs4():
+    # BeautifulSoup warns about inputs that look like URLs or file names
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        yield
+
+
+def test_strip_html_matches_get_text():
+    mismatches = [d for d in CORPUS if _strip_html(d) != BeautifulSoup(d, "html.parser").get_text()]
+    assert mismatches == []
+
+
+def test_clean_text_matches_reference():
+    mismatches = [d for d in CORPUS if clean_text(d) != _clean_text_bs4(d)]
+    assert mismatches == []
@@ -0,0 +1,148 @@
+import asyncio
+
+from backend.services.delivery import DeliveryQueue, DeliveryService, SMTPConnectionPool
+
+
+class StandInRelay:
+    """
+    Local SMTP server that refuses some recipients and records what it
+    was given
+    """
+
+    def __init__(self, refuse):
+        # address -> RCPT reply for refused recipients
+        self.refuse = refuse
+        self.messages = []
+        self.server = None
+        self.port = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        def reply(line):
+            writer.write(line.encode() + b"\r\n")
+
+        reply("220 relay ready")
+        sender, recipients = None, []
+        while True:
+            line = (await reader.readline()).decode().strip()
+            if not line:
+                break
+            command = line.split(" ", 1)[0].upper()
+            if command == "EHLO":
+                reply("250-relay")
+                reply("250 PIPELINING")
+            elif command == "MAIL":
+                sender, recipients = line[len("MAIL FROM:"):].strip("<>"), []
+                reply("250 OK")
+            elif command == "RCPT":
+                address = line[len("RCPT TO:"):].strip("<>")
+                if address in self.refuse:
+                    reply(self.refuse[address])
+                else:
+                    recipients.append(address)
+                    reply("250 OK")
+            elif command == "DATA":
+                reply("354 go ahead")
+                await writer.drain()
+                body = b""
+                while True:
+                    chunk = await reader.readline()
+                    if chunk == b".\r\n":
+                        break
+                    body += chunk
+                self.messages.append((sender, list(recipients), body))
+                reply("250 queued")
+            elif command == "RSET":
+                sender, recipients = None, []
+                reply("250 OK")
+            elif command == "QUIT":
+                reply("221 bye")
+                await writer.drain()
+                break
+            else:
+                reply("502 unknown")
+            await writer.drain()
+        writer.close()
+
+
+async def _deliver_due(service):
+    for row in await service._queue_call(service.queue.claim, 10):
+        await service._deliver(*row)
+
+
+def test_refused_recipients_are_retried_alone(tmp_path):
+    async def scenario():
+        relay = StandInRelay({"full@example.com": "452 mailbox full", "gone@example.com": "550 no such user"})
+        await relay.start()
+        queue = DeliveryQueue(str(tmp_path / "delivery.db"))
+        service = DeliveryService(queue=queue, workers=1, pool=SMTPConnectionPool(
+            size=1, host="127.0.0.1", port=relay.port, tls="none", username="", password="", timeout=5,
+        ))
+        service._loop = asyncio.get_running_loop()
+        service._wakeup = asyncio.Event()
+        try:
+            message_id = service.enqueue({
+                "sender": "alice@example.com",
+                "recipient": "bob@example.com, full@example.com, gone@example.com",
+                "subject": "Hello",
+                "content": "Hi there",
+            })
+            await _deliver_due(service)
+
+            # Only the accepted recipient got the message, and it was not empty
+            assert len(relay.messages) == 1
+            sender, recipients, body = relay.messages[0]
+            assert (sender, recipients) == ("alice@example.com", ["bob@example.com"])
+            assert b"Hi there" in body
+
+            # The temporarily refused recipient stays queued on its own
+            row = queue._db.execute(
+                "SELECT status, recipients, attempts FROM deliveries WHERE id = ?", (message_id,)
+            ).fetchone()
+            assert row == ("queued", "full@example.com", 1)
+
+            del relay.refuse["full@example.com"]
+            queue._db.execute("UPDATE deliveries SET next_attempt = 0")
+            await _deliver_due(service)
+            assert [m[1] for m in relay.messages] == [["bob@example.com"], ["full@example.com"]]
+            assert queue.counts() == {}
+            assert service.stats()["refused_recipients"] == 2
+        finally:
+            await service.pool.close()
+            queue.close()
+            await relay.close()
+
+    asyncio.run(scenario())
+
+
+def test_all_recipients_refused_sends_no_data(tmp_path):
+    async def scenario():
+        relay = StandInRelay({"gone@example.com": "550 no such user"})
+        await relay.start()
+        queue = DeliveryQueue(str(tmp_path / "delivery.db"))
+        service = DeliveryService(queue=queue, workers=1, pool=SMTPConnectionPool(
+            size=1, host="127.0.0.1", port=relay.port, tls="none", username="", password="", timeout=5,
+        ))
+        service._loop = asyncio.get_running_loop()
+        service._wakeup = asyncio.Event()
+        try:
+            service.enqueue({
+                "sender": "alice@example.com", "recipient": "gone@example.com",
+                "subject": "Hello", "content": "Hi",
+            })
+            await _deliver_due(service)
+            assert relay.messages == []
+            assert queue.counts() == {"failed": 1}
+        finally:
+            await service.pool.close()
+            queue.close()
+            await relay.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,62 @@
+import asyncio
+import json
+
+from sqlalchemy import func, select
+
+from backend.models.models import Email
+from backend.services.email_writer import EmailWriter
+from tests.db import email as _email, session_factory as _session_factory
+
+
+async def _stored_ids(factory):
+    async with factory() as db:
+        return sorted((await db.execute(select(Email.id))).scalars())
+
+
+def test_single_row_is_flushed_after_flush_ms():
+    async def scenario():
+        engine, factory = await _session_factory()
+        for mode in ("group", "write-behind"):
+            writer = EmailWriter(factory, mode=mode, batch_size=500, flush_ms=50)
+            await writer.start()
+            row = await asyncio.wait_for(writer.add(_email()), 1.0)
+            for _ in range(20):
+                if writer.stats()["pending"] == 0 and row["id"] in await _stored_ids(factory):
+                    break
+                await asyncio.sleep(0.05)
+            assert row["id"] in await _stored_ids(factory), mode
+            await writer.close()
+        await engine.dispose()
+
+    asyncio.run(scenario())
+
+
+def test_write_behind_dead_letters_rows_that_keep_failing(tmp_path):
+    async def scenario():
+        engine, factory = await _session_factory()
+        dead_letter = tmp_path / "dead-letter.jsonl"
+        writer = EmailWriter(
+            factory, mode="write-behind", batch_size=10, flush_ms=10,
+            max_attempts=2, dead_letter_path=str(dead_letter),
+        )
+        await writer.start()
+        good = [await writer.add(_email()) for _ in range(3)]
+        bad = await writer.add(_email(sender_id=999))
+        good.append(await writer.add(_email()))
+        for _ in range(100):
+            if writer.stats()["dead_lettered"]:
+                break
+            await asyncio.sleep(0.02)
+        # Later rows are not blocked by the bad one
+        later = await writer.add(_email())
+        await writer.close()
+
+        assert await _stored_ids(factory) == sorted(row["id"] for row in good + [later])
+        assert writer.stats()["dead_lettered"] == 1
+        entries = [json.loads(line) for line in dead_letter.read_text().splitlines()]
+        assert [entry["row"]["id"] for entry in entries] == [bad["id"]]
+        async with factory() as db:
+            assert (await db.execute(select(func.count()).select_from(Email))).scalar() == 5
+        await engine.dispose()
+
+    asyncio.run(scenario())
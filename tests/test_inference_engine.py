@@ -0,0 +1,140 @@
+import asyncio
+import threading
+from time import monotonic
+
+import pytest
+
+from backend.ml import inference_engine
+from backend.ml.inference_engine import InferenceEngine
+
+
+class StubPredict:
+    """
+    Stands in for predict_spam_batch: records every batch and scores
+    "spam..." texts as spam with a confidence derived from the text
+    """
+
+    def __init__(self, gate: threading.Event = None):
+        self.batches = []
+        self.gate = gate
+
+    def __call__(self, model_tuple, texts):
+        if self.gate is not None:
+            self.gate.wait(5)
+        self.batches.append(list(texts))
+        if "explode" in texts:
+            raise RuntimeError("forward pass failed")
+        results = []
+        for text in texts:
+            if text.startswith("bad"):
+                results.append(ValueError(text))
+            else:
+                results.append((text.startswith("spam"), len(text) / 100))
+        return results
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    predict = StubPredict()
+    monkeypatch.setattr(inference_engine, "predict_spam_batch", predict)
+    return predict
+
+
+def _engine(**options):
+    return InferenceEngine(None, long_documents=False, **options)
+
+
+def test_full_batch_is_sent_without_waiting(stub):
+    async def scenario():
+        engine = _engine(max_batch_size=4, max_wait_ms=10_000)
+        started = monotonic()
+        await asyncio.wait_for(asyncio.gather(*(engine.predict(f"ham {i}") for i in range(4))), 2)
+        elapsed = monotonic() - started
+        await engine.close()
+        return elapsed
+
+    assert asyncio.run(scenario()) < 2
+    assert stub.batches == [["ham 0", "ham 1", "ham 2", "ham 3"]]
+
+
+def test_partial_batch_is_sent_after_max_wait(stub):
+    async def scenario():
+        engine = _engine(max_batch_size=32, max_wait_ms=50)
+        started = monotonic()
+        await asyncio.gather(engine.predict("ham a"), engine.predict("ham b"))
+        elapsed = monotonic() - started
+        await engine.close()
+        return elapsed
+
+    elapsed = asyncio.run(scenario())
+    assert 0.05 <= elapsed < 2
+    assert stub.batches == [["ham a", "ham b"]]
+
+
+def test_every_caller_gets_its_own_result(stub):
+    texts = [f"spam {'x' * i}" if i % 3 == 0 else f"ham {'y' * i}" for i in range(10)]
+
+    async def scenario():
+        engine = _engine(max_batch_size=4, max_wait_ms=20)
+        results = await asyncio.gather(*(engine.predict(text) for text in texts))
+        await engine.close()
+        return results
+
+    assert asyncio.run(scenario()) == [(text.startswith("spam"), len(text) / 100) for text in texts]
+    assert sorted(text for batch in stub.batches for text in batch) == sorted(texts)
+    assert all(len(batch) <= 4 for batch in stub.batches)
+
+
+def test_item_error_only_fails_its_caller(stub):
+    async def scenario():
+        engine = _engine(max_batch_size=3, max_wait_ms=20)
+        results = await asyncio.gather(
+            engine.predict("ham"), engine.predict("bad input"), engine.predict("spam"),
+            return_exceptions=True,
+        )
+        await engine.close()
+        return results
+
+    ham, bad, spam = asyncio.run(scenario())
+    assert ham == (False, 0.03) and spam == (True, 0.04)
+    assert isinstance(bad, ValueError) and str(bad) == "bad input"
+
+
+def test_batch_failure_reaches_every_waiter(stub):
+    async def scenario():
+        engine = _engine(max_batch_size=3, max_wait_ms=20)
+        results = await asyncio.gather(
+            engine.predict("ham"), engine.predict("explode"), engine.predict("spam"),
+            return_exceptions=True,
+        )
+        # The engine keeps serving after a failed batch
+        after = await engine.predict("ham again")
+        await engine.close()
+        return results, after
+
+    results, after = asyncio.run(scenario())
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert after == (False, 0.09)
+
+
+def test_close_finishes_running_batches_and_cancels_queued_ones(monkeypatch):
+    gate = threading.Event()
+    predict = StubPredict(gate)
+    monkeypatch.setattr(inference_engine, "predict_spam_batch", predict)
+
+    async def scenario():
+        engine = _engine(max_batch_size=1, max_wait_ms=0, max_concurrent_batches=1)
+        running = asyncio.ensure_future(engine.predict("ham running"))
+        while not engine.stats()["inflight_batches"]:
+            await asyncio.sleep(0.01)
+        # Waits in the queue: the only batch slot is taken
+        queued = asyncio.ensure_future(engine.predict("ham queued"))
+        await asyncio.sleep(0.05)
+        asyncio.get_running_loop().call_later(0.05, gate.set)
+        await engine.close()
+        return await running, await asyncio.gather(queued, return_exceptions=True)
+
+    running, (queued,) = asyncio.run(scenario())
+    assert running == (False, 0.11)
+    assert isinstance(queued, asyncio.CancelledError)
+    assert predict.batches == [["ham running"]]
@@ -0,0 +1,130 @@
+import asyncio
+import base64
+from datetime import datetime, timedelta
+
+import httpx
+import pytest
+
+from backend import app as app_module
+from backend.database.database import get_async_db
+from backend.models.models import Email
+from backend.services import mailbox
+from backend.services.user_cache import AuthUser
+from tests.db import session_factory
+
+BASE = datetime(2026, 3, 1, 12, 0, 0)
+
+
+async def _seed(factory, created_at):
+    """
+    One email from user 1 to user 2 per timestamp; returns their ids
+    """
+    async with factory() as db:
+        emails = [
+            Email(subject=f"s{i}", content="c", sender_id=1, recipient_id=2,
+                  is_spam=False, spam_confidence=0.1, created_at=when)
+            for i, when in enumerate(created_at)
+        ]
+        db.add_all(emails)
+        await db.commit()
+        return [(email.created_at, email.id) for email in emails]
+
+
+async def _client(factory):
+    async def db_override():
+        async with factory() as db:
+            yield db
+
+    app = app_module.app
+    app.dependency_overrides[get_async_db] = db_override
+    app.dependency_overrides[app_module.authenticated_user] = lambda: AuthUser(2, "b@example.com", "key", None, None)
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+
+
+@pytest.fixture(autouse=True)
+def _clear_overrides():
+    yield
+    app_module.app.dependency_overrides.clear()
+
+
+def _scenario(created_at, requests):
+    async def run():
+        engine, factory = await session_factory()
+        seeded = await _seed(factory, created_at)
+        async with await _client(factory) as client:
+            result = await requests(client)
+        await engine.dispose()
+        return seeded, result
+
+    return asyncio.run(run())
+
+
+async def _walk(client, limit):
+    """
+    Follow X-Next-Cursor to the end; returns the ids of every page
+    """
+    pages, cursor = [], None
+    while True:
+        params = {"limit": limit, **({"cursor": cursor} if cursor else {})}
+        response = await client.get("/api/v1/emails/received", params=params)
+        assert response.status_code == 200
+        pages.append([row["id"] for row in response.json()])
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            return pages
+
+
+def test_ties_on_created_at_span_page_boundaries():
+    # Five emails share one timestamp, so pages must split them by id
+    created_at = [BASE + timedelta(minutes=1)] + [BASE] * 5 + [BASE - timedelta(minutes=1)]
+    seeded, pages = _scenario(created_at, lambda client: _walk(client, limit=2))
+
+    expected = [email_id for _, email_id in sorted(seeded, reverse=True)]
+    assert [email_id for page in pages for email_id in page] == expected
+    assert [len(page) for page in pages] == [2, 2, 2, 1]
+
+
+def test_no_cursor_after_the_last_page():
+    # Exactly two full pages: the second one must not point at an empty third
+    created_at = [BASE - timedelta(minutes=i) for i in range(4)]
+    _, pages = _scenario(created_at, lambda client: _walk(client, limit=2))
+    assert [len(page) for page in pages] == [2, 2]
+
+
+@pytest.mark.parametrize("cursor", [
+    "not base64 !!",
+    base64.urlsafe_b64encode(b"no separator").decode(),
+    base64.urlsafe_b64encode(b"yesterday|5").decode(),
+    base64.urlsafe_b64encode(BASE.isoformat().encode() + b"|five").decode(),
+    base64.urlsafe_b64encode(b"\xff\xfe|1").decode(),
+])
+def test_malformed_or_tampered_cursor_is_rejected(cursor):
+    async def requests(client):
+        return await client.get("/api/v1/emails/received", params={"cursor": cursor})
+
+    _, response = _scenario([BASE], requests)
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid cursor"
+
+
+def test_limit_is_clamped(monkeypatch):
+    monkeypatch.setattr(mailbox, "MAILBOX_MAX_LIMIT", 3)
+    created_at = [BASE - timedelta(minutes=i) for i in range(5)]
+
+    async def requests(client):
+        return [await client.get("/api/v1/emails/received", params={"limit": limit}) for limit in (0, -5, 1000)]
+
+    _, responses = _scenario(created_at, requests)
+    assert [len(r.json()) for r in responses] == [1, 1, 3]
+    assert all("X-Next-Cursor" in r.headers for r in responses)
+
+
+def test_default_limit_stops_short_of_the_whole_mailbox():
+    created_at = [BASE - timedelta(seconds=i) for i in range(mailbox.MAILBOX_DEFAULT_LIMIT + 1)]
+
+    async def requests(client):
+        return await client.get("/api/v1/emails/received")
+
+    _, response = _scenario(created_at, requests)
+    assert len(response.json()) == mailbox.MAILBOX_DEFAULT_LIMIT
+    assert "X-Next-Cursor" in response.headers
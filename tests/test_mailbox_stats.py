@@ -0,0 +1,107 @@
+import asyncio
+import importlib.util
+import os
+from datetime import date, datetime, timedelta, timezone
+
+import pytest
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
+from sqlalchemy import create_engine, select
+
+from backend.database.database import Base
+from backend.models.models import Email, User, UserEmailDaily, UserEmailStats
+from backend.services.email_writer import EmailWriter
+from backend.services.mailbox_stats import get_mailbox_stats, record_emails
+from tests.db import email, session_factory
+
+MIGRATION = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "config", "alembic", "versions", "b41d0e6f8a27_add_mailbox_stats.py",
+)
+
+
+@pytest.mark.parametrize("mode", ["sync", "group", "write-behind"])
+def test_writer_keeps_counters_in_step(mode):
+    async def scenario():
+        engine, factory = await session_factory(users=3)
+        writer = EmailWriter(factory, mode=mode, batch_size=4, flush_ms=10)
+        await writer.start()
+        rows = [email(1, 2), email(1, 2, is_spam=True), email(3, 2, is_spam=True), email(2, 1)]
+        await asyncio.gather(*(writer.add(row) for row in rows))
+        await writer.close()
+
+        async with factory() as db:
+            stats = {user: await get_mailbox_stats(db, user, days=3) for user in (1, 2, 3)}
+        await engine.dispose()
+        return stats
+
+    stats = asyncio.run(scenario())
+    receiver = stats[2]
+    assert (receiver["sent"], receiver["received"], receiver["spam_received"]) == (1, 3, 2)
+    assert receiver["spam_rate"] == pytest.approx(2 / 3)
+    assert (stats[1]["sent"], stats[1]["received"], stats[1]["spam_rate"]) == (2, 1, 0.0)
+    assert (stats[3]["sent"], stats[3]["received"], stats[3]["spam_rate"]) == (1, 0, 0.0)
+
+    # Oldest first; the two earlier days are filled with zeros
+    today = datetime.now(timezone.utc).date()
+    daily = receiver["daily"]
+    assert [bucket["day"] for bucket in daily] == [today - timedelta(days=2), today - timedelta(days=1), today]
+    assert [bucket["received"] for bucket in daily] == [0, 0, 3]
+    assert daily[0]["spam_rate"] == 0.0
+    assert daily[2]["spam_rate"] == pytest.approx(2 / 3)
+
+
+def test_non_utc_timestamps_count_on_their_utc_day():
+    async def scenario():
+        engine, factory = await session_factory()
+        eastern = timezone(timedelta(hours=-5))
+        rows = [
+            # 23:30 local on 1 March is 04:30 UTC on 2 March
+            {**email(1, 2), "created_at": datetime(2026, 3, 1, 23, 30, tzinfo=eastern)},
+            {**email(1, 2), "created_at": datetime(2026, 3, 1, 18, 59, tzinfo=eastern)},
+            {**email(1, 2), "created_at": datetime(2026, 3, 2, 0, 0, tzinfo=timezone.utc)},
+        ]
+        async with factory() as db:
+            await record_emails(db, rows)
+            await db.commit()
+            buckets = (await db.execute(
+                select(UserEmailDaily.day, UserEmailDaily.received).where(UserEmailDaily.user_id == 2)
+            )).all()
+        await engine.dispose()
+        return dict(buckets)
+
+    assert asyncio.run(scenario()) == {date(2026, 3, 1): 1, date(2026, 3, 2): 2}
+
+
+def _load_migration():
+    spec = importlib.util.spec_from_file_location("add_mailbox_stats", MIGRATION)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_migration_backfills_from_existing_emails():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine, tables=[User.__table__, Email.__table__])
+    with engine.begin() as connection:
+        connection.execute(User.__table__.insert(), [{"id": 1, "email": "a@example.com"}, {"id": 2, "email": "b@example.com"}])
+        connection.execute(Email.__table__.insert(), [
+            {**email(1, 2), "created_at": datetime(2026, 3, 1, 23, 59, tzinfo=timezone.utc)},
+            {**email(1, 2, is_spam=True), "created_at": datetime(2026, 3, 2, 0, 0, tzinfo=timezone.utc)},
+            {**email(2, 1), "created_at": datetime(2026, 3, 2, 8, 0, tzinfo=timezone.utc)},
+        ])
+        with Operations.context(MigrationContext.configure(connection)):
+            _load_migration().upgrade()
+
+    with engine.connect() as connection:
+        totals = {row.user_id: (row.sent, row.received, row.spam_received)
+                  for row in connection.execute(select(UserEmailStats.__table__))}
+        daily = {(row.user_id, row.day): (row.sent, row.received, row.spam_received)
+                 for row in connection.execute(select(UserEmailDaily.__table__))}
+    assert totals == {1: (2, 1, 0), 2: (1, 2, 1)}
+    assert daily == {
+        (1, date(2026, 3, 1)): (1, 0, 0),
+        (1, date(2026, 3, 2)): (1, 1, 0),
+        (2, date(2026, 3, 1)): (0, 1, 0),
+        (2, date(2026, 3, 2)): (1, 1, 1),
+    }
@@ -0,0 +1,42 @@
+import asyncio
+
+from backend.ml import inference_engine
+from backend.ml.executor import run_inference
+from backend.ml.inference_engine import InferenceEngine
+from backend.services.metrics import start_request_timings, timed
+
+
+def fake_predict(model_tuple, texts):
+    with timed("tokenize"):
+        pass
+    with timed("infer"):
+        pass
+    return [(False, 0.9) for _ in texts]
+
+
+def test_run_inference_reports_to_the_callers_timings():
+    async def scenario():
+        timings = start_request_timings()
+        await run_inference(fake_predict, None, ["a", "b"])
+        return timings
+
+    assert set(asyncio.run(scenario())) == {"tokenize", "infer"}
+
+
+def test_batched_stages_reach_every_request(monkeypatch):
+    monkeypatch.setattr(inference_engine, "predict_spam_batch", fake_predict)
+
+    async def request(engine, text):
+        timings = start_request_timings()
+        await engine.predict(text)
+        return timings
+
+    async def scenario():
+        engine = InferenceEngine(None, max_batch_size=2, max_wait_ms=50, long_documents=False)
+        # Each gathered coroutine runs as its own task, i.e. its own request context
+        results = await asyncio.gather(request(engine, "a"), request(engine, "b"))
+        await engine.close()
+        return results
+
+    for timings in asyncio.run(scenario()):
+        assert set(timings) == {"tokenize", "infer"}
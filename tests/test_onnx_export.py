@@ -0,0 +1,28 @@
+import pytest
+import torch
+from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+from backend.ml.backends import OnnxSequenceClassifier, export_onnx
+from scripts.benchmark import write_tiny_model
+
+pytest.importorskip("onnx")
+pytest.importorskip("onnxruntime")
+
+
+def test_exported_graph_matches_torch(tmp_path):
+    model_path = write_tiny_model(str(tmp_path / "model"), seed=5)
+    onnx_path = export_onnx(model_path, str(tmp_path / "model.onnx"))
+
+    tokenizer = AutoTokenizer.from_pretrained(model_path)
+    # Padded batch of different lengths, so the attention mask matters
+    inputs = tokenizer(
+        ["free money", "hello meeting tomorrow about the free offer and more", "win"],
+        padding=True,
+        return_tensors="pt"
+    )
+    reference = AutoModelForSequenceClassification.from_pretrained(model_path).eval()
+    with torch.no_grad():
+        expected = reference(**inputs).logits
+
+    actual = OnnxSequenceClassifier(onnx_path)(**inputs).logits
+    torch.testing.assert_close(actual, expected, atol=1e-4, rtol=1e-4)
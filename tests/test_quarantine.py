@@ -0,0 +1,64 @@
+import os
+import sqlite3
+
+import pytest
+
+from backend.services import quarantine
+from backend.services.quarantine import QuarantineStore
+
+
+def _put(store, recipient, subject="hi"):
+    return store.put({"sender": "s@example.com", "recipient": recipient, "subject": subject}, b"body")
+
+
+def test_search_finds_every_recipient_address(tmp_path):
+    store = QuarantineStore(str(tmp_path))
+    shared = _put(store, "alice@example.com, Bob <Bob@Example.com>")
+    own = _put(store, "bob@example.com")
+    _put(store, "carol@example.com")
+
+    assert [e["id"] for e in store.search(recipient="bob@example.com")] == [own, shared]
+    assert [e["id"] for e in store.search(recipient="alice@example.com")] == [shared]
+    assert store.search(recipient="dave@example.com") == []
+    store.close()
+
+
+def test_existing_index_is_backfilled(tmp_path):
+    store = QuarantineStore(str(tmp_path))
+    message_id = _put(store, "Alice <alice@example.com>, bob@example.com")
+    store.close()
+    # A store written before quarantine_recipients existed
+    db = sqlite3.connect(os.path.join(tmp_path, "index.db"))
+    db.execute("DROP TABLE quarantine_recipients")
+    db.execute("PRAGMA user_version = 0")
+    db.commit()
+    db.close()
+
+    store = QuarantineStore(str(tmp_path))
+    assert [e["id"] for e in store.search(recipient="alice@example.com")] == [message_id]
+    store.close()
+
+
+def test_compact_keeps_segment_until_commit(tmp_path, monkeypatch):
+    monkeypatch.setattr(quarantine, "QUARANTINE_SEGMENT_BYTES", 1)
+    store = QuarantineStore(str(tmp_path))
+    released = _put(store, "a@example.com")
+    held = _put(store, "a@example.com")
+    store.mark_released(released)
+    assert store._segments() == [1, 2]
+
+    def fail(segment):
+        raise sqlite3.OperationalError("disk I/O error")
+
+    monkeypatch.setattr(store, "_forget_segment", fail)
+    with pytest.raises(sqlite3.OperationalError):
+        store.compact(ratio=0.5)
+    assert os.path.exists(store._segment_path(1))
+    assert store.get(released)["message"] == b"body"
+
+    monkeypatch.undo()
+    assert store.compact(ratio=0.5) == 1
+    assert not os.path.exists(store._segment_path(1))
+    assert store.get(held)["message"] == b"body"
+    assert [e["id"] for e in store.search(recipient="a@example.com", include_released=True)] == [held]
+    store.close()
@@ -0,0 +1,135 @@
+import asyncio
+import smtplib
+from email.message import EmailMessage
+
+import pytest
+
+from backend.services.delivery import DeliveryQueue, DeliveryService
+from backend.services import smtp_server
+from backend.services.smtp_server import ClassifyingSMTPServer
+
+
+class FakeRuntime:
+    ready = True
+
+    async def classify(self, processed_content):
+        if "lottery" in processed_content.lower():
+            return True, 0.9
+        return False, 0.8
+
+
+@pytest.fixture
+def handler(tmp_path, monkeypatch):
+    monkeypatch.setenv("SPAM_FOLDER", str(tmp_path / "spam"))
+    monkeypatch.setenv("LOG_FOLDER", str(tmp_path / "log"))
+    from backend.services.sendmail_integration import EmailHandler
+
+    queue = DeliveryQueue(str(tmp_path / "delivery.db"))
+    email_handler = EmailHandler(DeliveryService(queue=queue))
+    yield email_handler
+    email_handler.close()
+    queue.close()
+
+
+def _message(subject: str, body: str) -> bytes:
+    message = EmailMessage()
+    message["From"] = "Alice <alice@example.com>"
+    message["To"] = "bob@example.com"
+    message["Subject"] = subject
+    message["X-Trace"] = "kept"
+    message.set_content(body + "\n.leading dot line\n")
+    message.add_attachment(b"\x00\x01binary" * 100, maintype="application", subtype="octet-stream", filename="a.bin")
+    # smtplib sends CRLF line endings
+    return message.as_bytes().replace(b"\n", b"\r\n")
+
+
+def _send(port: int, message: bytes, recipients):
+    with smtplib.SMTP("127.0.0.1", port) as client:
+        client.ehlo()
+        return client.sendmail("bounce@example.com", recipients, message)
+
+
+def test_ham_is_queued_and_spam_quarantined_byte_for_byte(handler):
+    async def scenario():
+        server = ClassifyingSMTPServer(FakeRuntime(), handler, host="127.0.0.1", port=0)
+        await server.start()
+        loop = asyncio.get_running_loop()
+        try:
+            ham = _message("Minutes", "Notes from the meeting")
+            await loop.run_in_executor(None, _send, server.port, ham, ["bob@example.com", "carol@example.com"])
+            spam = _message("Winner", "You won the lottery")
+            await loop.run_in_executor(None, _send, server.port, spam, ["bob@example.com"])
+        finally:
+            await server.close()
+        return ham, spam
+
+    ham, spam = asyncio.run(scenario())
+
+    (message_id, sender, recipients, queued, _), = handler.delivery.queue.claim(10)
+    assert sender == "bounce@example.com"
+    assert recipients == ["bob@example.com", "carol@example.com"]
+    assert queued == ham
+
+    entries = handler.quarantine.search(include_released=True)
+    assert len(entries) == 1
+    stored = handler.quarantine.get(entries[0]["id"])["message"]
+    assert stored == spam
+    assert b"X-Trace: kept" in stored and b'filename="a.bin"' in stored
+
+
+def test_workers_share_the_listening_port(handler):
+    async def scenario():
+        first = ClassifyingSMTPServer(FakeRuntime(), handler, host="127.0.0.1", port=0)
+        await first.start()
+        second = ClassifyingSMTPServer(FakeRuntime(), handler, host="127.0.0.1", port=first.port)
+        try:
+            await second.start()
+            assert second.port == first.port
+        finally:
+            await second.close()
+            await first.close()
+
+    asyncio.run(scenario())
+
+
+def test_missing_spool_directory_is_created(handler, tmp_path, monkeypatch):
+    spool_dir = tmp_path / "spool" / "smtp"
+    monkeypatch.setattr(smtp_server, "SMTP_SPOOL_DIR", str(spool_dir))
+
+    async def scenario():
+        server = ClassifyingSMTPServer(FakeRuntime(), handler, host="127.0.0.1", port=0)
+        await server.start()
+        try:
+            message = _message("Minutes", "Notes from the meeting")
+            await asyncio.get_running_loop().run_in_executor(None, _send, server.port, message, ["bob@example.com"])
+        finally:
+            await server.close()
+
+    asyncio.run(scenario())
+    assert spool_dir.is_dir()
+    assert len(handler.delivery.queue.claim(10)) == 1
+
+
+def test_unusable_spool_answers_451_and_keeps_the_session(handler, tmp_path, monkeypatch):
+    # A regular file where the spool directory should be
+    blocker = tmp_path / "not-a-directory"
+    blocker.write_text("")
+    monkeypatch.setattr(smtp_server, "SMTP_SPOOL_DIR", str(blocker))
+
+    def send_and_noop(port):
+        with smtplib.SMTP("127.0.0.1", port) as client:
+            client.ehlo()
+            with pytest.raises(smtplib.SMTPDataError) as error:
+                client.sendmail("bounce@example.com", ["bob@example.com"], _message("Minutes", "Notes"))
+            return error.value.smtp_code, client.noop()[0]
+
+    async def scenario():
+        server = ClassifyingSMTPServer(FakeRuntime(), handler, host="127.0.0.1", port=0)
+        await server.start()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(None, send_and_noop, server.port)
+        finally:
+            await server.close()
+
+    assert asyncio.run(scenario()) == (451, 250)
+    assert handler.delivery.queue.claim(10) == []
@@ -0,0 +1,118 @@
+import asyncio
+from time import monotonic
+
+import httpx
+from fastapi import FastAPI, Request
+from slowapi import _rate_limit_exceeded_handler
+from slowapi.errors import RateLimitExceeded
+from slowapi.util import get_remote_address
+
+from backend.services import state_backend
+from backend.services.state_backend import LimiterStorage, RedisStateBackend, StateLimiter
+
+
+class StandInRedis:
+    """
+    Local RESP server with the handful of commands the backend uses. It runs
+    on the test's event loop, so a client blocking that loop never gets a
+    reply.
+    """
+
+    def __init__(self):
+        self.data = {}
+        self.server = None
+        self.port = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    def _live(self, key):
+        entry = self.data.get(key)
+        if entry is not None and entry[1] <= monotonic():
+            del self.data[key]
+            return None
+        return entry
+
+    def _execute(self, command, args):
+        if command == "PING":
+            return b"+PONG\r\n"
+        if command == "SET":
+            key, value, options = args[0], args[1], [a.upper() for a in args[2:]]
+            if b"NX" in options and self._live(key):
+                return b"$-1\r\n"
+            expires = monotonic() + int(options[options.index(b"PX") + 1]) / 1000
+            self.data[key] = [int(value), expires]
+            return b"+OK\r\n"
+        if command == "INCRBY":
+            entry = self._live(args[0]) or self.data.setdefault(args[0], [0, float("inf")])
+            entry[0] += int(args[1])
+            return b":%d\r\n" % entry[0]
+        if command == "GET":
+            entry = self._live(args[0])
+            return b"$-1\r\n" if entry is None else b"$%d\r\n%d\r\n" % (len(str(entry[0])), entry[0])
+        if command == "PTTL":
+            entry = self._live(args[0])
+            return b":-2\r\n" if entry is None else b":%d\r\n" % int((entry[1] - monotonic()) * 1000)
+        if command == "DEL":
+            return b":%d\r\n" % sum(self.data.pop(key, None) is not None for key in args)
+        return b"-ERR unknown command\r\n"
+
+    async def _handle(self, reader, writer):
+        while True:
+            header = await reader.readline()
+            if not header:
+                break
+            parts = []
+            for _ in range(int(header[1:])):
+                length = int((await reader.readline())[1:])
+                parts.append((await reader.readexactly(length + 2))[:-2])
+            writer.write(self._execute(parts[0].decode().upper(), parts[1:]))
+            await writer.drain()
+        writer.close()
+
+
+def test_redis_calls_run_off_the_event_loop():
+    async def scenario():
+        redis = StandInRedis()
+        await redis.start()
+        backend = RedisStateBackend(f"redis://127.0.0.1:{redis.port}/0", timeout=2)
+        counts = await asyncio.gather(*(backend.run(backend.incr, "login:fail:1", 60) for _ in range(5)))
+        assert sorted(counts) == [1, 2, 3, 4, 5]
+        assert await backend.run(backend.get, "login:fail:1") == 5
+        await backend.run(backend.delete, "login:fail:1")
+        assert await backend.run(backend.get, "login:fail:1") == 0
+        assert (await backend.run(backend.stats))["healthy"]
+        await redis.close()
+
+    asyncio.run(scenario())
+
+
+def test_limiter_checks_redis_off_the_event_loop(monkeypatch):
+    async def scenario():
+        redis = StandInRedis()
+        await redis.start()
+        monkeypatch.setattr(
+            state_backend, "_state_backend", RedisStateBackend(f"redis://127.0.0.1:{redis.port}/0", timeout=2)
+        )
+        limiter = StateLimiter(key_func=get_remote_address, storage_uri=f"{LimiterStorage.STORAGE_SCHEME[0]}://")
+        app = FastAPI()
+        app.state.limiter = limiter
+        app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
+
+        @app.get("/limited")
+        @limiter.limit("2/minute")
+        async def limited(request: Request):
+            return {"ok": True}
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            codes = [(await client.get("/limited")).status_code for _ in range(3)]
+        assert codes == [200, 200, 429]
+        await redis.close()
+
+    asyncio.run(scenario())
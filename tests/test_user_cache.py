@@ -0,0 +1,21 @@
+from backend.services.state_backend import SharedMemoryStateBackend
+from backend.services.user_cache import AuthUser, UserCache
+
+
+def test_invalidation_reaches_other_workers(tmp_path):
+    # Two workers' caches over one shared-memory state table
+    state = SharedMemoryStateBackend(str(tmp_path / "state"), slots=64)
+    worker_a = UserCache(state=state)
+    worker_b = UserCache(state=state)
+    user = AuthUser(1, "old@example.com", "key", None, None)
+
+    epoch = worker_b.epoch()
+    worker_b.put(user, epoch)
+    assert worker_b.get("key", worker_b.epoch()) == user
+
+    worker_a.invalidate(user.id)
+    assert worker_b.get("key", worker_b.epoch()) is None
+
+    renamed = user._replace(email="new@example.com")
+    worker_b.put(renamed, worker_b.epoch())
+    assert worker_b.get("key", worker_b.epoch()).email == "new@example.com"